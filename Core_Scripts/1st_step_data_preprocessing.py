@@ -1,41 +1,184 @@
 """
 Traffic Stops Data Preprocessing Script
 Removes columns with all missing values and handles NaN values
+
+Modes:
+  memory    - load the whole CSV at once (default)
+  streaming - profile the CSV in bounded chunks, then clean and write it chunk by chunk
+  parallel  - clean every CSV matched by a directory or glob across CPU cores,
+              writing year=/country= partitions
+  incremental - clean only rows appended since the last run into the partitioned
+                output, updating medians from the cached column statistics
+
+Output formats:
+  parquet - typed columnar file (categoricals, dates, times, booleans), default
+  csv     - plain CSV, used when pyarrow is not installed
 """
 
+import argparse
+import os
 import pandas as pd
 import warnings
 
+from column_profile import *
+from columnar_output import *
+from incremental_preprocessing import clean_incremental
+from parallel_preprocessing import clean_files_parallel, read_csv_chunks, resolve_input_files
+from traffic_schema import SCHEMA, coerce_column, read_dtypes
+
 warnings.filterwarnings('ignore')
 
-# Load data
-file_path = 'traffic_stops - traffic_stops_with_vehicle_number.csv'
-df = pd.read_csv(file_path)
-print(f"Original shape: {df.shape}")
-
-# Remove columns with ALL missing values
-all_missing_cols = df.columns[df.isnull().all()].tolist()
-df_clean = df.drop(columns=all_missing_cols)
-print(f"Removed {len(all_missing_cols)} empty columns")
-print(f"Shape after removing empty columns: {df_clean.shape}")
-
-# Handle NaN values in remaining columns
-print(f"\nHandling missing values...")
-for col in df_clean.columns:
-    if df_clean[col].isnull().any():
-        if df_clean[col].dtype in ['object', 'category']:
-            df_clean[col] = df_clean[col].fillna('Unknown')
-        elif df_clean[col].dtype in ['int64', 'float64']:
-            df_clean[col] = df_clean[col].fillna(df_clean[col].median())
-        elif df_clean[col].dtype == 'bool':
-            df_clean[col] = df_clean[col].fillna(False)
+INPUT_FILE = 'traffic_stops - traffic_stops_with_vehicle_number.csv'
+OUTPUT_FILES = {
+    'csv': 'traffic_stops_cleaned.csv',
+    'parquet': 'traffic_stops_cleaned.parquet'
+}
+PARTITIONED_OUTPUT_DIR = 'traffic_stops_cleaned_partitioned'
+MAX_MEMORY_MB = 512
+
+
+def clean_in_memory(file_path, output_file, output_format='csv'):
+    """Clean the whole file in one DataFrame"""
+    # Load data
+    df = pd.read_csv(file_path, dtype=read_dtypes())
+    print(f"Original shape: {df.shape}")
+
+    # Remove columns with ALL missing values
+    all_missing_cols = df.columns[df.isnull().all()].tolist()
+    df_clean = df.drop(columns=all_missing_cols)
+    print(f"Removed {len(all_missing_cols)} empty columns")
+    print(f"Shape after removing empty columns: {df_clean.shape}")
+
+    # Handle NaN values in remaining columns
+    print(f"\nHandling missing values...")
+    for col in df_clean.columns:
+        if col in SCHEMA:
+            # Declared columns: one vectorized coercion and fill per column
+            column = SCHEMA[col]
+            median = df_clean[col].median() if column.fill == 'median' else None
+            df_clean[col] = coerce_column(df_clean[col], column, median)
+        elif df_clean[col].isnull().any():
+            if df_clean[col].dtype in ['object', 'category']:
+                df_clean[col] = df_clean[col].fillna('Unknown')
+            elif df_clean[col].dtype in ['int64', 'float64']:
+                df_clean[col] = df_clean[col].fillna(df_clean[col].median())
+            elif df_clean[col].dtype == 'bool':
+                df_clean[col] = df_clean[col].fillna(False)
+            else:
+                df_clean[col] = df_clean[col].fillna('Unknown')
+
+    print(f"Missing values remaining: {df_clean.isnull().sum().sum()}")
+
+    # Export cleaned data
+    if output_format == 'parquet':
+        write_parquet(df_clean, output_file)
+    else:
+        df_clean.to_csv(output_file, index=False)
+    print(f"\nCleaned data saved to: {output_file}")
+    print(f"Final shape: {df_clean.shape}")
+
+
+def clean_streaming(file_path, output_file, output_format='csv', max_memory_mb=MAX_MEMORY_MB,
+                    chunk_size=None, max_distinct=DEFAULT_MAX_DISTINCT):
+    """Clean the file in two passes over bounded chunks"""
+    if chunk_size is None:
+        chunk_size = estimate_chunk_rows(file_path, max_memory_mb)
+    print(f"Streaming in chunks of {chunk_size:,} rows (memory budget: {max_memory_mb} MB)")
+
+    # Pass 1: find empty columns and per-column medians
+    profile = new_profile()
+    for chunk in read_csv_chunks(file_path, chunk_size):
+        update_profile(profile, chunk, max_distinct)
+    plan = resolve_cleaning_plan(profile)
+    print(f"Original shape: ({profile['rows']}, {len(profile['columns'])})")
+    print(f"Removed {len(plan['empty_cols'])} empty columns")
+    bucketed = inexact_columns(profile)
+    if bucketed:
+        # Columns with more than max_distinct values: count the values next to the median exactly
+        print(f"Refining medians with another pass for: {', '.join(bucketed)}")
+        plan = refine_medians(profile, plan, read_csv_chunks(file_path, chunk_size))
+
+    # Pass 2: clean and append each chunk to the output
+    print(f"\nHandling missing values...")
+    rows = 0
+    remaining = 0
+    parquet_writer = ParquetChunkWriter(output_file) if output_format == 'parquet' else None
+    for i, chunk in enumerate(read_csv_chunks(file_path, chunk_size)):
+        chunk = clean_chunk(chunk, plan)
+        remaining += int(chunk.isnull().sum().sum())
+        if parquet_writer is not None:
+            parquet_writer.write(chunk)
         else:
-            df_clean[col] = df_clean[col].fillna('Unknown')
+            chunk.to_csv(output_file, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+        rows += len(chunk)
+    if parquet_writer is not None:
+        parquet_writer.close()
+
+    print(f"Missing values remaining: {remaining}")
+    print(f"\nCleaned data saved to: {output_file}")
+    print(f"Final shape: ({rows}, {len(plan['dtypes'])})")
+
+    peak = peak_rss_mb()
+    status = "within" if peak <= max_memory_mb else "over"
+    print(f"Peak RSS: {peak:.1f} MB ({status} the {max_memory_mb} MB budget)")
+
+
+def clean_parallel(input_pattern, output_dir, output_format='parquet', workers=None,
+                   max_distinct=DEFAULT_MAX_DISTINCT):
+    """Clean many files in parallel, partitioned by year and country"""
+    file_paths = resolve_input_files(input_pattern)
+    if not file_paths:
+        print(f"No CSV files found for: {input_pattern}")
+        return
+    print(f"Cleaning {len(file_paths)} files with {workers or os.cpu_count()} workers")
+
+    profile, plan, rows = clean_files_parallel(file_paths, output_dir, output_format, workers, max_distinct)
+    print(f"Original shape: ({profile['rows']}, {len(profile['columns'])})")
+    print(f"Removed {len(plan['empty_cols'])} empty columns")
+    print(f"\nCleaned data saved to: {output_dir}/year=*/country=*/")
+    print(f"Final shape: ({rows}, {len(plan['dtypes'])})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the traffic stops export")
+    parser.add_argument('--mode', choices=['memory', 'streaming', 'parallel', 'incremental'], default='memory')
+    parser.add_argument('--input', default=INPUT_FILE,
+                        help="Input CSV, or a directory/glob of CSVs in parallel/incremental mode")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--output', default=None,
+                        help="Output file (default depends on --format)")
+    parser.add_argument('--max-memory-mb', type=int, default=MAX_MEMORY_MB,
+                        help="Memory budget used to size chunks in streaming mode")
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help="Rows per chunk in streaming mode (overrides --max-memory-mb sizing)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes in parallel mode (default: CPU count)")
+    parser.add_argument('--max-distinct', type=int, default=DEFAULT_MAX_DISTINCT,
+                        help="Distinct values kept per numeric column before medians become approximate")
+    args = parser.parse_args()
+
+    output_format = args.format
+    if output_format == 'parquet' and not pyarrow_available():
+        print("pyarrow is not installed, writing CSV instead of Parquet")
+        output_format = 'csv'
+    output_file = args.output or OUTPUT_FILES[output_format]
+
+    if args.mode == 'incremental':
+        try:
+            clean_incremental(resolve_input_files(args.input), args.output or PARTITIONED_OUTPUT_DIR,
+                              output_format, args.max_distinct)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+    elif args.mode == 'parallel':
+        clean_parallel(args.input, args.output or PARTITIONED_OUTPUT_DIR, output_format,
+                       args.workers, args.max_distinct)
+    elif args.mode == 'streaming':
+        clean_streaming(args.input, output_file, output_format, args.max_memory_mb,
+                        args.chunk_size, args.max_distinct)
+    else:
+        clean_in_memory(args.input, output_file, output_format)
 
-print(f"Missing values remaining: {df_clean.isnull().sum().sum()}")
 
-# Export cleaned data
-output_file = 'traffic_stops_cleaned.csv'
-df_clean.to_csv(output_file, index=False)
-print(f"\nCleaned data saved to: {output_file}")
-print(f"Final shape: {df_clean.shape}")
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,62 @@
 """
 Database Setup and Data Ingestion Script
 Connects to MySQL database, creates schema, and ingests cleaned data
+
+Load modes:
+  executemany - batched INSERT statements (default, works everywhere)
+  load-data   - LOAD DATA LOCAL INFILE from temporary CSV chunks (MySQL and TiDB)
+
+Ingestion is resumable: every committed batch records its row offset in
+ingest_checkpoints, keyed by a fingerprint of the cleaned input, and rows are
+upserted on the natural key (vehicle_number, stop_date, stop_time, violation),
+so a rerun after a failure continues where it stopped without duplicates.
+
+Reload modes:
+  swap     - load into a staging table, build indexes, check row counts, then
+             atomically RENAME it over the live table (default, no downtime)
+  in-place - drop and recreate the live table, then load into it
+
+Either way the rollup tables behind the dashboard headline metrics
+(traffic_stops_rollup, traffic_stops_vehicle_rollup) are rebuilt from the
+loaded table; the dashboard keeps them current as it inserts new stops.
+
+On MySQL/TiDB the table is RANGE-partitioned by stop year, one partition per
+year in the input plus p_future for later stops. Hour, year and month queries
+read the stored generated columns stop_hour, stop_year, stop_month and
+stop_datetime (virtual in DuckDB) and their indexes.
+
+Schema layouts (--schema, default from POLICE_DB_SCHEMA):
+  wide    - one traffic_stops table with the text columns inline (default)
+  compact - country, race, violation, search type, outcome and duration values
+            are stored once in small dimension tables (traffic_stops_dim_*) and
+            the fact table traffic_stops_facts holds their TINYINT/SMALLINT
+            keys; traffic_stops becomes a view with the wide columns, so every
+            query keeps its shape. Dimension keys are append-only and shared by
+            the live and staging fact tables
+
+Backends (--backend, default from POLICE_DB_BACKEND):
+  mysql          - the remote MySQL/TiDB database in DB_CONFIG
+  duckdb, sqlite - a local embedded database file (POLICE_DB_PATH), rebuilt
+                   in a single transaction for offline development
 """
 
-import mysql.connector
 import pandas as pd
-from mysql.connector import Error
+import argparse
+import hashlib
+import os
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from sql_queries import *
+from adaptive_batcher import AdaptiveBatcher, iter_prefetched_batches
+from db_backend import (BACKENDS, DATABASE_ERRORS, EMBEDDED_BACKENDS, SCHEMA_LAYOUTS, connect_backend,
+                        get_backend_name, get_schema_layout, is_embedded)
+from index_migrations import add_indexes, mark_migrations_applied
+from query_metrics import INGEST_METRICS_FILE, MetricsStore
+from columnar_output import partition_format, pyarrow_available, read_partitioned, read_typed_table
+from traffic_schema import (NATURAL_KEY, count_natural_keys, dimension_values, encode_dimensions, load_file_frame,
+                            prepare_db_columns, read_dtypes, stop_years)
 
 # Database configuration
 DB_CONFIG = {
@@ -21,60 +70,475 @@ DB_CONFIG = {
 }
 
 TABLE_NAME = 'traffic_stops'
+STAGING_TABLE = f'{TABLE_NAME}_staging'
+OLD_TABLE = f'{TABLE_NAME}_old'
+CHECKPOINT_TABLE = 'ingest_checkpoints'
 CSV_FILE = 'traffic_stops_cleaned.csv'
+PARQUET_FILE = 'traffic_stops_cleaned.parquet'
+PARTITIONED_DIR = 'traffic_stops_cleaned_partitioned'
+LOAD_CHUNK_ROWS = 100000
+
+# Stage and batch timings of this run, appended to --metrics-file for the dashboard's Performance page
+METRICS = MetricsStore(max_samples=None)
+
+def output_mtime(path):
+    """Last modification of an output file, or of the newest file in an output directory"""
+    if os.path.isdir(path):
+        return max((os.path.getmtime(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names),
+                   default=0.0)
+    return os.path.getmtime(path)
+
+def readable_output(path):
+    """Whether an output of step 1 can be read here, Parquet needing pyarrow"""
+    if not os.path.exists(path):
+        return False
+    if path == PARQUET_FILE or (os.path.isdir(path) and partition_format(path) == 'parquet'):
+        return pyarrow_available()
+    return True
+
+def get_cleaned_file():
+    """The newest output of step 1: single Parquet or CSV file, or the partitioned directory
+
+    Each step 1 mode writes a different output, so an older one left next to it is stale
+    """
+    outputs = [path for path in (PARQUET_FILE, PARTITIONED_DIR, CSV_FILE) if readable_output(path)]
+    return max(outputs, key=output_mtime) if outputs else CSV_FILE
+
+@METRICS.timed()
+def load_cleaned_data(file_path):
+    """Load cleaned data, reading Parquet with its stored types"""
+    if os.path.isdir(file_path):
+        return read_partitioned(file_path)
+    if file_path.endswith('.parquet'):
+        return read_typed_table(file_path)
+    return pd.read_csv(file_path, dtype=read_dtypes())
+
+def source_fingerprint(file_path):
+    """Identify a cleaned input by path, size and modification time of its files"""
+    if os.path.isdir(file_path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(file_path) for name in names)
+    else:
+        paths = [file_path]
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
 
-def create_connection():
+def create_connection(allow_local_infile=False):
     """Create database connection"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
+        connection = connect_backend('mysql', {**DB_CONFIG, 'allow_local_infile': allow_local_infile})
         if connection.is_connected():
             print(f"✓ Connected to MySQL database")
             db_info = connection.get_server_info()
             print(f"  Server version: {db_info}")
             return connection
-    except Error as e:
+    except DATABASE_ERRORS as e:
         print(f"✗ Error connecting to MySQL: {e}")
         sys.exit(1)
 
-def create_table(connection):
-    """Create traffic_stops table with schema"""
+def create_embedded_connection(backend):
+    """Open the local embedded database"""
+    try:
+        connection = connect_backend(backend)
+        print(f"✓ Opened embedded {backend} database")
+        print(f"  Engine: {connection.get_server_info()}")
+        return connection
+    except (ImportError, *DATABASE_ERRORS) as e:
+        print(f"✗ Error opening embedded database: {e}")
+        sys.exit(1)
+
+@METRICS.timed()
+def create_table(connection, table_name=TABLE_NAME, include_indexes=True, compact=False, years=()):
+    """Create traffic_stops table with schema, with a partition per stop year in years
+
+    In the compact layout table_name becomes a view over a new fact table
+    """
     cursor = connection.cursor()
-    cursor.execute(get_drop_table_query(TABLE_NAME))
-    print(f"✓ Dropped existing table (if any): {TABLE_NAME}")
+    drop_relation(connection, cursor, table_name)
+    print(f"✓ Dropped existing table (if any): {table_name}")
 
-    cursor.execute(get_create_table_query(TABLE_NAME))
-    print(f"✓ Created table: {TABLE_NAME}")
+    if compact:
+        facts_table = get_facts_table_name(table_name)
+        create_dimension_tables(cursor)
+        cursor.execute(get_drop_table_query(facts_table))
+        cursor.execute(get_create_compact_table_query(facts_table, include_indexes, years))
+        cursor.execute(get_create_compact_view_query(table_name, facts_table, TABLE_NAME))
+        print(f"✓ Created table: {facts_table} and view: {table_name}")
+    else:
+        cursor.execute(get_drop_table_query(get_facts_table_name(table_name)))
+        cursor.execute(get_create_table_query(table_name, include_indexes, years))
+        print(f"✓ Created table: {table_name}")
     cursor.close()
 
-def insert_data(connection, df):
-    """Insert data from DataFrame into database"""
+def table_type(connection, table_name):
+    """'BASE TABLE' or 'VIEW', or None when nothing is named table_name"""
     cursor = connection.cursor()
+    if is_embedded(connection):
+        cursor.execute(get_embedded_table_type_query(table_name, connection.dialect))
+    else:
+        cursor.execute(get_table_type_query(table_name))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
 
-    # Convert DataFrame to list of tuples
-    data_tuples = [
-        (row['stop_date'], row['stop_time'], row['country_name'], row['driver_gender'],
-         int(row['driver_age_raw']), int(row['driver_age']), row['driver_race'],
-         row['violation_raw'], row['violation'], bool(row['search_conducted']),
-         row['search_type'], row['stop_outcome'], bool(row['is_arrested']),
-         row['stop_duration'], bool(row['drugs_related_stop']), row['vehicle_number'])
-        for _, row in df.iterrows()
-    ]
+def drop_relation(connection, cursor, table_name):
+    """Drop table_name whether it is a table or a view, as switching layouts turns one into the other"""
+    if table_type(connection, table_name) == 'VIEW':
+        cursor.execute(get_drop_view_query(table_name))
+    else:
+        cursor.execute(get_drop_table_query(table_name))
 
-    # Insert in batches
-    batch_size = 1000
-    total_rows = len(data_tuples)
-    print(f"\nInserting {total_rows:,} rows in batches of {batch_size}...")
+def create_dimension_tables(cursor):
+    """Create the dimension tables of the compact layout if they do not exist yet"""
+    for column_name in DIMENSION_KEY_TYPES:
+        cursor.execute(get_create_dimension_table_query(TABLE_NAME, column_name))
 
-    for i in range(0, total_rows, batch_size):
-        batch = data_tuples[i:i + batch_size]
-        cursor.executemany(get_insert_query(TABLE_NAME), batch)
-        connection.commit()
-        print(f"  Inserted {i+len(batch):,}/{total_rows:,} rows ({(i+len(batch))/total_rows*100:.1f}%)")
+@METRICS.timed()
+def sync_dimensions(cursor, df):
+    """Give every dimension value in df a key, keeping existing keys; returns {column: {value: key}}
+
+    Runs in the caller's transaction, the caller commits
+    """
+    create_dimension_tables(cursor)
+    mappings = {}
+    added = 0
+    for column_name in DIMENSION_KEY_TYPES:
+        cursor.execute(get_dimension_rows_query(TABLE_NAME, column_name))
+        # Values are matched like UNIQUE (value) under utf8mb4_bin: exact, but trailing spaces ignored
+        keys = {value.rstrip(' '): key for key, value in cursor.fetchall()}
+        next_key = max(keys.values(), default=0) + 1
+        mapping = {}
+        new_rows = []
+        for value in dimension_values(df, column_name):
+            padded = value.rstrip(' ')
+            if padded not in keys:
+                keys[padded] = next_key
+                new_rows.append((next_key, value))
+                next_key += 1
+            mapping[value] = keys[padded]
+        if new_rows:
+            cursor.executemany(get_insert_dimension_query(TABLE_NAME, column_name), new_rows)
+            added += len(new_rows)
+        mappings[column_name] = mapping
+    print(f"✓ Synced {len(mappings)} dimension tables ({added} new values)")
+    return mappings
+
+def prepare_load(cursor, df, compact=False):
+    """(frame to load, its insert columns or None for all, rows the table should hold afterwards)
+
+    In the compact layout the dimensions are synced in the caller's transaction
+    and the frame carries their keys
+    """
+    # Upserts collapse repeated natural keys, counted on the values before they become keys
+    expected_rows = count_natural_keys(df)
+    if not compact:
+        return df, None, expected_rows
+    return encode_dimensions(df, sync_dimensions(cursor, df)), COMPACT_INSERT_COLUMNS, expected_rows
+
+def create_checkpoint_table(connection):
+    """Create the checkpoint table if it does not exist yet"""
+    cursor = connection.cursor()
+    cursor.execute(get_create_checkpoint_table_query(CHECKPOINT_TABLE))
+    cursor.close()
+
+def load_checkpoints(connection, run_id):
+    """Checkpoints of a previous attempt of this run: {slice_no: (target_table, loaders, committed_rows)}"""
+    cursor = connection.cursor()
+    cursor.execute(get_checkpoints_query(CHECKPOINT_TABLE, run_id))
+    rows = cursor.fetchall()
+    cursor.close()
+    return {slice_no: (target, loaders, committed) for slice_no, target, loaders, committed, _ in rows}
+
+def clear_checkpoints(connection, run_id):
+    """Forget the checkpoints of a run once it is complete"""
+    cursor = connection.cursor()
+    cursor.execute(get_clear_checkpoints_query(CHECKPOINT_TABLE, run_id))
+    connection.commit()
+    cursor.close()
+
+def save_checkpoint(cursor, checkpoint, committed_rows, total_rows):
+    """Record progress in the open transaction so it commits together with the batch"""
+    if checkpoint is None:
+        return
+    run_id, slice_no, table_name, loaders = checkpoint
+    cursor.execute(get_save_checkpoint_query(CHECKPOINT_TABLE),
+                   (run_id, slice_no, table_name, loaders, committed_rows, total_rows))
+
+def get_max_allowed_packet(connection):
+    """Server packet limit in bytes, or None if it cannot be read"""
+    try:
+        cursor = connection.cursor()
+        cursor.execute(get_max_allowed_packet_query())
+        value = cursor.fetchone()[0]
+        cursor.close()
+        return int(value)
+    except (*DATABASE_ERRORS, TypeError, ValueError):
+        return None
+
+def insert_data(connection, df, batch_size=1000, table_name=TABLE_NAME, label="",
+                checkpoint=None, start_row=0, commit_every=1, target_seconds=1.0, columns=None):
+    """Insert data from DataFrame into database
+
+    Batches start at batch_size rows and adapt to the packet limit and the
+    measured latency; the next batch is built while the current one is sent,
+    and a commit (with its checkpoint) happens every commit_every batches.
+    checkpoint is (run_id, slice_no, table_name, loaders); rows before
+    start_row were committed by an earlier attempt and are skipped.
+    columns: insert columns of df, COMPACT_INSERT_COLUMNS for a fact table
+    """
+    cursor = connection.cursor()
+    batcher = AdaptiveBatcher(batch_size, get_max_allowed_packet(connection), target_seconds)
+
+    total_rows = len(df)
+    if start_row:
+        print(f"\n{label}Resuming after {start_row:,} committed rows")
+    print(f"\n{label}Inserting {total_rows - start_row:,} rows, first batch {batch_size}, "
+          f"commit every {commit_every} batch(es)...")
+    start_time = time.perf_counter()
+
+    prepared = prepare_db_columns(df, columns)
+    pending = 0
+    for i, batch in iter_prefetched_batches(prepared, start_row, total_rows, batcher):
+        done = i + len(batch)
+        batch_start = time.perf_counter()
+        cursor.executemany(get_upsert_query(table_name, columns), batch)
+        pending += 1
+        if pending >= commit_every or done == total_rows:
+            save_checkpoint(cursor, checkpoint, done, total_rows)
+            connection.commit()
+            pending = 0
+        batch_seconds = time.perf_counter() - batch_start
+        batcher.record(len(batch), batch_seconds)
+        METRICS.record('get_upsert_query', batch_seconds, rows=len(batch))
+        print(f"  {label}Inserted {done:,}/{total_rows:,} rows ({done/total_rows*100:.1f}%), "
+              f"next batch {batcher.next_size():,}")
+
+    cursor.close()
+    elapsed = time.perf_counter() - start_time
+    sent_rows = total_rows - start_row
+    print(f"✓ {label}Successfully inserted {sent_rows:,} rows")
+    print(f"  {label}Batching: {batcher.summary()}")
+    print(f"  {label}executemany throughput: {sent_rows / max(elapsed, 1e-9):,.0f} rows/s ({elapsed:.1f} s)")
+
+def load_data_infile(connection, df, chunk_rows=LOAD_CHUNK_ROWS, table_name=TABLE_NAME, label="",
+                     checkpoint=None, start_row=0, columns=None):
+    """Bulk-load data with LOAD DATA LOCAL INFILE, one temporary CSV chunk at a time"""
+    cursor = connection.cursor()
+
+    load_df = load_file_frame(df.iloc[start_row:], columns)
+    total_rows = len(df)
+    if start_row:
+        print(f"\n{label}Resuming after {start_row:,} committed rows")
+    print(f"\n{label}Bulk-loading {len(load_df):,} rows in chunks of {chunk_rows:,}...")
+    start_time = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_file = os.path.join(tmp_dir, 'traffic_stops_load.csv')
+        for i in range(0, len(load_df), chunk_rows):
+            chunk = load_df.iloc[i:i + chunk_rows]
+            done = start_row + i + len(chunk)
+            chunk.to_csv(tmp_file, index=False, header=False, na_rep='NULL')
+            with METRICS.measure('get_load_data_query', kind='query', rows=len(chunk),
+                                 size_bytes=os.path.getsize(tmp_file)):
+                cursor.execute(get_load_data_query(table_name, tmp_file, columns))
+                save_checkpoint(cursor, checkpoint, done, total_rows)
+                connection.commit()
+            print(f"  {label}Loaded {done:,}/{total_rows:,} rows ({done/total_rows*100:.1f}%)")
+
+    cursor.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"✓ {label}Successfully loaded {len(load_df):,} rows")
+    print(f"  {label}load-data throughput: {len(load_df) / max(elapsed, 1e-9):,.0f} rows/s ({elapsed:.1f} s)")
+
+def split_slices(df, loaders):
+    """Split rows into at most `loaders` disjoint, contiguous slices"""
+    slice_rows = max(1, -(-len(df) // loaders))
+    return [df.iloc[i:i + slice_rows] for i in range(0, len(df), slice_rows)]
+
+def load_slice(connection, df, load_mode, table_name, label="", checkpoint=None, start_row=0, batching=None,
+               columns=None):
+    """Load one slice of rows, resuming from its checkpoint
+
+    batching holds insert_data options (batch_size, commit_every, target_seconds)
+    """
+    if load_mode == 'load-data':
+        load_data_infile(connection, df, table_name=table_name, label=label,
+                         checkpoint=checkpoint, start_row=start_row, columns=columns)
+    else:
+        insert_data(connection, df, table_name=table_name, label=label,
+                    checkpoint=checkpoint, start_row=start_row, columns=columns, **(batching or {}))
+
+def load_slice_on_new_connection(df, load_mode, table_name, label, checkpoint, start_row, batching=None,
+                                 columns=None):
+    """Load one slice over its own connection"""
+    connection = create_connection(allow_local_infile=(load_mode == 'load-data'))
+    try:
+        load_slice(connection, df, load_mode, table_name, label, checkpoint, start_row, batching, columns)
+    finally:
+        connection.close()
+
+@METRICS.timed()
+def load_all(connection, df, load_mode, table_name, loaders, run_id, checkpoints, batching=None, columns=None):
+    """Load every slice, concurrently when there are several loaders"""
+    slices = split_slices(df, loaders)
+    start_time = time.perf_counter()
+    jobs = []
+    for n, part in enumerate(slices):
+        committed = checkpoints.get(n, (None, None, 0))[2]
+        if committed >= len(part):
+            print(f"  Slice {n + 1} already complete, skipping")
+            continue
+        jobs.append((part, f"[loader {n + 1}] " if len(slices) > 1 else "", (run_id, n, table_name, loaders), committed))
+
+    if len(jobs) == 1 and len(slices) == 1:
+        part, label, checkpoint, committed = jobs[0]
+        load_slice(connection, part, load_mode, table_name, label, checkpoint, committed, batching, columns)
+    elif jobs:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [
+                pool.submit(load_slice_on_new_connection, part, load_mode, table_name, label, checkpoint,
+                            committed, batching, columns)
+                for part, label, checkpoint, committed in jobs
+            ]
+            for future in futures:
+                future.result()
+    elapsed = time.perf_counter() - start_time
+    print(f"✓ {len(slices)} slice(s) loaded: {len(df) / max(elapsed, 1e-9):,.0f} rows/s overall ({elapsed:.1f} s)")
+
+@METRICS.timed()
+def build_indexes(connection, table_name, indexes=TABLE_INDEXES):
+    """Build secondary indexes once all rows are loaded"""
+    start_time = time.perf_counter()
+    # A resumed run may already have built some of them
+    add_indexes(connection, table_name, indexes)
+    print(f"✓ Built indexes on {table_name} ({time.perf_counter() - start_time:.1f} s)")
+
+@METRICS.timed()
+def check_row_count(connection, table_name, expected_rows):
+    """Make sure a loaded table holds exactly the expected number of rows"""
+    cursor = connection.cursor()
+    cursor.execute(get_count_query(table_name))
+    count = cursor.fetchone()[0]
+    cursor.close()
+    if count != expected_rows:
+        raise RuntimeError(f"{table_name} has {count:,} rows, expected {expected_rows:,}")
+    print(f"✓ Row count check passed: {count:,} rows in {table_name}")
+
+def table_exists(connection, table_name):
+    """Check whether a table exists in the current database"""
+    cursor = connection.cursor()
+    cursor.execute(get_table_exists_query(table_name))
+    exists = cursor.fetchone()[0] > 0
+    cursor.close()
+    return exists
+
+def create_rollups(cursor, table_name):
+    """Rebuild the rollup tables of a loaded table"""
+    start_time = time.perf_counter()
+    for rollup_table, create_query, populate_query in [
+        (get_rollup_table_name(table_name), get_create_rollup_table_query, get_populate_rollup_query),
+        (get_vehicle_rollup_table_name(table_name), get_create_vehicle_rollup_table_query,
+         get_populate_vehicle_rollup_query),
+    ]:
+        cursor.execute(get_drop_table_query(rollup_table))
+        cursor.execute(create_query(table_name))
+        cursor.execute(populate_query(table_name))
+    print(f"✓ Built rollups of {table_name} ({time.perf_counter() - start_time:.1f} s)")
+
+@METRICS.timed()
+def build_rollups(connection, table_name):
+    """Build the rollup tables of a loaded table and commit them"""
+    cursor = connection.cursor()
+    create_rollups(cursor, table_name)
+    connection.commit()
+    cursor.close()
+
+@METRICS.timed()
+def swap_in_staging(connection, compact=False):
+    """Atomically replace the live table and its rollups with the staging ones
 
+    In the compact layout the fact tables are swapped and the traffic_stops
+    view, which reads the live fact table by name, is kept
+    """
+    main_table = get_facts_table_name if compact else (lambda table_name: table_name)
+    # (live, staging, old) for the table and each rollup, all renamed in one statement
+    tables = [
+        (name(TABLE_NAME), name(STAGING_TABLE), name(OLD_TABLE))
+        for name in (main_table, get_rollup_table_name, get_vehicle_rollup_table_name)
+    ]
+    cursor = connection.cursor()
+    renames = []
+    for live, staging, old in tables:
+        drop_relation(connection, cursor, old)
+        if table_exists(connection, live):
+            renames.append((live, old))
+        renames.append((staging, live))
+    if compact and table_type(connection, TABLE_NAME) == 'BASE TABLE':
+        # Switching from the wide layout: the wide table makes way for the view
+        drop_relation(connection, cursor, OLD_TABLE)
+        renames.append((TABLE_NAME, OLD_TABLE))
+    cursor.execute(get_rename_tables_query(renames))
+    if compact:
+        if not table_exists(connection, TABLE_NAME):
+            cursor.execute(get_create_compact_view_query(TABLE_NAME, get_facts_table_name(TABLE_NAME), TABLE_NAME))
+        cursor.execute(get_drop_view_query(STAGING_TABLE))
+    else:
+        cursor.execute(get_drop_table_query(get_facts_table_name(TABLE_NAME)))
+    for old in {old for _, _, old in tables} | {OLD_TABLE}:
+        drop_relation(connection, cursor, old)
     cursor.close()
-    print(f"✓ Successfully inserted {total_rows:,} rows")
+    print(f"✓ Swapped {STAGING_TABLE} and its rollups in as {TABLE_NAME}")
+
+@METRICS.timed()
+def load_embedded(connection, df, table_name=TABLE_NAME, compact=False):
+    """Rebuild the table in an embedded database in one transaction
+
+    Rows repeating a natural key are collapsed to the last one, as upserts would
+    """
+    frame = load_file_frame(df).drop_duplicates(subset=NATURAL_KEY, keep='last')
+    facts_table = get_facts_table_name(table_name)
+    cursor = connection.cursor()
+    start_time = time.perf_counter()
+    cursor.execute("BEGIN TRANSACTION")
+    try:
+        drop_relation(connection, cursor, table_name)
+        load_table = facts_table if compact else table_name
+        if compact:
+            frame = encode_dimensions(frame, sync_dimensions(cursor, frame))
+        else:
+            cursor.execute(get_drop_table_query(facts_table))
+        queries = get_create_embedded_table_queries(load_table, connection.dialect, include_indexes=False,
+                                                    compact=compact)
+        for query in queries:
+            cursor.execute(query)
+        print(f"✓ Created table: {load_table}")
+        with METRICS.measure('insert_frame', kind='query', rows=len(frame)):
+            cursor.insert_frame(load_table, frame)
+        for query in get_create_embedded_indexes_queries(load_table, compact=compact):
+            cursor.execute(query)
+        if compact:
+            cursor.execute(get_create_compact_view_query(table_name, facts_table, table_name))
+            print(f"✓ Created view: {table_name}")
+        create_rollups(cursor, table_name)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.close()
+    elapsed = time.perf_counter() - start_time
+    print(f"✓ Loaded {len(frame):,} rows, built indexes and rollups: {len(frame) / max(elapsed, 1e-9):,.0f} rows/s ({elapsed:.1f} s)")
 
+def save_metrics(path):
+    """Print the stage timings of this run and append every timing to path"""
+    print(f"\nStage timings:")
+    print(METRICS.summary('stage').to_string(index=False))
+    METRICS.write_jsonl(path)
+    print(f"✓ Appended timings to {path}")
 
+@METRICS.timed()
 def verify_data(connection):
     """Verify inserted data"""
     cursor = connection.cursor()
@@ -102,49 +566,156 @@ def verify_data(connection):
 
     cursor.close()
 
-def main():
-    """Main execution function"""
-    print("="*60)
-    print("DATABASE SETUP AND DATA INGESTION")
-    print("="*60)
-
-    # Step 1: Load CSV data
-    print(f"\nStep 1: Loading CSV data from {CSV_FILE}")
-    try:
-        df = pd.read_csv(CSV_FILE)
-        print(f"✓ Loaded {len(df):,} rows, {len(df.columns)} columns")
-    except Exception as e:
-        print(f"✗ Error loading CSV: {e}")
-        sys.exit(1)
-
+def ingest_mysql(df, cleaned_file, args):
+    """Steps 2-4 against MySQL: connect, create or resume the table, load and swap in"""
     # Step 2: Connect to database
     print(f"\nStep 2: Connecting to database")
-    connection = create_connection()
+    connection = create_connection(allow_local_infile=(args.load_mode == 'load-data'))
+
+    # The live table stays untouched until the staging copy is complete
+    target_table = STAGING_TABLE if args.reload == 'swap' else TABLE_NAME
+    compact = args.schema == 'compact'
+    # Rows go into the fact table behind the view in the compact layout
+    load_table = get_facts_table_name(target_table) if compact else target_table
+    run_id = source_fingerprint(cleaned_file)
+    loaders = args.loaders
 
-    # Step 3: Create table schema
+    # Step 3: Create table schema, unless resuming an interrupted load of the same input
     print(f"\nStep 3: Creating table schema")
     try:
-        create_table(connection)
-    except Error as e:
+        create_checkpoint_table(connection)
+        checkpoints = {} if args.restart else load_checkpoints(connection, run_id)
+        previous = next(iter(checkpoints.values()), None)
+        if previous and previous[0] == load_table and table_exists(connection, load_table):
+            loaders = previous[1]
+            print(f"✓ Resuming previous load into {load_table} ({loaders} loader(s))")
+        else:
+            checkpoints = {}
+            clear_checkpoints(connection, run_id)
+            create_table(connection, target_table, include_indexes=(args.reload == 'in-place'), compact=compact,
+                         years=stop_years(df))
+    except DATABASE_ERRORS as e:
         print(f"✗ Error creating table: {e}")
         connection.close()
         sys.exit(1)
 
     # Step 4: Insert data
-    print(f"\nStep 4: Inserting data")
+    print(f"\nStep 4: Inserting data ({args.load_mode}, {loaders} loader(s))")
     try:
-        insert_data(connection, df)
-    except Error as e:
+        batching = {
+            'batch_size': args.batch_size,
+            'commit_every': args.commit_every,
+            'target_seconds': args.target_batch_seconds,
+        }
+        cursor = connection.cursor()
+        frame, columns, expected_rows = prepare_load(cursor, df, compact)
+        connection.commit()
+        cursor.close()
+        load_all(connection, frame, args.load_mode, load_table, loaders, run_id, checkpoints, batching, columns)
+    except DATABASE_ERRORS as e:
         print(f"✗ Error inserting data: {e}")
+        print(f"  Progress is checkpointed, rerun to resume")
         connection.close()
         sys.exit(1)
 
-    # Step 5: Verify data
-    print(f"\nStep 5: Verifying data")
+    if args.reload == 'swap':
+        # Step 4b: Index, check, roll up and swap the staging table in
+        print(f"\nStep 4b: Indexing and swapping in {STAGING_TABLE}")
+        try:
+            build_indexes(connection, load_table, COMPACT_TABLE_INDEXES if compact else TABLE_INDEXES)
+            check_row_count(connection, STAGING_TABLE, expected_rows)
+            build_rollups(connection, STAGING_TABLE)
+            swap_in_staging(connection, compact)
+        except (*DATABASE_ERRORS, RuntimeError) as e:
+            print(f"✗ Error swapping in staging table, live table left unchanged: {e}")
+            connection.close()
+            sys.exit(1)
+    else:
+        # Step 4b: Rebuild the rollups from the reloaded table
+        print(f"\nStep 4b: Building rollups of {TABLE_NAME}")
+        try:
+            build_rollups(connection, TABLE_NAME)
+        except DATABASE_ERRORS as e:
+            print(f"✗ Error building rollups: {e}")
+            connection.close()
+            sys.exit(1)
+
+    # The new table has every migrated index
+    mark_migrations_applied(connection)
+    clear_checkpoints(connection, run_id)
+    return connection
+
+def ingest_embedded(df, backend, schema='wide'):
+    """Steps 2-4 against an embedded database: open it and rebuild the table"""
+    print(f"\nStep 2: Opening embedded database")
+    connection = create_embedded_connection(backend)
+
+    print(f"\nStep 3-4: Creating table schema and loading data")
     try:
-        verify_data(connection)
-    except Error as e:
-        print(f"✗ Error verifying data: {e}")
+        load_embedded(connection, df, compact=(schema == 'compact'))
+        mark_migrations_applied(connection)
+    except DATABASE_ERRORS as e:
+        print(f"✗ Error loading embedded database, previous contents kept: {e}")
+        connection.close()
+        sys.exit(1)
+    return connection
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Create the traffic_stops table and ingest cleaned data")
+    parser.add_argument('--backend', choices=BACKENDS, default=get_backend_name(),
+                        help="Remote MySQL, or a local embedded DuckDB/SQLite database")
+    parser.add_argument('--schema', choices=SCHEMA_LAYOUTS, default=get_schema_layout(),
+                        help="One wide table, or dimension tables and a fact table behind a traffic_stops view")
+    parser.add_argument('--load-mode', choices=['executemany', 'load-data'], default='executemany',
+                        help="How rows are sent to the server")
+    parser.add_argument('--reload', choices=['swap', 'in-place'], default='swap',
+                        help="Load through a staging table and swap it in, or rebuild the live table")
+    parser.add_argument('--loaders', type=int, default=1,
+                        help="Parallel loader connections, each inserting a disjoint slice")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="First executemany batch size, later batches adapt to latency and packet limits")
+    parser.add_argument('--commit-every', type=int, default=1,
+                        help="Commit (and checkpoint) every N batches instead of every batch")
+    parser.add_argument('--target-batch-seconds', type=float, default=1.0,
+                        help="Batch latency the adaptive batcher aims for")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore checkpoints of an interrupted run and load from scratch")
+    parser.add_argument('--input',
+                        help="Cleaned output of step 1 to load (default: the newest one)")
+    parser.add_argument('--metrics-file', default=INGEST_METRICS_FILE,
+                        help="JSON lines file the stage and batch timings of this run are appended to")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("DATABASE SETUP AND DATA INGESTION")
+    print("="*60)
+
+    # Step 1: Load cleaned data
+    cleaned_file = args.input or get_cleaned_file()
+    print(f"\nStep 1: Loading cleaned data from {cleaned_file}")
+    try:
+        df = load_cleaned_data(cleaned_file)
+        print(f"✓ Loaded {len(df):,} rows, {len(df.columns)} columns")
+    except Exception as e:
+        print(f"✗ Error loading cleaned data: {e}")
+        sys.exit(1)
+
+    try:
+        if args.backend in EMBEDDED_BACKENDS:
+            connection = ingest_embedded(df, args.backend, args.schema)
+        else:
+            connection = ingest_mysql(df, cleaned_file, args)
+
+        # Step 5: Verify data
+        print(f"\nStep 5: Verifying data")
+        try:
+            verify_data(connection)
+        except DATABASE_ERRORS as e:
+            print(f"✗ Error verifying data: {e}")
+    finally:
+        # Failed runs keep their timings too
+        save_metrics(args.metrics_file)
 
     # Close connection
     connection.close()
@@ -1,8 +1,20 @@
 import streamlit as st
-import mysql.connector
 import pandas as pd
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sql_queries import *
 from analytics_queries import *
+from db_backend import DATA_ERRORS, INTEGRITY_ERRORS, connect_backend, get_schema_layout, is_embedded, read_query
+from connection_pool import ConnectionPool
+from query_cache import QueryCache, result_size_bytes
+from query_metrics import INGEST_METRICS_FILE, MetricsStore, name_queries, query_id, read_jsonl
+from aggregate_reports import *
+from pagination import iter_pages, keyset_params, page_count, page_cursor
+from plate_index import PlateIndex
+from prediction_cube import PredictionCube
+from write_queue import WriteBehindQueue
 
 DB_CONFIG = {
     'host': "gateway01.eu-central-1.prod.aws.tidbcloud.com",
@@ -15,34 +27,333 @@ DB_CONFIG = {
 }
 
 TABLE_NAME = 'traffic_stops'
+# POLICE_DB_SCHEMA=compact when step 2 built dimension tables behind a traffic_stops view
+COMPACT_SCHEMA = get_schema_layout() == 'compact'
+
+# Seconds a cached query result stays valid; inserts from this dashboard invalidate earlier
+QUERY_TTL_SECONDS = 300
+DROPDOWN_TTL_SECONDS = 1800
+QUERY_CACHE_MB = 256
+
+# Connections shared by all sessions; SELECTs running longer than the timeout are cut off
+POOL_SIZE = 20
+POOL_CHECKOUT_TIMEOUT_SECONDS = 30
+QUERY_TIMEOUT_MS = 30000
+
+# Queries of one analytics page run concurrently on this many pooled connections
+ANALYTICS_WORKERS = 5
+
+# Plates added by this dashboard go straight into the index; a periodic rebuild picks up other writers
+PLATE_INDEX_TTL_SECONDS = 3600
+# Same for the stops counted by the prediction cube
+PREDICTION_CUBE_TTL_SECONDS = 3600
+
+# Add New Log submissions are journaled here and inserted by a background writer
+WRITE_JOURNAL_FILE = 'pending_logs.jsonl'
+
+# Full-history CSV exports read this many rows per keyset page
+EXPORT_PAGE_SIZE = 5000
+
+# Timings kept for the Performance page percentiles
+METRICS_SAMPLES = 20000
+
+PAGES = ["Vehicle Logs & Reports", "Vehicle Lookup", "Analytics", "Add New Log", "Performance"]
+
+# Queries carry the name of the get_*_query function that built them into the metrics
+name_queries(globals())
+
+# POLICE_DB_BACKEND=duckdb or sqlite serves the dashboard from the local file built by step 2
+@st.cache_resource
+def get_connection_pool():
+    return ConnectionPool(lambda: connect_backend(db_config=DB_CONFIG), max_size=POOL_SIZE,
+                          checkout_timeout=POOL_CHECKOUT_TIMEOUT_SECONDS, query_timeout_ms=QUERY_TIMEOUT_MS)
+
+@st.cache_resource
+def get_query_cache():
+    # One cache shared by every session of this server
+    return QueryCache(max_bytes=QUERY_CACHE_MB * 1024 * 1024, default_ttl=QUERY_TTL_SECONDS)
+
+@st.cache_resource
+def get_metrics_store():
+    # One rolling window of query and page timings shared by every session of this server
+    return MetricsStore(max_samples=METRICS_SAMPLES)
+
+def current_page():
+    return st.session_state.get('page')
+
+def read_measured(conn, query, params=None):
+    """read_query recording its timing, for reads that bypass the query cache"""
+    with get_metrics_store().measure(query_id(query), kind='query', page=current_page()) as sample:
+        df = read_query(conn, query, params)
+        sample['rows'] = len(df)
+    return df
+
+@st.cache_resource
+def get_live_lookups():
+    # The plate index and prediction cube last built, for the write queue's thread, which must not
+    # call st.cache_resource functions or touch session state
+    return {}
+
+@st.cache_resource(ttl=PLATE_INDEX_TTL_SECONDS)
+def get_plate_index():
+    # Built once per server from every distinct plate, not kept in the query cache
+    with get_connection_pool().connection() as conn:
+        plates = read_measured(conn, get_all_vehicle_numbers_query(TABLE_NAME))['vehicle_number']
+    plate_index = PlateIndex(plates.tolist())
+    get_live_lookups()['plate_index'] = plate_index
+    return plate_index
+
+@st.cache_resource(ttl=PREDICTION_CUBE_TTL_SECONDS)
+def get_prediction_cube():
+    # Two GROUP BY scans per server instead of two filtered scans per form submit
+    with get_connection_pool().connection() as conn:
+        cells = read_measured(conn, get_prediction_cube_query(TABLE_NAME))
+        outcomes = read_measured(conn, get_outcome_counts_query(TABLE_NAME))
+        dialect = conn.dialect if is_embedded(conn) else 'mysql'
+    cube = PredictionCube(cells, outcomes, dialect)
+    get_live_lookups()['prediction_cube'] = cube
+    return cube
+
+def insert_logs(conn, stops):
+    """Insert stops (dicts by INSERT_COLUMNS), new dimension values and rollup counters in one transaction"""
+    values = [tuple(stop[name] for name in INSERT_COLUMNS) for stop in stops]
+    rollup_values = [
+        (stop['stop_date'], int(stop['stop_time'][:2]), stop['country_name'], stop['violation'], 1,
+         int(stop['is_arrested']), int(stop['search_conducted']), int(stop['drugs_related_stop']))
+        for stop in stops
+    ]
+    vehicle_values = [(stop['vehicle_number'], stop['country_name']) for stop in stops]
+    # Typed-in search types and outcomes may be new dimension values
+    dimension_values = sorted({
+        (name, stop[name]) for stop in stops for name in DIMENSION_KEY_TYPES if stop[name] is not None
+    }) if COMPACT_SCHEMA else []
+
+    cursor = conn.cursor()
+    embedded = is_embedded(conn)
+    if embedded:
+        # DuckDB commits every statement on its own without an explicit transaction
+        cursor.execute("BEGIN TRANSACTION")
+    try:
+        for name, value in dimension_values:
+            cursor.execute(get_add_dimension_value_query(TABLE_NAME, name), (value, value))
+        cursor.executemany(insert_new_log_query(TABLE_NAME, COMPACT_SCHEMA), values)
+        cursor.executemany(get_rollup_upsert_query(TABLE_NAME), rollup_values)
+        cursor.executemany(get_vehicle_rollup_upsert_query(TABLE_NAME), vehicle_values)
+        if embedded:
+            cursor.execute("COMMIT")
+        else:
+            conn.commit()
+    except Exception:
+        if embedded:
+            cursor.execute("ROLLBACK")
+        else:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def write_logs(pool, metrics, stops):
+    """Write a group of queued logs; returns {index: error} for the ones the database rejects
+
+    A group with a rejected log, such as a duplicate or a value too long for its
+    column, is written again one log at a time
+    """
+    with pool.connection() as conn, metrics.measure('insert_new_log_query', 'query', rows=len(stops)):
+        try:
+            insert_logs(conn, stops)
+            return {}
+        except (*INTEGRITY_ERRORS, *DATA_ERRORS) as e:
+            if len(stops) == 1:
+                return {0: str(e)}
+        rejected = {}
+        for i, stop in enumerate(stops):
+            try:
+                insert_logs(conn, [stop])
+            except (*INTEGRITY_ERRORS, *DATA_ERRORS) as e:
+                rejected[i] = str(e)
+        return rejected
+
+def logs_written(cache, lookups, stops):
+    """Bring the query cache, plate index and prediction cube up to date with logs the queue wrote
+
+    Runs on the write queue's thread with the objects get_write_queue passed in
+    """
+    # Only results that read the table, its rollups or its dimension tables are stale now
+    for table in (TABLE_NAME, get_rollup_table_name(TABLE_NAME), get_vehicle_rollup_table_name(TABLE_NAME)):
+        cache.invalidate_table(table)
+    if COMPACT_SCHEMA:
+        for name in DIMENSION_KEY_TYPES:
+            cache.invalidate_table(get_dimension_table_name(TABLE_NAME, name))
+    # One not built yet reads these logs from the table when it is; a rebuilt one replaces it here
+    plate_index, cube = lookups.get('plate_index'), lookups.get('prediction_cube')
+    for stop in stops:
+        if plate_index is not None:
+            plate_index.add(stop['vehicle_number'])
+        if cube is not None:
+            cube.add(stop['violation'], stop['driver_age'], stop['driver_race'], stop['driver_gender'],
+                     stop['is_arrested'], stop['search_conducted'], stop['drugs_related_stop'], stop['stop_outcome'])
 
 @st.cache_resource
-def get_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+def get_write_queue():
+    # One journal and writer thread per server; logs a previous run left in the journal are written first
+    pool, metrics, cache, lookups = get_connection_pool(), get_metrics_store(), get_query_cache(), get_live_lookups()
+    return WriteBehindQueue(lambda stops: write_logs(pool, metrics, stops),
+                            lambda stops: logs_written(cache, lookups, stops), WRITE_JOURNAL_FILE)
+
+def fetch_query(query, cache, pool, ttl=None, params=None, metrics=None, page=None):
+    # Safe off the script thread: takes the cache, pool and metrics store instead of looking them up
+    start_time = time.perf_counter()
+    df, size = cache.lookup(query, params)
+    cache_hit = df is not None
+    if not cache_hit:
+        try:
+            with pool.connection() as conn:
+                df = read_query(conn, query, params)
+        except Exception:
+            if metrics is not None:
+                metrics.record(query_id(query), time.perf_counter() - start_time, page=page, cache_hit=False,
+                               error=True)
+            raise
+        size = result_size_bytes(df)
+        cache.put(query, df, params, ttl=ttl, size=size)
+    if metrics is not None:
+        metrics.record(query_id(query), time.perf_counter() - start_time, page=page, rows=len(df),
+                       size_bytes=size, cache_hit=cache_hit)
+    return df
+
+def execute_query(query, ttl=None, params=None):
+    return fetch_query(query, get_query_cache(), get_connection_pool(), ttl, params, get_metrics_store(),
+                       current_page())
+
+def show_table(df):
+    st.dataframe(df, hide_index=True, use_container_width=True)
 
-def execute_query(query):
-    return pd.read_sql(query, get_connection())
+def show_report(report):
+    """Render a report derived from a shared aggregate (aggregate_reports)"""
+    return lambda df: show_table(report(df))
+
+def show_paged_table(key, page_query, total_rows, sort_key, params=()):
+    """Show rows one keyset page at a time; total_rows comes from a COUNT, not from fetching them
+
+    page_query(after) gives the page query, with the keyset condition when after is
+    True; only the current page is fetched. Returns the page shown
+    """
+    state = st.session_state.setdefault(key, {'signature': None, 'cursors': [None]})
+    signature = (page_query(False), tuple(params))
+    if state['signature'] != signature:
+        # A new query starts over at its first page
+        state.update(signature=signature, cursors=[None])
+
+    cursor = state['cursors'][-1]
+    if cursor is None:
+        page = execute_query(page_query(False), params=params)
+    else:
+        page = execute_query(page_query(True), params=(*params, *keyset_params(cursor)))
+    show_table(page)
+
+    page_number, pages = len(state['cursors']), page_count(total_rows, PAGE_SIZE)
+    col1, col2, col3 = st.columns([1, 4, 1])
+    if col1.button("◀ Previous", key=f"{key}_previous", disabled=page_number == 1):
+        state['cursors'].pop()
+        st.rerun()
+    col2.caption(f"Page {page_number} of {pages} ({int(total_rows):,} rows)")
+    if col3.button("Next ▶", key=f"{key}_next", disabled=page_number >= pages or page.empty):
+        state['cursors'].append(page_cursor(page, sort_key))
+        st.rerun()
+    return page
+
+def vehicle_history_csv(vehicle_number):
+    """A vehicle's whole stop history as CSV, read page by page past the query cache"""
+    buffer = io.StringIO()
+    with get_connection_pool().connection() as conn:
+        pages = iter_pages(lambda query, params: read_measured(conn, query, params),
+                           lambda after: get_vehicle_history_page_query(TABLE_NAME, after, EXPORT_PAGE_SIZE),
+                           VEHICLE_HISTORY_SORT_KEY, (vehicle_number,))
+        for i, page in enumerate(pages):
+            page.to_csv(buffer, index=False, header=i == 0)
+    return buffer.getvalue()
+
+def show_paged_report(key, query, sort_key):
+    """Show an analytics query's rows one page at a time in sort_key order"""
+    total_rows = execute_query(get_paged_count_query(query))['total_rows'].iloc[0]
+    show_paged_table(key, lambda after: get_paged_query(query, sort_key, after, PAGE_SIZE), total_rows, sort_key)
+
+def run_sections(sections):
+    """Run the queries of independent sections concurrently, rendering each as soon as it arrives
+
+    sections: (container, title, query, render) tuples; a placeholder keeps each section in
+    its place on the page, so a slow query does not hold back the ones above or below it.
+    Sections with the same query (reports of one shared aggregate) share a single fetch
+    """
+    placeholders = []
+    for container, title, _, _ in sections:
+        with container:
+            st.write(f"**{title}**")
+            placeholder = st.empty()
+            placeholder.caption("Loading...")
+        placeholders.append(placeholder)
+
+    # Streamlit elements can only be created on the script thread, so workers just fetch
+    cache, pool, metrics, page = get_query_cache(), get_connection_pool(), get_metrics_store(), current_page()
+    waiting = {}
+    for i, (_, _, query, _) in enumerate(sections):
+        waiting.setdefault(query, []).append(i)
+    with ThreadPoolExecutor(max_workers=min(len(waiting), ANALYTICS_WORKERS)) as executor:
+        futures = {executor.submit(fetch_query, query, cache, pool, metrics=metrics, page=page): query
+                   for query in waiting}
+        for future in as_completed(futures):
+            for i in waiting[futures[future]]:
+                with placeholders[i].container():
+                    try:
+                        sections[i][3](future.result())
+                    except Exception as e:
+                        st.error(f"Error loading {sections[i][1]}: {e}")
+
+def show_cache_stats():
+    stats = get_query_cache().stats()
+    st.sidebar.caption(
+        f"Query cache: {stats['hits']:,} hits, {stats['misses']:,} misses "
+        f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} results, {stats['size_mb']:.1f} MB"
+    )
+    pool = get_connection_pool().stats()
+    st.sidebar.caption(
+        f"Connections: {pool['in_use']}/{pool['size']} in use (max {POOL_SIZE}), "
+        f"wait avg {pool['avg_wait_ms']:.0f} ms / max {pool['max_wait_ms']:.0f} ms, "
+        f"{pool['timeouts']} timeouts, {pool['reconnects']} reconnects"
+    )
+    queue = get_write_queue().stats()
+    st.sidebar.caption(
+        f"Write queue: {queue['depth']} pending, lag {queue['lag_seconds']:.1f} s, {queue['written']:,} written "
+        f"in {queue['groups']:,} group(s) (last {queue['last_group_ms']:.0f} ms), {queue['rejected']} rejected, "
+        f"{queue['failures']} failed attempt(s)"
+    )
 
 def main():
     st.set_page_config(page_title="Police Digital Ledger", layout="wide")
     st.title("🚔 Police Digital Ledger Dashboard")
 
-    page = st.sidebar.radio("Navigation", ["Vehicle Logs & Reports", "Vehicle Lookup", "Analytics", "Add New Log"])
+    # key='page' keeps the page in session state, so its queries are recorded under it
+    page = st.sidebar.radio("Navigation", PAGES, key='page')
+
+    with get_metrics_store().measure(page, kind='page', page=page):
+        if page == "Vehicle Logs & Reports":
+            show_vehicle_logs_page()
+        elif page == "Vehicle Lookup":
+            show_vehicle_lookup_page()
+        elif page == "Analytics":
+            show_analytics_page()
+        elif page == "Add New Log":
+            show_add_new_log_page()
+        elif page == "Performance":
+            show_performance_page()
 
-    if page == "Vehicle Logs & Reports":
-        show_vehicle_logs_page()
-    elif page == "Vehicle Lookup":
-        show_vehicle_lookup_page()
-    elif page == "Analytics":
-        show_analytics_page()
-    elif page == "Add New Log":
-        show_add_new_log_page()
+    show_cache_stats()
 
 def show_vehicle_logs_page():
     st.header("Vehicle Logs & Reports")
 
     # Vehicle Logs
-    vehicle_logs_df = execute_query(get_vehicle_logs_query(TABLE_NAME))
+    vehicle_logs_df = execute_query(get_vehicle_logs_rollup_query(TABLE_NAME))
     if vehicle_logs_df is not None and not vehicle_logs_df.empty:
         col1, col2, col3, col4 = st.columns(4)
         col1.metric("Total Vehicles", f"{vehicle_logs_df['total_vehicles'].iloc[0]:,}")
@@ -52,7 +363,7 @@ def show_vehicle_logs_page():
 
     # Violations
     st.subheader("Violations")
-    violations_df = execute_query(get_violations_stats_query(TABLE_NAME))
+    violations_df = execute_query(get_violations_stats_rollup_query(TABLE_NAME))
     if violations_df is not None and not violations_df.empty:
         col1, col2 = st.columns([2, 1])
         col1.dataframe(violations_df, hide_index=True, use_container_width=True)
@@ -60,31 +371,64 @@ def show_vehicle_logs_page():
 
     # Officer Reports
     st.subheader("Officer Reports")
-    officer_reports_df = execute_query(get_officer_reports_query(TABLE_NAME))
+    officer_reports_df = execute_query(get_officer_reports_rollup_query(TABLE_NAME))
     if officer_reports_df is not None and not officer_reports_df.empty:
         st.dataframe(officer_reports_df, hide_index=True, use_container_width=True)
 
 def show_vehicle_lookup_page():
     st.header("Vehicle Lookup")
 
-    vehicle_number = st.text_input("Enter Vehicle Number", placeholder="e.g., UP76DY3473")
+    vehicle_number = st.text_input("Enter Vehicle Number", placeholder="Full or partial plate, e.g., UP76DY3473")
+
+    # Partial or misread plates are resolved from the in-memory index, never a LIKE scan
+    if vehicle_number:
+        start_time = time.perf_counter()
+        candidates = get_plate_index().search(vehicle_number)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        if candidates:
+            distances = dict(candidates)
+            vehicle_number = st.selectbox(
+                "Matching Vehicles", list(distances),
+                format_func=lambda plate: f"{plate} ({distances[plate]} edit(s) away)" if distances[plate] else plate,
+            )
+            st.caption(f"{len(candidates)} candidate(s) in {elapsed_ms:.1f} ms")
     search_button = st.button("Search")
 
-    if search_button and vehicle_number:
-        vehicle_data_df = execute_query(get_vehicle_lookup_query(TABLE_NAME, vehicle_number))
+    # Remembered across reruns so paging through the history keeps the vehicle
+    if search_button:
+        st.session_state['lookup_vehicle'] = vehicle_number
+    vehicle_number = st.session_state.get('lookup_vehicle')
 
-        if vehicle_data_df is not None and not vehicle_data_df.empty:
+    if vehicle_number:
+        summary_df = execute_query(get_vehicle_summary_query(TABLE_NAME), params=(vehicle_number,))
+
+        if summary_df is not None and summary_df['total_stops'].iloc[0] > 0:
+            summary = summary_df.iloc[0]
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Total Stops", len(vehicle_data_df))
-            col2.metric("Arrests", vehicle_data_df['is_arrested'].sum())
-            col3.metric("Searches", vehicle_data_df['search_conducted'].sum())
-            col4.metric("Drug Related", vehicle_data_df['drugs_related_stop'].sum())
+            col1.metric("Total Stops", f"{int(summary['total_stops']):,}")
+            col2.metric("Arrests", f"{int(summary['arrests']):,}")
+            col3.metric("Searches", f"{int(summary['searches']):,}")
+            col4.metric("Drug Related", f"{int(summary['drug_related']):,}")
 
             st.subheader("Stop History")
-            st.dataframe(vehicle_data_df, hide_index=True, use_container_width=True)
-
-            csv = vehicle_data_df.to_csv(index=False)
-            st.download_button("Download CSV", csv, f"vehicle_{vehicle_number}.csv", "text/csv")
+            page = show_paged_table(
+                'vehicle_history',
+                lambda after: get_vehicle_history_page_query(TABLE_NAME, after, PAGE_SIZE),
+                summary['total_stops'],
+                VEHICLE_HISTORY_SORT_KEY,
+                params=(vehicle_number,),
+            )
+
+            col1, col2 = st.columns(2)
+            col1.download_button("Download Page CSV", page.to_csv(index=False),
+                                 f"vehicle_{vehicle_number}_page.csv", "text/csv")
+            # Built on request, not on every rerun of the page
+            if col2.button("Prepare Full History CSV"):
+                st.session_state['vehicle_history_csv'] = (vehicle_number, vehicle_history_csv(vehicle_number))
+            export = st.session_state.get('vehicle_history_csv')
+            if export is not None and export[0] == vehicle_number:
+                col2.download_button("Download Full History CSV", export[1], f"vehicle_{vehicle_number}.csv",
+                                     "text/csv")
         else:
             st.warning(f"No records found for: {vehicle_number}")
 
@@ -118,109 +462,86 @@ def show_vehicle_analytics():
     st.subheader("Vehicle-Based Analysis")
 
     col1, col2 = st.columns(2)
-
-    with col1:
-        st.write("**Top 10 Vehicles in Drug-Related Stops**")
-        df = execute_query(get_top_10_drug_vehicles_query(TABLE_NAME))
-        st.dataframe(df, hide_index=True, use_container_width=True)
-
-    with col2:
-        st.write("**Most Frequently Searched Vehicles**")
-        df = execute_query(get_most_searched_vehicles_query(TABLE_NAME))
-        st.dataframe(df, hide_index=True, use_container_width=True)
+    run_sections([
+        (col1, "Top 10 Vehicles in Drug-Related Stops", get_top_10_drug_vehicles_query(TABLE_NAME), show_table),
+        (col2, "Most Frequently Searched Vehicles", get_most_searched_vehicles_query(TABLE_NAME), show_table),
+    ])
 
 def show_demographic_analytics():
     st.subheader("Demographic Analysis")
 
-    st.write("**Arrest Rate by Age Group**")
-    df = execute_query(get_age_group_arrest_rate_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-    st.bar_chart(df.set_index('age_group')['arrest_rate'])
-
-    st.write("**Gender Distribution by Country**")
-    df = execute_query(get_gender_by_country_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    def show_age_groups(df):
+        show_table(df)
+        st.bar_chart(df.set_index('age_group')['arrest_rate'])
 
-    st.write("**Search Rate by Race and Gender**")
-    df = execute_query(get_race_gender_search_rate_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    run_sections([
+        (st.container(), "Arrest Rate by Age Group", get_age_group_arrest_rate_query(TABLE_NAME), show_age_groups),
+        (st.container(), "Gender Distribution by Country", get_gender_by_country_query(TABLE_NAME), show_table),
+        (st.container(), "Search Rate by Race and Gender", get_race_gender_search_rate_query(TABLE_NAME), show_table),
+    ])
 
 def show_time_analytics():
     st.subheader("Time & Duration Analysis")
 
-    st.write("**Stops by Hour of Day**")
-    df = execute_query(get_stops_by_time_of_day_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-    st.line_chart(df.set_index('hour')['stops'])
-
-    st.write("**Average Duration by Violation**")
-    df = execute_query(get_avg_duration_by_violation_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    def show_hours(df):
+        show_table(df)
+        st.line_chart(df.set_index('hour')['stops'])
 
-    st.write("**Night vs Day Arrest Rates**")
-    df = execute_query(get_night_arrest_rate_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    run_sections([
+        (st.container(), "Stops by Hour of Day", get_stops_by_time_of_day_rollup_query(TABLE_NAME), show_hours),
+        (st.container(), "Average Duration by Violation", get_violation_aggregates_query(TABLE_NAME), show_report(avg_duration_by_violation)),
+        (st.container(), "Night vs Day Arrest Rates", get_night_arrest_rate_rollup_query(TABLE_NAME), show_table),
+    ])
 
 def show_violation_analytics():
     st.subheader("Violation Analysis")
 
-    st.write("**Violations Associated with Searches/Arrests**")
-    df = execute_query(get_violations_search_arrest_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Common Violations Among Young Drivers (<25)**")
-    df = execute_query(get_young_driver_violations_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Low-Risk Violations**")
-    df = execute_query(get_low_risk_violations_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    violations = get_violation_aggregates_query(TABLE_NAME)
+    run_sections([
+        (st.container(), "Violations Associated with Searches/Arrests", violations, show_report(violations_search_arrest)),
+        (st.container(), "Common Violations Among Young Drivers (<25)", violations, show_report(young_driver_violations)),
+        (st.container(), "Low-Risk Violations", violations, show_report(low_risk_violations)),
+    ])
 
 def show_location_analytics():
     st.subheader("Location Analysis")
 
-    st.write("**Drug-Related Stops by Country**")
-    df = execute_query(get_drug_stops_by_country_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Arrest Rate by Country and Violation**")
-    df = execute_query(get_arrest_rate_by_country_violation_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Search Rate by Country**")
-    df = execute_query(get_search_rate_by_country_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    countries = get_country_aggregates_query(TABLE_NAME)
+    drug_stops, arrest_rates, search_rates = st.container(), st.container(), st.container()
+    run_sections([
+        (drug_stops, "Drug-Related Stops by Country", countries, show_report(drug_stops_by_country)),
+        (search_rates, "Search Rate by Country", countries, show_report(search_rate_by_country)),
+    ])
+    # Thousands of rows: paged on the script thread, since it has page buttons
+    with arrest_rates:
+        st.write("**Arrest Rate by Country and Violation**")
+        show_paged_report('arrest_rate_by_country_violation', get_arrest_rate_by_country_violation_query(TABLE_NAME),
+                          ARREST_RATE_BY_COUNTRY_VIOLATION_SORT_KEY)
 
 def show_complex_analytics():
     st.subheader("Complex Analytics")
 
-    st.write("**Yearly Breakdown by Country**")
-    df = execute_query(get_yearly_breakdown_by_country_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Violation Trends by Age and Race**")
-    df = execute_query(get_violation_trends_by_age_race_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**High Search/Arrest Rate Violations**")
-    df = execute_query(get_high_search_arrest_violations_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Demographics by Country**")
-    df = execute_query(get_demographics_by_country_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
-
-    st.write("**Top 5 Violations by Arrest Rate**")
-    df = execute_query(get_top_5_violations_arrest_rate_query(TABLE_NAME))
-    st.dataframe(df, hide_index=True, use_container_width=True)
+    violations = get_violation_aggregates_query(TABLE_NAME)
+    yearly, trends = st.container(), st.container()
+    run_sections([
+        (yearly, "Yearly Breakdown by Country", get_yearly_breakdown_by_country_query(TABLE_NAME), show_table),
+        (st.container(), "High Search/Arrest Rate Violations", violations, show_report(high_search_arrest_violations)),
+        (st.container(), "Demographics by Country", get_country_aggregates_query(TABLE_NAME), show_report(demographics_by_country)),
+        (st.container(), "Top 5 Violations by Arrest Rate", violations, show_report(top_5_violations_arrest_rate)),
+    ])
+    with trends:
+        st.write("**Violation Trends by Age and Race**")
+        show_paged_report('violation_trends_by_age_race', get_violation_trends_by_age_race_query(TABLE_NAME),
+                          VIOLATION_TRENDS_BY_AGE_RACE_SORT_KEY)
 
 def show_add_new_log_page():
     st.header("Add New Police Log")
 
-    # Get unique values for dropdowns
-    countries = execute_query(get_unique_values_query(TABLE_NAME, 'country_name'))['country_name'].tolist()
-    violations = execute_query(get_unique_values_query(TABLE_NAME, 'violation'))['violation'].tolist()
-    races = execute_query(get_unique_values_query(TABLE_NAME, 'driver_race'))['driver_race'].tolist()
+    # Get unique values for dropdowns, from the small dimension tables in the compact layout
+    values_query = get_dimension_values_query if COMPACT_SCHEMA else get_unique_values_query
+    countries = execute_query(values_query(TABLE_NAME, 'country_name'), DROPDOWN_TTL_SECONDS)['country_name'].tolist()
+    violations = execute_query(values_query(TABLE_NAME, 'violation'), DROPDOWN_TTL_SECONDS)['violation'].tolist()
+    races = execute_query(values_query(TABLE_NAME, 'driver_race'), DROPDOWN_TTL_SECONDS)['driver_race'].tolist()
 
     # Form
     with st.form("new_log_form"):
@@ -230,7 +551,9 @@ def show_add_new_log_page():
         with col1:
             stop_date = st.date_input("Stop Date")
             stop_time = st.time_input("Stop Time")
-            vehicle_number = st.text_input("Vehicle Number", placeholder="e.g., ABC123")
+            # Text inputs stop at their column's length, so the database never truncates or refuses a log
+            vehicle_number = st.text_input("Vehicle Number", placeholder="e.g., ABC123",
+                                           max_chars=max_chars('vehicle_number'))
             country = st.selectbox("Country", countries)
 
         with col2:
@@ -243,13 +566,15 @@ def show_add_new_log_page():
         col3, col4 = st.columns(2)
         with col3:
             search_conducted = st.checkbox("Search Conducted")
-            search_type = st.text_input("Search Type", value="None") if search_conducted else "None"
+            search_type = (st.text_input("Search Type", value="None", max_chars=max_chars('search_type'))
+                           if search_conducted else "None")
             is_arrested = st.checkbox("Arrested")
 
         with col4:
             drugs_related = st.checkbox("Drug Related Stop")
             stop_duration = st.selectbox("Stop Duration", ["0-15 Min", "16-30 Min", "30+ Min"])
-            stop_outcome = st.text_input("Stop Outcome", placeholder="e.g., Citation, Warning")
+            stop_outcome = st.text_input("Stop Outcome", placeholder="e.g., Citation, Warning",
+                                         max_chars=max_chars('stop_outcome'))
 
         submitted = st.form_submit_button("Add Log & Predict Outcome")
 
@@ -257,54 +582,84 @@ def show_add_new_log_page():
             # Get prediction
             st.subheader("Prediction Based on Similar Cases")
 
-            pred_df = execute_query(get_prediction_stats_query(TABLE_NAME, violation, driver_age, driver_race, driver_gender))
+            cube = get_prediction_cube()
+            start_time = time.perf_counter()
+            prediction = cube.predict(violation, driver_age, driver_race, driver_gender)
+            outcome = cube.most_common_outcome(violation)
+            elapsed_us = (time.perf_counter() - start_time) * 1e6
 
-            if pred_df is not None and not pred_df.empty and pred_df['similar_cases'].iloc[0] > 0:
+            if prediction['similar_cases'] > 0:
                 col5, col6, col7, col8 = st.columns(4)
-                col5.metric("Similar Cases", f"{pred_df['similar_cases'].iloc[0]:,.0f}")
-                col6.metric("Arrest Probability", f"{pred_df['arrest_probability'].iloc[0]:.1f}%")
-                col7.metric("Search Probability", f"{pred_df['search_probability'].iloc[0]:.1f}%")
-                col8.metric("Drug Stop Probability", f"{pred_df['drug_probability'].iloc[0]:.1f}%")
+                col5.metric("Similar Cases", f"{prediction['similar_cases']:,.0f}")
+                col6.metric("Arrest Probability", f"{prediction['arrest_probability']:.1f}%")
+                col7.metric("Search Probability", f"{prediction['search_probability']:.1f}%")
+                col8.metric("Drug Stop Probability", f"{prediction['drug_probability']:.1f}%")
 
                 # Get most common outcome
-                outcome_df = execute_query(get_most_common_outcome_query(TABLE_NAME, violation))
-                if outcome_df is not None and not outcome_df.empty:
-                    st.info(f"Most Common Outcome for '{violation}': **{outcome_df['stop_outcome'].iloc[0]}**")
+                if outcome is not None:
+                    st.info(f"Most Common Outcome for '{violation}': **{outcome[0]}**")
+                st.caption(f"Predicted in {elapsed_us:.0f} µs")
             else:
                 st.warning("No similar cases found for prediction")
 
-            # Insert into database
+            # Journaled and acknowledged at once; the write queue inserts it with other logs in the background
+            stop = dict(zip(INSERT_COLUMNS, (
+                stop_date.strftime('%Y-%m-%d'),
+                stop_time.strftime('%H:%M:%S'),
+                country,
+                driver_gender,
+                driver_age,
+                driver_age,
+                driver_race,
+                violation,
+                violation,
+                search_conducted,
+                search_type,
+                stop_outcome,
+                is_arrested,
+                stop_duration,
+                drugs_related,
+                vehicle_number
+            )))
             try:
-                conn = get_connection()
-                cursor = conn.cursor()
-
-                values = (
-                    stop_date.strftime('%Y-%m-%d'),
-                    stop_time.strftime('%H:%M:%S'),
-                    country,
-                    driver_gender,
-                    driver_age,
-                    driver_age,
-                    driver_race,
-                    violation,
-                    violation,
-                    search_conducted,
-                    search_type,
-                    stop_outcome,
-                    is_arrested,
-                    stop_duration,
-                    drugs_related,
-                    vehicle_number
-                )
-
-                cursor.execute(insert_new_log_query(TABLE_NAME), values)
-                conn.commit()
-                cursor.close()
-
-                st.success(f"✅ New log added successfully! Vehicle: {vehicle_number}")
-
-            except Exception as e:
-                st.error(f"Error adding log: {str(e)}")
+                get_write_queue().put(stop)
+                st.success(f"✅ New log queued! Vehicle: {vehicle_number}, written to the database in the background")
+            except OSError as e:
+                st.error(f"Error queuing log: {str(e)}")
+
+    queue = get_write_queue().stats()
+    if queue['retrying']:
+        st.warning(f"Database writes are failing, {queue['depth']} queued log(s) are kept in the journal and "
+                   f"retried: {queue['last_error']}")
+    elif queue['last_error']:
+        st.caption(f"Last write issue: {queue['last_error']}")
+
+def show_performance_page():
+    st.header("Performance")
+
+    metrics = get_metrics_store()
+    st.caption(f"Percentiles over the last {len(metrics.snapshot()):,} timings recorded by this server "
+               f"(window of {METRICS_SAMPLES:,}); query names are the functions that built them")
+
+    st.subheader("Pages")
+    show_table(metrics.summary('page'))
+
+    st.subheader("Queries")
+    page = st.selectbox("Recorded on Page", ["All Pages"] + PAGES)
+    show_table(metrics.summary('query', None if page == "All Pages" else page))
+
+    # Written by step 2, one run after another
+    if os.path.exists(INGEST_METRICS_FILE):
+        st.subheader("Ingestion Stages")
+        ingest = MetricsStore(max_samples=None)
+        ingest.extend(read_jsonl(INGEST_METRICS_FILE))
+        show_table(pd.concat([ingest.summary('stage'), ingest.summary('query')], ignore_index=True))
+
+    col1, col2 = st.columns(2)
+    col1.download_button("Export Prometheus Metrics", metrics.to_prometheus(), "traffic_stops_metrics.prom",
+                         "text/plain")
+    col2.download_button("Export JSON Lines", metrics.to_jsonl(), "traffic_stops_metrics.jsonl",
+                         "application/jsonl")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,119 @@
+"""
+Adaptive Batching for Traffic Stops Ingestion
+Sizes executemany batches from the server's max_allowed_packet, the
+measured row width and the latency of each batch, and prepares the next
+batch in a background thread while the current one is in flight
+"""
+
+import queue
+import threading
+
+from traffic_schema import db_batch_rows
+
+TARGET_BATCH_SECONDS = 1.0
+MIN_BATCH_ROWS = 100
+MAX_BATCH_ROWS = 50000
+# Share of max_allowed_packet one batch statement may use
+PACKET_HEADROOM = 0.5
+ROW_SAMPLE_SIZE = 200
+
+
+def estimate_row_bytes(rows):
+    """Approximate size of one row in the multi-row INSERT statement"""
+    sample = rows[:ROW_SAMPLE_SIZE]
+    if not sample:
+        return 1
+    # Quotes, comma and escaping overhead per value, parentheses per row
+    total = sum(len(str(value)) + 3 for row in sample for value in row) + 3 * len(sample)
+    return max(1, total // len(sample))
+
+
+class AdaptiveBatcher:
+    """Pick the next batch size from packet limits and measured batch latency"""
+
+    def __init__(self, initial_rows=1000, max_packet_bytes=None, target_seconds=TARGET_BATCH_SECONDS,
+                 min_rows=MIN_BATCH_ROWS, max_rows=MAX_BATCH_ROWS):
+        self.size = initial_rows
+        self.max_packet_bytes = max_packet_bytes
+        self.target_seconds = target_seconds
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.row_bytes = None
+        self.batches = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def packet_cap(self):
+        """Largest batch that fits in the packet limit"""
+        if self.max_packet_bytes is None or self.row_bytes is None:
+            return self.max_rows
+        return max(self.min_rows, int(self.max_packet_bytes * PACKET_HEADROOM / self.row_bytes))
+
+    def next_size(self):
+        with self._lock:
+            return max(self.min_rows, min(self.size, self.packet_cap, self.max_rows))
+
+    def observe_rows(self, rows):
+        """Learn the row width from the first prepared batch"""
+        if self.row_bytes is None and rows:
+            self.row_bytes = estimate_row_bytes(rows)
+
+    def record(self, rows, seconds):
+        """Adjust the batch size towards the target latency, at most doubling or halving"""
+        with self._lock:
+            self.batches += 1
+            self.rows += rows
+            self.seconds += seconds
+            if seconds > 0:
+                scale = min(2.0, max(0.5, self.target_seconds / seconds))
+                self.size = int(self.size * scale)
+
+    def summary(self):
+        """Chosen parameters and achieved throughput"""
+        average = self.rows / self.batches if self.batches else 0
+        rate = self.rows / self.seconds if self.seconds else 0
+        packet = f"{self.max_packet_bytes:,} B" if self.max_packet_bytes else "unknown"
+        return (f"max_allowed_packet {packet}, ~{self.row_bytes or 0} B/row, packet cap {self.packet_cap:,} rows, "
+                f"final batch {self.next_size():,} rows, average batch {average:,.0f} rows, "
+                f"{rate:,.0f} rows/s in flight")
+
+
+def iter_prefetched_batches(prepared, start_row, total_rows, batcher):
+    """Yield (start, rows) batches while the next one is built in a background thread"""
+    batches = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            position = start_row
+            while position < total_rows and not stop.is_set():
+                rows = db_batch_rows(prepared, position, min(position + batcher.next_size(), total_rows))
+                batcher.observe_rows(rows)
+                put((position, rows))
+                position += len(rows)
+            put(None)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
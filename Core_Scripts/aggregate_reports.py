@@ -0,0 +1,134 @@
+"""
+Shared Aggregate Reports for the Traffic Stops Dashboard
+Reports grouped by violation or by country are derived in memory from one
+superset aggregate per grouping (get_violation_aggregates_query,
+get_country_aggregates_query), so the table is scanned once per grouping and
+data version instead of once per report. Each report returns the same columns,
+filters and ordering as the SQL query it replaces
+"""
+
+import numpy as np
+import pandas as pd
+
+VIOLATION_RATE_COLUMNS = ['violation', 'total_stops', 'searches', 'search_rate', 'arrests', 'arrest_rate']
+
+
+def rounded_ratio(numerator, denominator, scale=1, digits=2):
+    """numerator * scale / denominator rounded half away from zero, like SQL ROUND on exact values
+
+    Computed on integers, so a rate such as 12.345 rounds to 12.35 as in MySQL
+    instead of drifting with floating point; missing or zero inputs give NaN
+    """
+    numerator = pd.to_numeric(numerator).astype(float)
+    denominator = pd.to_numeric(denominator).astype(float)
+    valid = numerator.notna() & denominator.gt(0)
+    unit = 10 ** digits
+    scaled = numerator[valid].astype('int64') * scale * unit
+    whole = denominator[valid].astype('int64')
+    rounded = np.sign(scaled) * ((2 * scaled.abs() + whole) // (2 * whole))
+    result = pd.Series(np.nan, index=numerator.index)
+    result[valid] = rounded / unit
+    return result
+
+
+def percentage(part, whole, digits=2):
+    """ROUND(part * 100.0 / whole, digits)"""
+    return rounded_ratio(part, whole, 100, digits)
+
+
+def _top(df, by, ascending, limit=None):
+    # Stable sort keeps ties in group order, SQL leaves their order unspecified anyway
+    df = df.sort_values(by, ascending=ascending, kind='stable').reset_index(drop=True)
+    return df.head(limit) if limit is not None else df
+
+
+def _violation_rates(violations):
+    df = violations.copy()
+    df['search_rate'] = percentage(df['searches'], df['total_stops'])
+    df['arrest_rate'] = percentage(df['arrests'], df['total_stops'])
+    return df
+
+
+# Violation reports, from get_violation_aggregates_query
+
+def violations_search_arrest(violations):
+    """Violations most associated with searches or arrests"""
+    df = _violation_rates(violations)[VIOLATION_RATE_COLUMNS]
+    return _top(df, ['search_rate', 'arrest_rate'], [False, False])
+
+
+def low_risk_violations(violations):
+    """Violations that rarely result in search or arrest"""
+    df = _violation_rates(violations)[VIOLATION_RATE_COLUMNS]
+    return _top(df[df['total_stops'] > 100], ['search_rate', 'arrest_rate'], [True, True], limit=10)
+
+
+def young_driver_violations(violations):
+    """Most common violations among younger drivers (<25)"""
+    df = violations[violations['young_stops'] > 0]
+    df = pd.DataFrame({
+        'violation': df['violation'],
+        'stops': df['young_stops'],
+        'arrests': df['young_arrests'],
+        'arrest_rate': percentage(df['young_arrests'], df['young_stops']),
+    })
+    return _top(df, 'stops', False, limit=10)
+
+
+def avg_duration_by_violation(violations):
+    """Average stop duration for different violations"""
+    df = violations[violations['duration_stops'] > 0]
+    df = pd.DataFrame({
+        'violation': df['violation'],
+        'total_stops': df['duration_stops'],
+        'avg_duration_minutes': pd.to_numeric(df['duration_minutes']) / pd.to_numeric(df['duration_stops']),
+        'arrests': df['duration_arrests'],
+    })
+    return _top(df, 'avg_duration_minutes', False)
+
+
+def high_search_arrest_violations(violations):
+    """Violations with high search and arrest rates, ranked on both"""
+    df = _violation_rates(violations)[VIOLATION_RATE_COLUMNS]
+    df = df[df['total_stops'] > 50].copy()
+    # RANK(): ties share the lowest rank and leave a gap after them
+    df['search_rank'] = df['search_rate'].rank(method='min', ascending=False).astype('Int64')
+    df['arrest_rank'] = df['arrest_rate'].rank(method='min', ascending=False).astype('Int64')
+    df = df.assign(rank_sum=df['search_rank'] + df['arrest_rank'])
+    return _top(df, 'rank_sum', True, limit=15).drop(columns='rank_sum')
+
+
+def top_5_violations_arrest_rate(violations):
+    """Top 5 violations with highest arrest rates"""
+    df = _violation_rates(violations)
+    df = df[df['total_stops'] > 100][['violation', 'total_stops', 'arrests', 'arrest_rate', 'searches', 'search_rate']]
+    return _top(df, 'arrest_rate', False, limit=5)
+
+
+# Country reports, from get_country_aggregates_query
+
+def drug_stops_by_country(countries):
+    """Countries with highest rate of drug-related stops"""
+    df = countries[['country_name', 'total_stops', 'drug_stops']].copy()
+    df['drug_stop_rate'] = percentage(df['drug_stops'], df['total_stops'])
+    return _top(df, 'drug_stop_rate', False)
+
+
+def search_rate_by_country(countries):
+    """Countries with most stops with search conducted"""
+    df = countries[['country_name', 'total_stops', 'searches']].copy()
+    df['search_rate'] = percentage(df['searches'], df['total_stops'])
+    return _top(df, 'searches', False)
+
+
+def demographics_by_country(countries):
+    """Driver demographics by country (age, gender, race)"""
+    df = pd.DataFrame({
+        'country_name': countries['country_name'],
+        'avg_age': rounded_ratio(countries['age_sum'], countries['age_count'], digits=1),
+        'male_count': countries['male_count'],
+        'female_count': countries['female_count'],
+        'race_diversity': countries['race_diversity'],
+        'total_stops': countries['total_stops'],
+    })
+    return _top(df, 'total_stops', False)
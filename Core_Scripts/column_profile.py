@@ -0,0 +1,339 @@
+"""
+Column Profiling Helpers for Traffic Stops Preprocessing
+Collects mergeable per-column statistics (null counts, inferred kind and
+value counts) so empty columns and medians can be found without loading
+the whole file into memory
+"""
+
+import math
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+
+from traffic_schema import SCHEMA, coerce_column, read_dtypes
+
+# Numeric columns keep exact value counts until they hold more distinct
+# values than this, then they count values per bucket of a power-of-two width.
+# A median read off the buckets is within half a bucket width of the true one;
+# refine_medians makes it exact with one more pass over the values near it
+DEFAULT_MAX_DISTINCT = 100000
+
+
+def new_profile():
+    """Create an empty profile"""
+    return {'rows': 0, 'columns': {}}
+
+
+def _column_kind(series):
+    """Kind of a chunk column as pandas inferred it"""
+    if pd.api.types.is_bool_dtype(series):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    return 'object'
+
+
+def _new_column():
+    # width is None while counts are exact, else counts are keyed by floor(value / width)
+    return {'non_null': 0, 'nulls': 0, 'kinds': [], 'counts': {}, 'width': None}
+
+
+def _add_counts(counts, more):
+    for key, count in more.items():
+        counts[key] = counts.get(key, 0) + count
+
+
+def _rebucket(counts, width, new_width):
+    """Counts keyed by the buckets of new_width, from exact counts (width None) or a finer width"""
+    buckets = {}
+    if width is None:
+        for value, count in counts.items():
+            key = math.floor(value / new_width)
+            buckets[key] = buckets.get(key, 0) + count
+    else:
+        # Widths are powers of two, so a coarser bucket is the finer key shifted right
+        shift = round(math.log2(new_width / width))
+        for key, count in counts.items():
+            buckets[key >> shift] = buckets.get(key >> shift, 0) + count
+    return buckets
+
+
+def _bound_counts(column, max_distinct):
+    """Switch to buckets, or widen them, until the column holds at most max_distinct keys"""
+    counts = column['counts']
+    if len(counts) <= max_distinct:
+        return
+    width = column['width']
+    if width is None:
+        # Start from the width that would spread the values over max_distinct buckets
+        span = max(counts) - min(counts)
+        new_width = 2.0 ** math.floor(math.log2(span / max_distinct))
+    else:
+        new_width = width * 2
+    counts = _rebucket(counts, width, new_width)
+    while len(counts) > max_distinct:
+        counts = _rebucket(counts, new_width, new_width * 2)
+        new_width *= 2
+    column['counts'] = counts
+    column['width'] = new_width
+
+
+def _merge_column_counts(column, counts, width, max_distinct):
+    """Add counts at a given width (None: exact) to a column, at the coarser of both widths"""
+    widths = [w for w in (column['width'], width) if w is not None]
+    if widths:
+        new_width = max(widths)
+        if column['width'] != new_width:
+            column['counts'] = _rebucket(column['counts'], column['width'], new_width)
+            column['width'] = new_width
+        if width != new_width:
+            counts = _rebucket(counts, width, new_width)
+    _add_counts(column['counts'], counts)
+    _bound_counts(column, max_distinct)
+
+
+def update_profile(profile, chunk, max_distinct=DEFAULT_MAX_DISTINCT):
+    """Add the statistics of one chunk to a profile"""
+    profile['rows'] += len(chunk)
+    for col in chunk.columns:
+        column = profile['columns'].setdefault(col, _new_column())
+        series = chunk[col]
+        non_null = int(series.notna().sum())
+        column['nulls'] += len(series) - non_null
+        column['non_null'] += non_null
+
+        # All-null chunks are read as float and say nothing about the real type
+        if non_null == 0:
+            continue
+
+        kind = _column_kind(series)
+        if kind not in column['kinds']:
+            column['kinds'].append(kind)
+
+        if kind in ('int', 'float'):
+            values = series.dropna()
+            if column['width'] is not None:
+                values = np.floor(values / column['width']).astype('int64')
+            counts = {value.item() if hasattr(value, 'item') else value: int(count)
+                      for value, count in values.value_counts().items()}
+            _merge_column_counts(column, counts, column['width'], max_distinct)
+    return profile
+
+
+def merge_profiles(left, right, max_distinct=DEFAULT_MAX_DISTINCT):
+    """Merge two profiles into a new one"""
+    merged = new_profile()
+    merged['rows'] = left['rows'] + right['rows']
+    for source in (left, right):
+        for col, stats in source['columns'].items():
+            column = merged['columns'].setdefault(col, _new_column())
+            column['non_null'] += stats['non_null']
+            column['nulls'] += stats['nulls']
+            for kind in stats['kinds']:
+                if kind not in column['kinds']:
+                    column['kinds'].append(kind)
+            _merge_column_counts(column, stats['counts'], stats['width'], max_distinct)
+    return merged
+
+
+def profile_to_json(profile):
+    """Convert a profile to a JSON-serializable dict"""
+    columns = {}
+    for col, stats in profile['columns'].items():
+        stats = dict(stats)
+        stats['counts'] = [[value, count] for value, count in stats['counts'].items()]
+        columns[col] = stats
+    return {'rows': profile['rows'], 'columns': columns}
+
+
+def profile_from_json(data):
+    """Rebuild a profile saved with profile_to_json"""
+    columns = {}
+    for col, stats in data['columns'].items():
+        stats = dict(stats)
+        stats['counts'] = {value: count for value, count in stats['counts']}
+        columns[col] = stats
+    return {'rows': data['rows'], 'columns': columns}
+
+
+def resolve_dtype(column):
+    """Dtype a single full pd.read_csv would have given this column"""
+    kinds = set(column['kinds'])
+    if not kinds:
+        return 'float64'
+    if kinds == {'bool'}:
+        # read_csv turns True/False with missing values into object
+        return 'bool' if column['nulls'] == 0 else 'object'
+    if kinds <= {'int', 'float'}:
+        if 'float' in kinds or column['nulls'] > 0:
+            return 'float64'
+        return 'int64'
+    return 'object'
+
+
+def _values_at_ranks(counts, ranks, seen=0):
+    """Values of a {value: count} histogram at the given 0-based ranks, seen counting values before it"""
+    found = []
+    for value, count in sorted(counts.items()):
+        seen += count
+        while len(found) < len(ranks) and ranks[len(found)] < seen:
+            found.append(value)
+        if len(found) == len(ranks):
+            break
+    return found
+
+
+def _median_ranks(total):
+    return [(total - 1) // 2, total // 2]
+
+
+def median_from_counts(counts, width=None):
+    """Median of a {value: count} histogram, same as Series.median()
+
+    With a bucket width it is estimated from the middle of the buckets holding the
+    middle ranks, within half a bucket width of the true median
+    """
+    total = sum(counts.values())
+    if total == 0:
+        return float('nan')
+    lower, upper = _values_at_ranks(counts, _median_ranks(total))
+    if width is not None:
+        lower, upper = (lower + 0.5) * width, (upper + 0.5) * width
+    return (lower + upper) / 2
+
+
+def median_ranges(profile, plan):
+    """[low, high) value range holding the median of every bucketed column filled with one
+
+    Returns {column: (low, high, below, total)}, below counting the values under low
+    """
+    ranges = {}
+    for col in plan['fill_values']:
+        stats = profile['columns'][col]
+        if stats['width'] is None or not _fills_median(col, plan):
+            continue
+        total = sum(stats['counts'].values())
+        first, last = _values_at_ranks(stats['counts'], _median_ranks(total))
+        below = sum(count for key, count in stats['counts'].items() if key < first)
+        ranges[col] = (first * stats['width'], (last + 1) * stats['width'], below, total)
+    return ranges
+
+
+def count_in_ranges(counts, chunk, ranges):
+    """Add the exact counts of a chunk's values inside each column's median range"""
+    for col, (low, high, _, _) in ranges.items():
+        series = chunk[col]
+        # Only values update_profile counted, a chunk read as text holds none
+        if _column_kind(series) not in ('int', 'float'):
+            continue
+        values = series[(series >= low) & (series < high)]
+        _add_counts(counts.setdefault(col, {}), {value.item() if hasattr(value, 'item') else value: int(count)
+                                                 for value, count in values.value_counts().items()})
+    return counts
+
+
+def merge_range_counts(counts, more):
+    """Add counts from count_in_ranges of other chunks or files"""
+    for col, values in more.items():
+        _add_counts(counts.setdefault(col, {}), values)
+    return counts
+
+
+def exact_medians(plan, ranges, counts):
+    """The plan with the medians of bucketed columns replaced by the exact ones from count_in_ranges"""
+    fill_values = dict(plan['fill_values'])
+    for col, (_, _, below, total) in ranges.items():
+        lower, upper = _values_at_ranks(counts.get(col, {}), _median_ranks(total), seen=below)
+        fill_values[col] = (lower + upper) / 2
+    return dict(plan, fill_values=fill_values)
+
+
+def refine_medians(profile, plan, chunks):
+    """Make the medians of bucketed columns exact with one more pass over the chunks of the data"""
+    ranges = median_ranges(profile, plan)
+    if not ranges:
+        return plan
+    counts = {}
+    for chunk in chunks:
+        count_in_ranges(counts, chunk, ranges)
+    return exact_medians(plan, ranges, counts)
+
+
+def _fills_median(col, plan):
+    if col in SCHEMA:
+        return SCHEMA[col].fill == 'median'
+    return plan['dtypes'][col] in ('int64', 'float64')
+
+
+def resolve_cleaning_plan(profile):
+    """Get empty columns, final dtypes and fill values from a profile
+
+    Schema columns take their type and fill rule from traffic_schema, other
+    columns fall back to the dtype a full read would have inferred
+    """
+    empty_cols = [col for col, stats in profile['columns'].items() if stats['non_null'] == 0]
+    dtypes = {}
+    fill_values = {}
+    for col, stats in profile['columns'].items():
+        if col in empty_cols:
+            continue
+        if col in SCHEMA:
+            column = SCHEMA[col]
+            dtypes[col] = column.kind
+            if column.fill == 'median':
+                fill_values[col] = median_from_counts(stats['counts'], stats['width'])
+            elif column.fill is not None:
+                fill_values[col] = column.fill
+            continue
+        dtype = resolve_dtype(stats)
+        dtypes[col] = dtype
+        if stats['nulls'] == 0:
+            continue
+        if dtype in ('int64', 'float64'):
+            fill_values[col] = median_from_counts(stats['counts'], stats['width'])
+        elif dtype == 'bool':
+            fill_values[col] = False
+        else:
+            fill_values[col] = 'Unknown'
+    return {'empty_cols': empty_cols, 'dtypes': dtypes, 'fill_values': fill_values}
+
+
+def inexact_columns(profile):
+    """Columns whose values are counted per bucket, with their bucket widths"""
+    return {col: stats['width'] for col, stats in profile['columns'].items() if stats['width'] is not None}
+
+
+def clean_chunk(chunk, plan):
+    """Apply a cleaning plan to one chunk"""
+    chunk = chunk.drop(columns=[c for c in plan['empty_cols'] if c in chunk.columns])
+    other_fills = {}
+    for col, dtype in plan['dtypes'].items():
+        if col in SCHEMA:
+            chunk[col] = coerce_column(chunk[col], SCHEMA[col], plan['fill_values'].get(col))
+            continue
+        if dtype == 'float64' and chunk[col].dtype != 'float64':
+            chunk[col] = chunk[col].astype('float64')
+        if col in plan['fill_values']:
+            other_fills[col] = plan['fill_values'][col]
+    return chunk.fillna(other_fills)
+
+
+def estimate_chunk_rows(file_path, max_memory_mb, sample_rows=1000):
+    """Pick a chunk size that keeps a chunk and its copies inside the memory budget"""
+    sample = pd.read_csv(file_path, nrows=sample_rows, dtype=read_dtypes())
+    if sample.empty:
+        return sample_rows
+    bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+    # A chunk is copied a few times while cleaning and writing, keep it to a quarter of the budget
+    return max(1000, int(max_memory_mb * 1024 * 1024 / 4 / bytes_per_row))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
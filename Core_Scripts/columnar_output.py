@@ -0,0 +1,167 @@
+"""
+Typed Columnar Output for Cleaned Traffic Stops Data
+Converts cleaned DataFrames to Arrow tables with categorical, date, time
+and boolean types, and writes/reads them as Parquet
+"""
+
+import glob
+import os
+
+import pandas as pd
+
+from traffic_schema import TRUE_VALUES, columns_of_kind, read_dtypes
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    ds = None
+    pq = None
+
+# Low-cardinality text columns stored dictionary-encoded
+CATEGORICAL_COLUMNS = columns_of_kind('category')
+
+# Flag columns stored as real booleans
+FLAG_COLUMNS = columns_of_kind('bool')
+
+# Numeric columns stored as integers, matching the INT columns of the table
+INTEGER_COLUMNS = columns_of_kind('int')
+
+DATE_COLUMNS = columns_of_kind('date')
+
+TIME_COLUMNS = columns_of_kind('time')
+
+
+def pyarrow_available():
+    """Check whether pyarrow is installed"""
+    return pa is not None
+
+
+def _to_date(series):
+    dates = pd.to_datetime(series, errors='coerce')
+    return pa.array(dates, from_pandas=True).cast(pa.date32())
+
+
+def _to_time(series):
+    text = series.astype(str)
+    # Accept both HH:MM and HH:MM:SS
+    text = text.where(text.str.count(':') != 1, text + ':00')
+    micros = pd.to_timedelta(text, errors='coerce') // pd.Timedelta(microseconds=1)
+    return pa.array(micros, from_pandas=True, type=pa.int64()).cast(pa.time64('us'))
+
+
+def _to_flag(series):
+    if pd.api.types.is_bool_dtype(series):
+        return pa.array(series, from_pandas=True)
+    flags = series.astype(str).str.strip().str.lower().isin(TRUE_VALUES)
+    return pa.array(flags, type=pa.bool_())
+
+
+def _to_category(series):
+    values = series.astype(str).astype('category')
+    return pa.array(values, from_pandas=True).cast(pa.dictionary(pa.int32(), pa.string()))
+
+
+def _to_integer(series):
+    values = pd.to_numeric(series, errors='coerce')
+    return pa.array(values, from_pandas=True).cast(pa.int32(), safe=False)
+
+
+def to_typed_table(df):
+    """Convert a cleaned DataFrame to an Arrow table with explicit types"""
+    arrays = []
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            arrays.append(_to_date(df[col]))
+        elif col in TIME_COLUMNS:
+            arrays.append(_to_time(df[col]))
+        elif col in FLAG_COLUMNS:
+            arrays.append(_to_flag(df[col]))
+        elif col in CATEGORICAL_COLUMNS:
+            arrays.append(_to_category(df[col]))
+        elif col in INTEGER_COLUMNS:
+            arrays.append(_to_integer(df[col]))
+        elif pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+            arrays.append(pa.array(df[col], from_pandas=True))
+        else:
+            arrays.append(pa.array(df[col].astype(str), type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=list(df.columns))
+
+
+def write_parquet(df, output_file):
+    """Write a cleaned DataFrame as a typed Parquet file"""
+    pq.write_table(to_typed_table(df), output_file)
+
+
+class ParquetChunkWriter:
+    """Append cleaned chunks to one Parquet file with a fixed schema"""
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.writer = None
+
+    def write(self, df):
+        table = to_typed_table(df)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.output_file, table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def read_typed_table(input_file):
+    """Read a typed Parquet file straight into pandas without re-inferring types"""
+    table = pq.read_table(input_file, memory_map=True)
+    return table.to_pandas(self_destruct=True, split_blocks=True)
+
+
+def partition_format(input_dir):
+    """'parquet' or 'csv', the format step 1 wrote the parts of a partitioned output in"""
+    for _, _, names in os.walk(input_dir):
+        for name in names:
+            if name.endswith('.csv'):
+                return 'csv'
+            if name.endswith('.parquet'):
+                return 'parquet'
+    return 'parquet'
+
+
+def _read_partitioned_csv(input_dir, years=None, countries=None):
+    # CSV parts carry no types, they are read with the schema dtypes like the single CSV output
+    years = {str(y) for y in years} if years else None
+    frames = []
+    for path in sorted(glob.glob(os.path.join(input_dir, 'year=*', 'country=*', '*.csv'))):
+        country_dir = os.path.dirname(path)
+        year = os.path.basename(os.path.dirname(country_dir)).split('=', 1)[1]
+        country = os.path.basename(country_dir).split('=', 1)[1]
+        if (years and year not in years) or (countries and country not in countries):
+            continue
+        frames.append(pd.read_csv(path, dtype=read_dtypes()))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def read_partitioned(input_dir, years=None, countries=None, output_format=None):
+    """Read a year=/country= partitioned output, pruning to the requested partitions
+
+    output_format: 'parquet' or 'csv' parts, detected from the files when None
+    """
+    if (output_format or partition_format(input_dir)) == 'csv':
+        return _read_partitioned_csv(input_dir, years, countries)
+    # Partition keys stay strings, rows without a parseable date live under year=Unknown
+    partitioning = ds.partitioning(pa.schema([('year', pa.string()), ('country', pa.string())]), flavor='hive')
+    dataset = ds.dataset(input_dir, format='parquet', partitioning=partitioning)
+    condition = None
+    if years:
+        condition = ds.field('year').isin([str(y) for y in years])
+    if countries:
+        country_filter = ds.field('country').isin(list(countries))
+        condition = country_filter if condition is None else condition & country_filter
+    table = dataset.to_table(filter=condition)
+    table = table.drop_columns([c for c in ('year', 'country') if c in table.column_names])
+    return table.to_pandas(self_destruct=True, split_blocks=True)
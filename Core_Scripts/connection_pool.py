@@ -0,0 +1,171 @@
+"""
+Connection Pool for the Traffic Stops Dashboard
+Bounded, thread-safe pool of database connections shared by all dashboard
+sessions: connections are health-checked on checkout and replaced when the
+server dropped them, SELECTs get a per-query execution timeout, and the time
+spent waiting for a free connection is recorded
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from db_backend import DATABASE_ERRORS, is_embedded
+from sql_queries import get_set_query_timeout_query
+
+POOL_SIZE = 20
+CHECKOUT_TIMEOUT_SECONDS = 30
+QUERY_TIMEOUT_MS = 30000
+
+
+class PoolTimeout(RuntimeError):
+    """No connection became free within the checkout timeout"""
+
+
+def ping(connection):
+    """Check that a connection is usable (a server round trip for MySQL)"""
+    try:
+        # Not reconnecting in place: a fresh session would lose its settings, the pool replaces it instead
+        return connection.is_connected()
+    except DATABASE_ERRORS:
+        return False
+
+
+class ConnectionPool:
+    """Hand out at most max_size connections, created lazily by factory"""
+
+    def __init__(self, factory, max_size=POOL_SIZE, checkout_timeout=CHECKOUT_TIMEOUT_SECONDS,
+                 query_timeout_ms=QUERY_TIMEOUT_MS):
+        self.factory = factory
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.query_timeout_ms = query_timeout_ms
+        # Most recently returned last, so checkouts reuse warm connections
+        self._idle = []
+        self._lock = threading.Lock()
+        # Signalled whenever a connection is returned or a slot for a new one frees up
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        # Session timeout last set on each connection, so it is only re-sent when it changes
+        self._timeouts = {}
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.in_use = 0
+
+    def _release_slot(self):
+        with self._lock:
+            self._created -= 1
+            self._available.notify()
+
+    def _new_connection(self):
+        # The caller has reserved a slot for it
+        try:
+            return self.factory()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _close(self, connection):
+        with self._lock:
+            self._timeouts.pop(id(connection), None)
+        try:
+            connection.close()
+        except DATABASE_ERRORS:
+            pass
+
+    def _checkout(self):
+        start = time.perf_counter()
+        with self._lock:
+            # Wait for an idle connection or for room to create one
+            if not self._available.wait_for(lambda: self._idle or self._created < self.max_size,
+                                            timeout=self.checkout_timeout):
+                self.timeouts += 1
+                raise PoolTimeout(f"No database connection free after {self.checkout_timeout} s "
+                                  f"({self.max_size} in use)")
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                self._created += 1
+        if connection is None:
+            connection = self._new_connection()
+        waited = time.perf_counter() - start
+
+        if not ping(connection):
+            # Dropped by the server (idle timeout, failover): replace it, keeping its slot
+            self._close(connection)
+            with self._lock:
+                self.reconnects += 1
+            connection = self._new_connection()
+
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+    def _checkin(self, connection, healthy=True):
+        if healthy:
+            try:
+                # End the read snapshot so the next user sees committed inserts
+                connection.rollback()
+            except DATABASE_ERRORS:
+                healthy = False
+        if healthy:
+            with self._lock:
+                self.in_use -= 1
+                self._idle.append(connection)
+                self._available.notify()
+        else:
+            with self._lock:
+                self.in_use -= 1
+            self._discard(connection)
+
+    def _discard(self, connection):
+        # Frees the slot, so a waiting checkout creates a replacement
+        self._close(connection)
+        self._release_slot()
+
+    def _apply_timeout(self, connection, timeout_ms):
+        # Embedded engines have no statement timeout
+        if is_embedded(connection) or timeout_ms is None:
+            return
+        if self._timeouts.get(id(connection)) == timeout_ms:
+            return
+        cursor = connection.cursor()
+        cursor.execute(get_set_query_timeout_query(timeout_ms))
+        cursor.close()
+        self._timeouts[id(connection)] = timeout_ms
+
+    @contextmanager
+    def connection(self, query_timeout_ms=None):
+        """Borrow a healthy connection; SELECTs on it are cut off after the query timeout"""
+        connection = self._checkout()
+        try:
+            self._apply_timeout(connection, query_timeout_ms or self.query_timeout_ms)
+            yield connection
+        except DATABASE_ERRORS:
+            # A failed query may have broken the connection, only reuse it if it still answers
+            self._checkin(connection, healthy=ping(connection))
+            raise
+        except BaseException:
+            self._checkin(connection)
+            raise
+        else:
+            self._checkin(connection)
+
+    def stats(self):
+        """Pool size and wait counters"""
+        with self._lock:
+            return {
+                'size': self._created,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'avg_wait_ms': self.wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait_seconds * 1000,
+                'timeouts': self.timeouts,
+                'reconnects': self.reconnects,
+            }
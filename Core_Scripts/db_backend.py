@@ -0,0 +1,271 @@
+"""
+Database Backend Layer for the Traffic Stops Pipeline
+Connects either to the remote MySQL/TiDB cluster or to an embedded engine
+(DuckDB, or SQLite from the standard library), translating the MySQL
+dialect of sql_queries.py and analytics_queries.py for the embedded ones
+
+Select with the POLICE_DB_BACKEND environment variable (mysql, duckdb,
+sqlite) and POLICE_DB_PATH for the embedded database file; POLICE_DB_SCHEMA
+(wide, compact) picks the table layout step 2 builds and the dashboard writes
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+try:
+    import mysql.connector
+except ImportError:
+    mysql = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+BACKENDS = ['mysql', 'duckdb', 'sqlite']
+EMBEDDED_BACKENDS = ['duckdb', 'sqlite']
+DEFAULT_BACKEND = os.environ.get('POLICE_DB_BACKEND', 'mysql')
+DEFAULT_DB_PATHS = {
+    'duckdb': 'traffic_stops.duckdb',
+    'sqlite': 'traffic_stops.sqlite',
+}
+
+# wide: one traffic_stops table; compact: dimension tables, a fact table and a traffic_stops view
+SCHEMA_LAYOUTS = ['wide', 'compact']
+DEFAULT_SCHEMA_LAYOUT = os.environ.get('POLICE_DB_SCHEMA', 'wide')
+
+# Errors a query can raise on any of the backends
+DATABASE_ERRORS = tuple(error for error in (
+    mysql.connector.Error if mysql else None,
+    sqlite3.Error,
+    duckdb.Error if duckdb else None,
+    # pd.read_sql wraps driver errors of DB-API connections
+    getattr(pd.errors, 'DatabaseError', None),
+) if error is not None)
+
+# Errors of a write the database refuses, like a duplicate key, as opposed to failing to run it
+INTEGRITY_ERRORS = tuple(error for error in (
+    mysql.connector.IntegrityError if mysql else None,
+    sqlite3.IntegrityError,
+    duckdb.IntegrityError if duckdb else None,
+) if error is not None)
+
+# Errors of a value the column cannot hold, like an over-long string or an unparseable date
+DATA_ERRORS = tuple(error for error in (
+    mysql.connector.DataError if mysql else None,
+    sqlite3.DataError,
+    # ConversionException and OutOfRangeException derive from it
+    duckdb.DataError if duckdb else None,
+) if error is not None)
+
+
+def get_backend_name(backend=None):
+    """Resolve the backend to use, from the argument or POLICE_DB_BACKEND"""
+    backend = (backend or DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def get_schema_layout(layout=None):
+    """Resolve the table layout, from the argument or POLICE_DB_SCHEMA"""
+    layout = (layout or DEFAULT_SCHEMA_LAYOUT).lower()
+    if layout not in SCHEMA_LAYOUTS:
+        raise ValueError(f"Unknown schema layout '{layout}', expected one of {', '.join(SCHEMA_LAYOUTS)}")
+    return layout
+
+
+def get_db_path(backend):
+    """Embedded database file, from POLICE_DB_PATH or the backend default"""
+    return os.environ.get('POLICE_DB_PATH', DEFAULT_DB_PATHS[backend])
+
+
+# ============================================================
+# DIALECT SHIM
+# ============================================================
+
+def _replace_function(query, name, replacement):
+    """Rewrite NAME(arg) calls whose argument has no nested parentheses"""
+    pattern = re.compile(rf"\b{name}\s*\(\s*([^()]+?)\s*\)", re.IGNORECASE)
+    return pattern.sub(lambda m: replacement(m.group(1)), query)
+
+
+def _substring_index(args, dialect):
+    """SUBSTRING_INDEX(str, delim, 1): the part before the first delimiter"""
+    parts = [part.strip() for part in args.split(',')]
+    if len(parts) != 3 or parts[2] != '1':
+        raise ValueError(f"Only SUBSTRING_INDEX(str, delim, 1) is supported, got ({args})")
+    text, delimiter, _ = parts
+    if dialect == 'duckdb':
+        return f"split_part({text}, {delimiter}, 1)"
+    return f"(CASE WHEN instr({text}, {delimiter}) > 0 THEN substr({text}, 1, instr({text}, {delimiter}) - 1) ELSE {text} END)"
+
+
+_DUCKDB_UNSIGNED = {'TINYINT': 'UTINYINT', 'SMALLINT': 'USMALLINT', 'INT': 'UINTEGER', 'BIGINT': 'UBIGINT'}
+
+
+def translate_query(query, dialect, has_params=False):
+    """Translate a MySQL query from the query modules to an embedded dialect"""
+    if dialect == 'mysql':
+        return query
+    query = re.sub(r"\)\s*ENGINE\s*=\s*\w+(\s+DEFAULT\s+CHARSET\s*=\s*\w+)?(\s+COLLATE\s*=\s*\w+)?", ")", query,
+                   flags=re.IGNORECASE)
+    # Neither engine refreshes a column on UPDATE, the column keeps its DEFAULT
+    query = re.sub(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP\b", "", query, flags=re.IGNORECASE)
+    query = _replace_function(query, 'SUBSTRING_INDEX', lambda args: _substring_index(args, dialect))
+    query = re.sub(r"\bAS\s+UNSIGNED\b", "AS BIGINT" if dialect == 'duckdb' else "AS INTEGER", query,
+                   flags=re.IGNORECASE)
+    query = re.sub(r"\b(TINYINT|SMALLINT|INT|BIGINT)\s+UNSIGNED\b",
+                   lambda m: _DUCKDB_UNSIGNED[m.group(1).upper()] if dialect == 'duckdb' else m.group(1), query,
+                   flags=re.IGNORECASE)
+    if dialect == 'sqlite':
+        query = _replace_function(query, 'HOUR', lambda arg: f"CAST(strftime('%H', {arg}) AS INTEGER)")
+        query = _replace_function(query, 'MINUTE', lambda arg: f"CAST(strftime('%M', {arg}) AS INTEGER)")
+        query = _replace_function(query, 'YEAR', lambda arg: f"CAST(strftime('%Y', {arg}) AS INTEGER)")
+        query = _replace_function(query, 'MONTH', lambda arg: f"CAST(strftime('%m', {arg}) AS INTEGER)")
+        query = _replace_function(query, 'TIMESTAMP', lambda args: "datetime({} || ' ' || {})".format(
+            *[part.strip() for part in args.split(',')]))
+    else:
+        # DuckDB generated columns are computed on read and cannot be stored
+        query = re.sub(r"\bSTORED\b", "VIRTUAL", query, flags=re.IGNORECASE)
+        query = _replace_function(query, 'TIMESTAMP', lambda args: "({} + {})".format(
+            *[part.strip() for part in args.split(',')]))
+    # Embedded tables have a single unique key, so the upsert needs no conflict target
+    match = re.search(r"ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$", query, flags=re.IGNORECASE | re.DOTALL)
+    if match:
+        updates = re.sub(r"VALUES\s*\(\s*(\w+)\s*\)", r"excluded.\1", match.group(1), flags=re.IGNORECASE)
+        query = query[:match.start()] + f"ON CONFLICT DO UPDATE SET {updates}"
+    if has_params:
+        query = query.replace('%s', '?')
+    return query
+
+
+# ============================================================
+# CONNECTIONS
+# ============================================================
+
+class EmbeddedCursor:
+    """DB-API cursor that accepts the MySQL dialect and %s placeholders
+
+    A DuckDB cursor is a connection of its own, so an explicit transaction
+    must stay on one cursor
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.dialect = connection.dialect
+        self.cursor = connection.raw.cursor()
+
+    def execute(self, query, params=None):
+        with self.connection.lock:
+            self.cursor.execute(translate_query(query, self.dialect, params is not None), params or ())
+        return self
+
+    def executemany(self, query, rows):
+        with self.connection.lock:
+            self.cursor.executemany(translate_query(query, self.dialect, True), rows)
+        return self
+
+    def insert_frame(self, table_name, frame):
+        """Bulk-insert a DataFrame whose columns match table columns"""
+        columns = ', '.join(frame.columns)
+        with self.connection.lock:
+            if self.dialect == 'duckdb':
+                # DuckDB scans the DataFrame directly, without per-row parameters
+                self.cursor.register('incoming_frame', frame)
+                try:
+                    self.cursor.execute(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM incoming_frame")
+                finally:
+                    self.cursor.unregister('incoming_frame')
+            else:
+                values = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+                placeholders = ', '.join(['?'] * len(frame.columns))
+                self.cursor.executemany(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})", values)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def close(self):
+        self.cursor.close()
+
+
+class EmbeddedConnection:
+    """Connection to an embedded engine with the subset of the mysql.connector API the scripts use"""
+
+    def __init__(self, dialect, path):
+        self.dialect = dialect
+        self.path = path
+        if dialect == 'duckdb':
+            if duckdb is None:
+                raise ImportError("duckdb is not installed, use POLICE_DB_BACKEND=sqlite or pip install duckdb")
+            self.raw = duckdb.connect(path)
+            # DuckDB cursors are independent connections, safe to use from any thread
+            self.lock = _NoLock()
+        else:
+            self.raw = sqlite3.connect(path, check_same_thread=False)
+            self.lock = threading.RLock()
+
+    def cursor(self):
+        return EmbeddedCursor(self)
+
+    def commit(self):
+        if self.dialect == 'sqlite':
+            with self.lock:
+                self.raw.commit()
+
+    def rollback(self):
+        if self.dialect == 'sqlite':
+            with self.lock:
+                self.raw.rollback()
+
+    def is_connected(self):
+        return True
+
+    def get_server_info(self):
+        if self.dialect == 'duckdb':
+            return f"DuckDB {duckdb.__version__} ({self.path})"
+        return f"SQLite {sqlite3.sqlite_version} ({self.path})"
+
+    def close(self):
+        self.raw.close()
+
+
+class _NoLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def connect_backend(backend=None, db_config=None):
+    """Open a connection to the selected backend"""
+    backend = get_backend_name(backend)
+    if backend == 'mysql':
+        if mysql is None:
+            raise ImportError("mysql-connector-python is not installed, use POLICE_DB_BACKEND=duckdb or sqlite")
+        return mysql.connector.connect(**(db_config or {}))
+    return EmbeddedConnection(backend, get_db_path(backend))
+
+
+def is_embedded(connection):
+    """Check whether a connection goes to an embedded engine"""
+    return isinstance(connection, EmbeddedConnection)
+
+
+def read_query(connection, query, params=None):
+    """Run a SELECT and return a DataFrame, on any backend"""
+    if not is_embedded(connection):
+        return pd.read_sql(query, connection, params=params)
+    query = translate_query(query, connection.dialect, params is not None)
+    if connection.dialect == 'duckdb':
+        return connection.raw.cursor().execute(query, params or ()).df()
+    with connection.lock:
+        return pd.read_sql(query, connection.raw, params=params)
@@ -0,0 +1,171 @@
+"""
+Incremental Preprocessing for Traffic Stops Exports
+Remembers which bytes of each input file were already cleaned (size plus a
+hash of that prefix) and the merged column profile, so a rerun only cleans
+rows appended since the last run
+
+Missing values are filled with the medians and modes of everything seen so
+far. Partitions written by earlier runs keep the fill values of their run,
+only a rebuild (delete the state file) fills every row from the final profile.
+Columns with more than max_distinct values get medians estimated from their
+bucket counts, as refining them would read every earlier row again
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from column_profile import *
+from parallel_preprocessing import clean_file, profile_file
+
+STATE_FILE_NAME = '_preprocessing_state.json'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def prefix_hashes(file_path, sizes):
+    """SHA-256 of the first `size` bytes of a file for each of `sizes`, in one read"""
+    digest = hashlib.sha256()
+    hashes = {}
+    position = 0
+    with open(file_path, 'rb') as handle:
+        for size in sorted(set(sizes)):
+            while position < size:
+                block = handle.read(min(HASH_BLOCK_SIZE, size - position))
+                if not block:
+                    break
+                digest.update(block)
+                position += len(block)
+            hashes[size] = digest.copy().hexdigest()
+    return hashes
+
+
+def load_state(output_dir):
+    """Load the saved state of the previous run, if any"""
+    state_path = os.path.join(output_dir, STATE_FILE_NAME)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as handle:
+        state = json.load(handle)
+    state['profile'] = profile_from_json(state['profile'])
+    return state
+
+
+def save_state(output_dir, state):
+    """Persist state atomically next to the cleaned output"""
+    state_path = os.path.join(output_dir, STATE_FILE_NAME)
+    data = dict(state)
+    data['profile'] = profile_to_json(state['profile'])
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as handle:
+        json.dump(data, handle)
+    os.replace(tmp_path, state_path)
+
+
+def is_partitioned_output(output_dir):
+    """Whether a directory holds nothing but this tool's year= partitions and state file"""
+    return all(name.startswith('year=') or name.startswith(STATE_FILE_NAME) for name in os.listdir(output_dir))
+
+
+def reset_output(output_dir):
+    """Empty an output directory for a rebuild, refusing one that holds anything else"""
+    if os.path.isdir(output_dir):
+        # --output may name a directory of inputs or the working directory by mistake
+        if not is_partitioned_output(output_dir):
+            raise ValueError(f"{output_dir} holds files that are not a partitioned output, not deleting it; "
+                             f"choose an empty or new --output directory")
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+
+def plan_new_work(file_paths, state):
+    """Work out the byte offset to resume from for each input file
+
+    Returns a list of (file_path, start_offset, file_state) to process, or None
+    when a previously cleaned file was modified in place and a full rebuild is
+    needed. file_state is the size and hash to save once the file is cleaned,
+    hashed in the same read that checks the previously cleaned prefix
+    """
+    seen = state['files'] if state else {}
+    work = []
+    for file_path in file_paths:
+        size = os.path.getsize(file_path)
+        previous = seen.get(os.path.abspath(file_path))
+        if previous is not None and size < previous['size']:
+            print(f"  {file_path} changed since the last run")
+            return None
+        if previous is not None and size == previous['size']:
+            # Unchanged sizes are still hashed, an edit in place keeps the size
+            if prefix_hashes(file_path, [size])[size] != previous['prefix_sha256']:
+                print(f"  {file_path} changed since the last run")
+                return None
+            continue
+        start_offset = previous['size'] if previous else 0
+        hashes = prefix_hashes(file_path, [start_offset, size])
+        if previous is not None and hashes[start_offset] != previous['prefix_sha256']:
+            print(f"  {file_path} changed since the last run")
+            return None
+        work.append((file_path, start_offset, {'size': size, 'prefix_sha256': hashes[size]}))
+    return work
+
+
+def _plan_signature(plan):
+    return {'empty_cols': sorted(plan['empty_cols']), 'dtypes': plan['dtypes']}
+
+
+def clean_incremental(file_paths, output_dir, output_format='parquet', max_distinct=DEFAULT_MAX_DISTINCT):
+    """Clean only rows appended since the last run and add them to the partitioned output"""
+    state = load_state(output_dir)
+    if state is not None and state['format'] != output_format:
+        print(f"Output format changed from {state['format']} to {output_format}, rebuilding")
+        state = None
+
+    work = plan_new_work(file_paths, state)
+    if work is None:
+        state = None
+        work = plan_new_work(file_paths, None)
+    if state is None:
+        reset_output(output_dir)
+
+    if not work:
+        print("No new rows since the last run")
+        return state
+
+    # Merge statistics of the new rows into the cached profile instead of rescanning history
+    profile = state['profile'] if state else new_profile()
+    for file_path, start_offset, _ in work:
+        partial = profile_file(file_path, max_distinct=max_distinct, start_offset=start_offset)
+        profile = merge_profiles(profile, partial, max_distinct)
+    plan = resolve_cleaning_plan(profile)
+    bucketed = inexact_columns(profile)
+    if bucketed:
+        print("Medians estimated within half a bucket for: " +
+              ', '.join(f"{col} (width {width:g})" for col, width in bucketed.items()))
+
+    if state is not None and _plan_signature(plan) != state['plan_signature']:
+        # New rows filled a column that was empty or changed a column's type
+        print("Column layout changed, rebuilding from scratch")
+        reset_output(output_dir)
+        return clean_incremental(file_paths, output_dir, output_format, max_distinct)
+
+    # Two runs within the same second must not overwrite each other's parts
+    run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    files = dict(state['files']) if state else {}
+    new_rows = 0
+    for i, (file_path, start_offset, file_state) in enumerate(work):
+        new_rows += clean_file(file_path, plan, output_dir, output_format, i,
+                               start_offset=start_offset, part_prefix=f"part-{run_id}")
+        files[os.path.abspath(file_path)] = file_state
+
+    state = {
+        'format': output_format,
+        'files': files,
+        'profile': profile,
+        'plan_signature': _plan_signature(plan),
+        'fill_values': plan['fill_values'],
+    }
+    save_state(output_dir, state)
+    print(f"Cleaned {new_rows:,} new rows")
+    return state
@@ -0,0 +1,103 @@
+"""
+Index Migrations for the Traffic Stops Table
+Applies the INDEX_MIGRATIONS versions an existing table is missing and
+records each one in schema_migrations, so a new index ships as a numbered
+migration instead of a table rebuild; a migration may also drop indexes its
+new ones make redundant. Tables built by step 2 already carry every migrated
+index and are recorded as up to date
+"""
+
+from db_backend import is_embedded
+from sql_queries import *
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+def _fetch_column(connection, query):
+    cursor = connection.cursor()
+    cursor.execute(query)
+    values = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return values
+
+
+def applied_versions(connection):
+    """Migration versions already applied, creating schema_migrations if needed"""
+    cursor = connection.cursor()
+    cursor.execute(get_create_migrations_table_query(MIGRATIONS_TABLE))
+    cursor.close()
+    return set(_fetch_column(connection, get_applied_migrations_query(MIGRATIONS_TABLE)))
+
+
+def pending_migrations(connection):
+    """INDEX_MIGRATIONS entries not applied yet, oldest first"""
+    applied = applied_versions(connection)
+    return [migration for migration in INDEX_MIGRATIONS if migration[0] not in applied]
+
+
+def index_names(connection, table_name):
+    """Names of a table's indexes as TABLE_INDEXES gives them"""
+    if is_embedded(connection):
+        # Embedded index names are prefixed with their table, see get_add_embedded_indexes_queries
+        prefix = f"{table_name}_"
+        names = _fetch_column(connection, get_embedded_index_names_query(table_name, connection.dialect))
+        return {name[len(prefix):] if name.startswith(prefix) else name for name in names}
+    return set(_fetch_column(connection, get_index_names_query(table_name)))
+
+
+def add_indexes(connection, table_name, indexes):
+    """Build the indexes a table does not have yet; returns the ones built"""
+    existing = index_names(connection, table_name)
+    missing = [index for index in indexes if index[0] not in existing]
+    if missing:
+        cursor = connection.cursor()
+        if is_embedded(connection):
+            for query in get_add_embedded_indexes_queries(table_name, missing):
+                cursor.execute(query)
+        else:
+            cursor.execute(get_add_indexes_query(table_name, missing))
+        cursor.close()
+    return missing
+
+
+def drop_indexes(connection, table_name, names):
+    """Drop the named indexes a table still has; returns the ones dropped"""
+    existing = index_names(connection, table_name)
+    present = [name for name in names if name in existing]
+    if present:
+        cursor = connection.cursor()
+        if is_embedded(connection):
+            for query in get_drop_embedded_indexes_queries(table_name, present):
+                cursor.execute(query)
+        else:
+            cursor.execute(get_drop_indexes_query(table_name, present))
+        cursor.close()
+    return present
+
+
+def apply_migrations(connection, table_name, compact=False):
+    """Apply pending migrations to table_name, the fact table in the compact layout; returns them
+
+    Indexes are built, then the redundant ones dropped, before the version is
+    recorded, so a rerun after a failure skips what is done and finishes the migration
+    """
+    pending = pending_migrations(connection)
+    cursor = connection.cursor()
+    for version, description, indexes, dropped in pending:
+        built = add_indexes(connection, table_name, compact_indexes(indexes) if compact else indexes)
+        removed = drop_indexes(connection, table_name, dropped)
+        cursor.execute(get_record_migration_query(MIGRATIONS_TABLE), (version, description))
+        connection.commit()
+        print(f"✓ Applied migration {version}: {description} "
+              f"({len(built)} index(es) built, {len(removed)} dropped)")
+    cursor.close()
+    return pending
+
+
+def mark_migrations_applied(connection):
+    """Record every migration as applied, for a table just built with all of TABLE_INDEXES"""
+    cursor = connection.cursor()
+    for version, description, *_ in pending_migrations(connection):
+        cursor.execute(get_record_migration_query(MIGRATIONS_TABLE), (version, description))
+    connection.commit()
+    cursor.close()
@@ -0,0 +1,54 @@
+"""
+Keyset Pagination Helpers for the Traffic Stops Dashboard
+Turns the last row of a page into the cursor the next page starts after, and
+the cursor into the parameters of get_keyset_condition
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _python_value(value):
+    # Database drivers bind plain Python values, not numpy or pandas scalars
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, pd.Timedelta):
+        return value.to_pytimedelta()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def page_cursor(page, sort_key):
+    """Sort key values of the last row of a page"""
+    last = page.iloc[-1]
+    return tuple(_python_value(last[column]) for column, _ in sort_key)
+
+
+def keyset_params(cursor):
+    """Parameters of get_keyset_condition: the first i + 1 cursor values for its i-th term"""
+    return tuple(value for i in range(len(cursor)) for value in cursor[:i + 1])
+
+
+def page_count(total_rows, page_size):
+    """Number of pages, at least one so an empty result still has a page"""
+    return max(1, -(-int(total_rows) // page_size))
+
+
+def iter_pages(read_page, page_query, sort_key, params=()):
+    """Every page of a keyset-paged query in turn, for exports that need all rows
+
+    read_page(query, params) runs one page query and page_query(after) builds it
+    as in show_paged_table; each page starts after the last row of the previous
+    one, so memory holds one page at a time
+    """
+    cursor = None
+    while True:
+        if cursor is None:
+            page = read_page(page_query(False), tuple(params) or None)
+        else:
+            page = read_page(page_query(True), (*params, *keyset_params(cursor)))
+        if page.empty:
+            return
+        yield page
+        cursor = page_cursor(page, sort_key)
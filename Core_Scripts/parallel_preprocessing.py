@@ -0,0 +1,124 @@
+"""
+Parallel Multi-File Preprocessing for Traffic Stops Exports
+Profiles and cleans many export files across CPU cores and writes the
+output partitioned by year and country
+"""
+
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from column_profile import *
+from columnar_output import ParquetChunkWriter
+from traffic_schema import read_dtypes
+
+PARTITION_CHUNK_ROWS = 200000
+
+
+def resolve_input_files(pattern):
+    """Expand a directory or glob pattern into a sorted list of CSV files"""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(glob.glob(pattern))
+
+
+def read_csv_chunks(file_path, chunk_size=PARTITION_CHUNK_ROWS, start_offset=0):
+    """Read a CSV in chunks, optionally starting at a byte offset past the header"""
+    if start_offset == 0:
+        yield from pd.read_csv(file_path, chunksize=chunk_size, dtype=read_dtypes())
+        return
+    columns = pd.read_csv(file_path, nrows=0).columns.tolist()
+    with open(file_path, 'rb') as handle:
+        handle.seek(start_offset)
+        yield from pd.read_csv(handle, names=columns, header=None, chunksize=chunk_size, dtype=read_dtypes())
+
+
+def profile_file(file_path, chunk_size=PARTITION_CHUNK_ROWS, max_distinct=DEFAULT_MAX_DISTINCT,
+                 start_offset=0):
+    """Worker: build a partial profile for one file"""
+    profile = new_profile()
+    for chunk in read_csv_chunks(file_path, chunk_size, start_offset):
+        update_profile(profile, chunk, max_distinct)
+    return profile
+
+
+def range_counts_file(file_path, ranges, chunk_size=PARTITION_CHUNK_ROWS):
+    """Worker: exact counts of one file's values inside the median ranges (count_in_ranges)"""
+    counts = {}
+    for chunk in read_csv_chunks(file_path, chunk_size):
+        count_in_ranges(counts, chunk, ranges)
+    return counts
+
+
+def _partition_value(value):
+    """Make a partition value safe to use as a directory name"""
+    text = re.sub(r'[^0-9A-Za-z_.-]+', '_', str(value)).strip('_')
+    return text or 'Unknown'
+
+
+def _partition_keys(chunk):
+    years = pd.to_datetime(chunk['stop_date'], errors='coerce').dt.year
+    years = years.astype('Int64').astype(str).replace('<NA>', 'Unknown')
+    countries = chunk['country_name'].astype(str).map(_partition_value)
+    return years, countries
+
+
+def clean_file(file_path, plan, output_dir, output_format='parquet', file_index=0,
+               chunk_size=PARTITION_CHUNK_ROWS, start_offset=0, part_prefix='part'):
+    """Worker: clean one file and write its rows into year/country partitions"""
+    writers = {}
+    rows = 0
+    for chunk in read_csv_chunks(file_path, chunk_size, start_offset):
+        chunk = clean_chunk(chunk, plan)
+        years, countries = _partition_keys(chunk)
+        for (year, country), part in chunk.groupby([years, countries], sort=False):
+            part_dir = os.path.join(output_dir, f"year={year}", f"country={country}")
+            os.makedirs(part_dir, exist_ok=True)
+            part_file = os.path.join(part_dir, f"{part_prefix}-{file_index:05d}.{output_format}")
+            if output_format == 'parquet':
+                if part_file not in writers:
+                    writers[part_file] = ParquetChunkWriter(part_file)
+                writers[part_file].write(part)
+            else:
+                new_file = part_file not in writers
+                writers[part_file] = None
+                part.to_csv(part_file, index=False, mode='w' if new_file else 'a', header=new_file)
+        rows += len(chunk)
+
+    for writer in writers.values():
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def clean_files_parallel(file_paths, output_dir, output_format='parquet', workers=None,
+                         max_distinct=DEFAULT_MAX_DISTINCT):
+    """Profile and clean many files in a process pool with dataset-wide rules"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Pass 1: partial statistics per file, merged into one dataset-wide profile
+        profile = new_profile()
+        partials = pool.map(profile_file, file_paths,
+                            [PARTITION_CHUNK_ROWS] * len(file_paths), [max_distinct] * len(file_paths))
+        for partial in partials:
+            profile = merge_profiles(profile, partial, max_distinct)
+        plan = resolve_cleaning_plan(profile)
+
+        # Columns with more than max_distinct values: count the values next to the median exactly
+        ranges = median_ranges(profile, plan)
+        if ranges:
+            counts = {}
+            for partial in pool.map(range_counts_file, file_paths, [ranges] * len(file_paths)):
+                merge_range_counts(counts, partial)
+            plan = exact_medians(plan, ranges, counts)
+
+        # Pass 2: clean every file with the shared plan
+        os.makedirs(output_dir, exist_ok=True)
+        futures = [
+            pool.submit(clean_file, path, plan, output_dir, output_format, i)
+            for i, path in enumerate(file_paths)
+        ]
+        rows = sum(future.result() for future in futures)
+    return profile, plan, rows
@@ -0,0 +1,175 @@
+"""
+Vehicle Plate Search Index for the Traffic Stops Dashboard
+Keeps every known plate in memory for Vehicle Lookup: a sorted list answers
+prefix (autocomplete) searches with bisect, and a trigram index narrows fuzzy
+searches down to a few candidates that are then checked with a bounded edit
+distance, so partial or misread plates never need a LIKE '%...%' table scan.
+New plates are added incrementally as stops are inserted
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+MAX_EDIT_DISTANCE = 2
+MAX_RESULTS = 20
+# Fuzzy candidates checked with the exact edit distance, best trigram overlap first
+MAX_CANDIDATES = 500
+PAD = '$'
+
+_NOT_PLATE_CHARACTER = re.compile(r'[^0-9A-Z]')
+
+
+def normalize_plate(plate):
+    """Upper-case a plate and drop spaces, dashes and other separators"""
+    return _NOT_PLATE_CHARACTER.sub('', str(plate).upper())
+
+
+def trigrams(text):
+    """Trigrams of a padded string as integer codes; each edit changes at most three of them"""
+    padded = (PAD * 2 + text + PAD * 2).encode()
+    return {padded[i] << 16 | padded[i + 1] << 8 | padded[i + 2] for i in range(len(padded) - 2)}
+
+
+def trigram_postings(keys):
+    """{trigram code: plate ids} for a list of normalized plates, computed with numpy"""
+    if not keys:
+        return {}
+    width = max(len(key) for key in keys)
+    lengths = np.fromiter((len(key) for key in keys), dtype=np.int64, count=len(keys))
+    chars = np.frombuffer(np.array(keys, dtype=f'S{width}').tobytes(), dtype=np.uint8).reshape(len(keys), width)
+    padded = np.full((len(keys), width + 4), ord(PAD), dtype=np.uint32)
+    padded[:, 2:width + 2] = chars
+    # Short plates are padded right after their last character, like trigrams() does
+    padded[np.arange(width + 4) >= lengths[:, None] + 2] = ord(PAD)
+    codes = padded[:, :-2] << 16 | padded[:, 1:-1] << 8 | padded[:, 2:]
+    codes[np.arange(width + 2) >= lengths[:, None] + 2] = np.iinfo(np.uint32).max
+    # Count a trigram once per plate even when it repeats
+    codes.sort(axis=1)
+    keep = np.ones(codes.shape, dtype=bool)
+    keep[:, 1:] = codes[:, 1:] != codes[:, :-1]
+    keep &= codes != np.iinfo(np.uint32).max
+    plate_ids = np.broadcast_to(np.arange(len(keys), dtype=np.uint32)[:, None], codes.shape)[keep]
+    codes = codes[keep]
+    order = np.argsort(codes, kind='stable')
+    codes, plate_ids = codes[order], plate_ids[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    return {int(codes[start]): array('I', plate_ids[start:end].tobytes()) for start, end in zip(starts, ends)}
+
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance of a and b, or None as soon as it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+class PlateIndex:
+    """Thread-safe prefix and fuzzy index over vehicle plates"""
+
+    def __init__(self, plates=()):
+        self._lock = threading.Lock()
+        # Plate ids are positions in _plates; _sorted_keys (normalized plates) and
+        # _sorted_ids are kept in the same sorted order for prefix search
+        self._plates = []
+        self._ids = {}
+        keys = []
+        for plate in plates:
+            key = normalize_plate(plate) if plate is not None else ''
+            if key and key not in self._ids:
+                self._ids[key] = len(self._plates)
+                self._plates.append(plate)
+                keys.append(key)
+        order = np.argsort(np.array(keys, dtype=str), kind='stable') if keys else []
+        self._sorted_keys = [keys[i] for i in order]
+        self._sorted_ids = [int(i) for i in order]
+        self._postings = trigram_postings(keys)
+
+    def __len__(self):
+        return len(self._plates)
+
+    def add(self, plate):
+        """Add a plate seen in a new stop; returns False when it was already indexed"""
+        key = normalize_plate(plate) if plate is not None else ''
+        with self._lock:
+            if not key or key in self._ids:
+                return False
+            plate_id = len(self._plates)
+            self._plates.append(plate)
+            self._ids[key] = plate_id
+            position = bisect_left(self._sorted_keys, key)
+            self._sorted_keys.insert(position, key)
+            self._sorted_ids.insert(position, plate_id)
+            for gram in trigrams(key):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = array('I')
+                posting.append(plate_id)
+        return True
+
+    def prefix(self, text, limit=MAX_RESULTS):
+        """Plates starting with text, in sorted order"""
+        key = normalize_plate(text)
+        with self._lock:
+            start = bisect_left(self._sorted_keys, key)
+            matches = []
+            for normalized, plate_id in zip(self._sorted_keys[start:start + limit], self._sorted_ids[start:start + limit]):
+                if not normalized.startswith(key):
+                    break
+                matches.append(self._plates[plate_id])
+        return matches
+
+    def fuzzy(self, text, limit=MAX_RESULTS, max_distance=MAX_EDIT_DISTANCE):
+        """(plate, distance) pairs within max_distance edits of text, closest first"""
+        key = normalize_plate(text)
+        if not key:
+            return []
+        grams = trigrams(key)
+        with self._lock:
+            postings = [np.frombuffer(self._postings[gram], dtype=np.uint32)
+                        for gram in grams if gram in self._postings and len(self._postings[gram])]
+            if not postings:
+                return []
+            shared = np.bincount(np.concatenate(postings))
+            # A plate within k edits shares at least len(grams) - 3k trigrams with the text
+            candidates = np.flatnonzero(shared >= max(1, len(grams) - 3 * max_distance))
+            if len(candidates) > MAX_CANDIDATES:
+                best = np.argpartition(shared[candidates], -MAX_CANDIDATES)[-MAX_CANDIDATES:]
+                candidates = candidates[best]
+            plates = [(self._plates[plate_id], int(shared[plate_id])) for plate_id in candidates.tolist()]
+
+        matches = []
+        for plate, overlap in plates:
+            distance = bounded_edit_distance(key, normalize_plate(plate), max_distance)
+            if distance is not None:
+                matches.append((distance, -overlap, plate))
+        matches.sort()
+        return [(plate, distance) for distance, _, plate in matches[:limit]]
+
+    def search(self, text, limit=MAX_RESULTS, max_distance=MAX_EDIT_DISTANCE):
+        """Ranked (plate, distance) candidates: exact match, then prefix matches, then fuzzy ones
+
+        Prefix matches count as distance 0, they are what an officer typing a plate expects
+        """
+        results = {}
+        for plate in self.prefix(text, limit):
+            results[plate] = 0
+        if len(results) < limit:
+            for plate, distance in self.fuzzy(text, limit, max_distance):
+                results.setdefault(plate, distance)
+        key = normalize_plate(text)
+        ranked = sorted(results.items(), key=lambda item: (item[1], normalize_plate(item[0]) != key,
+                                                          normalize_plate(item[0])))
+        return ranked[:limit]
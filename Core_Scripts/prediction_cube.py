@@ -0,0 +1,136 @@
+"""
+Prediction Cube for the "Add Log & Predict Outcome" Form
+Holds stop, arrest, search and drug-stop counts per (violation, driver race,
+driver gender, driver age) with prefix sums over age, so the similar-cases
+statistics of get_prediction_stats_query for any age window come from two
+array lookups instead of a table scan, plus outcome counts per violation for
+get_most_common_outcome_query. Built from two GROUP BY queries and updated
+as the form inserts stops
+"""
+
+import math
+import threading
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pandas as pd
+
+AGE_WINDOW = 5
+# Counters kept per cell, in the order of get_prediction_cube_query's SUM columns
+COUNTERS = ['stops', 'arrests', 'searches', 'drug_stops']
+GROUP_COLUMNS = ['violation', 'driver_race', 'driver_gender']
+# MySQL's AVG of an integer column is a DECIMAL with this many decimals (div_precision_increment)
+AVG_DECIMALS = 4
+
+
+def avg_percentage(part, whole, dialect='mysql', digits=1):
+    """ROUND(AVG(flag) * 100, digits) for part set flags out of whole rows, as the dialect computes it
+
+    MySQL rounds half away from zero twice on exact decimals: AVG to AVG_DECIMALS
+    decimals, then the percentage. The embedded engines average in floating
+    point; SQLite rounds the printed value (15 significant digits), DuckDB the
+    double itself
+    """
+    if dialect == 'mysql':
+        average = (2 * part * 10 ** AVG_DECIMALS + whole) // (2 * whole)
+        # average * 100 has AVG_DECIMALS - 2 decimals, drop the ones beyond digits
+        step = 10 ** (AVG_DECIMALS - 2 - digits)
+        return (2 * average + step) // (2 * step) / 10 ** digits
+    value = part / whole * 100
+    if dialect == 'sqlite':
+        return float(Decimal(format(value, '.15g')).quantize(Decimal(1).scaleb(-digits), ROUND_HALF_UP))
+    return math.floor(value * 10 ** digits + 0.5) / 10 ** digits
+
+
+class PredictionCube:
+    """Thread-safe similar-case statistics and most common outcomes"""
+
+    def __init__(self, cells, outcomes, dialect='mysql'):
+        """cells: get_prediction_cube_query rows; outcomes: get_outcome_counts_query rows
+
+        dialect: the backend they were read from, whose rounding predict() reproduces
+        """
+        self._lock = threading.Lock()
+        self.dialect = dialect
+        cells = cells.dropna(subset=GROUP_COLUMNS + ['driver_age'])
+        groups = list(zip(*(cells[column].tolist() for column in GROUP_COLUMNS)))
+        self._groups = {}
+        group_ids = np.array([self._groups.setdefault(group, len(self._groups)) for group in groups], dtype=np.int64)
+        ages = pd.to_numeric(cells['driver_age']).to_numpy(dtype=np.int64)
+        self._min_age = int(ages.min()) if len(ages) else 0
+        width = int(ages.max()) - self._min_age + 1 if len(ages) else 1
+        dense = np.zeros((len(self._groups), width, len(COUNTERS)), dtype=np.int64)
+        counts = np.column_stack([pd.to_numeric(cells[column]).to_numpy(dtype=np.int64) for column in COUNTERS])
+        np.add.at(dense, (group_ids, ages - self._min_age), counts.reshape(len(cells), len(COUNTERS)))
+        # _prefix[g, i] sums ages below _min_age + i, so a window is the difference of two rows
+        self._prefix = np.zeros((len(self._groups), width + 1, len(COUNTERS)), dtype=np.int64)
+        np.cumsum(dense, axis=1, out=self._prefix[:, 1:])
+
+        self._outcomes = {}
+        self._top_outcomes = {}
+        for violation, outcome, count in outcomes.dropna(subset=['violation', 'stop_outcome']).itertuples(index=False):
+            self._outcomes.setdefault(violation, {})[outcome] = int(count)
+        for violation, counts in self._outcomes.items():
+            self._top_outcomes[violation] = max(counts.items(), key=lambda item: item[1])
+
+    def add(self, violation, driver_age, driver_race, driver_gender, is_arrested, search_conducted,
+            drugs_related_stop, stop_outcome):
+        """Count a stop inserted by the form"""
+        with self._lock:
+            if violation is not None and stop_outcome is not None:
+                counts = self._outcomes.setdefault(violation, {})
+                counts[stop_outcome] = counts.get(stop_outcome, 0) + 1
+                top = self._top_outcomes.get(violation)
+                if top is None or counts[stop_outcome] > top[1]:
+                    self._top_outcomes[violation] = (stop_outcome, counts[stop_outcome])
+
+            group = (violation, driver_race, driver_gender)
+            if driver_age is None or None in group:
+                return
+            driver_age = int(driver_age)
+            self._cover_age(driver_age)
+            if group not in self._groups:
+                self._groups[group] = len(self._groups)
+                self._prefix = np.concatenate([self._prefix, np.zeros((1,) + self._prefix.shape[1:], dtype=np.int64)])
+            values = np.array([1, int(is_arrested), int(search_conducted), int(drugs_related_stop)], dtype=np.int64)
+            self._prefix[self._groups[group], driver_age - self._min_age + 1:] += values
+
+    def _cover_age(self, age):
+        # Widen the age axis: rows before it repeat zero, rows after it repeat the group totals
+        below = max(0, self._min_age - age)
+        above = max(0, age - (self._min_age + self._prefix.shape[1] - 2))
+        if below or above:
+            self._prefix = np.pad(self._prefix, ((0, 0), (below, 0), (0, 0)))
+            self._prefix = np.pad(self._prefix, ((0, 0), (0, above), (0, 0)), mode='edge')
+            self._min_age -= below
+
+    def _window(self, group_id, low, high):
+        # Sums over ages low..high, clipped to the ages seen so far
+        last = self._prefix.shape[1] - 1
+        start = min(max(low - self._min_age, 0), last)
+        stop = min(max(high - self._min_age + 1, 0), last)
+        return self._prefix[group_id, stop] - self._prefix[group_id, start]
+
+    def predict(self, violation, driver_age, driver_race, driver_gender, window=AGE_WINDOW):
+        """The row of get_prediction_stats_query as a dict; probabilities are None without similar cases"""
+        with self._lock:
+            group_id = self._groups.get((violation, driver_race, driver_gender))
+            if group_id is None:
+                totals = [0] * len(COUNTERS)
+            else:
+                totals = self._window(group_id, int(driver_age) - window, int(driver_age) + window).tolist()
+        stops, arrests, searches, drug_stops = totals
+        if not stops:
+            return {'similar_cases': 0, 'arrest_probability': None, 'search_probability': None,
+                    'drug_probability': None}
+        return {
+            'similar_cases': stops,
+            'arrest_probability': avg_percentage(arrests, stops, self.dialect),
+            'search_probability': avg_percentage(searches, stops, self.dialect),
+            'drug_probability': avg_percentage(drug_stops, stops, self.dialect),
+        }
+
+    def most_common_outcome(self, violation):
+        """(stop_outcome, count) of get_most_common_outcome_query, or None for an unknown violation"""
+        with self._lock:
+            return self._top_outcomes.get(violation)
@@ -0,0 +1,125 @@
+"""
+Query Result Cache for the Traffic Stops Dashboard
+Keeps query results keyed by normalized SQL text and parameters, shared by
+all dashboard sessions, with a per-entry TTL, an LRU memory cap and
+invalidation of every result that read a given table
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL_SECONDS = 300
+MAX_CACHE_MB = 256
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?", re.IGNORECASE)
+
+
+def normalize_query(query):
+    """Collapse whitespace so formatting differences map to one cache key"""
+    return ' '.join(query.split())
+
+
+def tables_read(query):
+    """Names of the tables a query reads"""
+    return {name.lower() for name in _TABLE_PATTERN.findall(query)}
+
+
+def result_size_bytes(df):
+    """Memory held by a cached DataFrame"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class QueryCache:
+    """Thread-safe LRU cache of query results with TTL and per-table invalidation"""
+
+    def __init__(self, max_bytes=MAX_CACHE_MB * 1024 * 1024, default_ttl=DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query, params=None):
+        return normalize_query(query), tuple(params) if params is not None else None
+
+    def get(self, query, params=None):
+        """Cached result, or None when missing or expired"""
+        return self.lookup(query, params)[0]
+
+    def lookup(self, query, params=None):
+        """(cached result, its size in bytes), or (None, 0) when missing or expired"""
+        key = self.key(query, params)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['expires_at'] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None, 0
+            self.entries.move_to_end(key)
+            self.hits += 1
+            # Callers get their own copy, the cached frame is shared by every session
+            return entry['result'].copy(), entry['size']
+
+    def put(self, query, result, params=None, ttl=None, size=None):
+        """Store a result, evicting least recently used entries over the memory cap
+
+        size: result_size_bytes(result) when the caller already measured it
+        """
+        key = self.key(query, params)
+        size = result_size_bytes(result) if size is None else size
+        if size > self.max_bytes:
+            return
+        # A copy, so a caller changing the frame it got on a miss cannot change the cached one
+        result = result.copy()
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = {
+                'result': result,
+                'expires_at': time.monotonic() + (self.default_ttl if ttl is None else ttl),
+                'size': size,
+                'tables': tables_read(query),
+            }
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_table(self, table_name):
+        """Drop every cached result that read table_name; returns how many were dropped"""
+        table_name = table_name.lower()
+        with self._lock:
+            stale = [key for key, entry in self.entries.items() if table_name in entry['tables']]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size_bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.size_bytes -= entry['size']
+
+    def stats(self):
+        """Hit, miss and size counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'size_mb': self.size_bytes / (1024 * 1024),
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,241 @@
+"""
+Query and Stage Metrics for the Traffic Stops Pipeline
+Records the wall time, rows, result bytes and cache hit or miss of dashboard
+queries, page renders and ingestion stages in a rolling in-process store,
+summarizes them as p50/p95/p99 per name and exports them as Prometheus text
+or JSON lines. A query is named after the get_*_query function that
+generated it, see name_queries
+"""
+
+import functools
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+from query_cache import normalize_query
+
+# Samples kept for the percentiles; counts and totals cover every sample ever recorded
+MAX_SAMPLES = 20000
+PERCENTILES = [50, 95, 99]
+METRIC_PREFIX = 'traffic_stops'
+# Step 2 appends its stage timings here and the dashboard's Performance page reads them
+INGEST_METRICS_FILE = 'ingest_metrics.jsonl'
+UNNAMED_QUERY_CHARS = 60
+
+
+class QueryText(str):
+    """SQL text that remembers the name of the function that generated it"""
+
+    def __new__(cls, text, query_id):
+        query = super().__new__(cls, text)
+        query.query_id = query_id
+        return query
+
+
+def query_id(query):
+    """Name of the function that generated query, or its start for hand-written SQL"""
+    return getattr(query, 'query_id', None) or normalize_query(query)[:UNNAMED_QUERY_CHARS]
+
+
+def _named(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        # Queries built around another one, like get_paged_query, keep the inner name too
+        inner = [arg.query_id for arg in args if isinstance(arg, QueryText)]
+        name = f"{function.__name__}({', '.join(inner)})" if inner else function.__name__
+        query = function(*args, **kwargs)
+        return QueryText(query, name) if isinstance(query, str) else query
+    wrapper.named_query = True
+    return wrapper
+
+
+def name_queries(namespace):
+    """Make the get_*_query functions of a module namespace return QueryText named after them"""
+    for name, function in list(namespace.items()):
+        if (name.startswith('get_') and name.endswith('_query') and callable(function)
+                and not getattr(function, 'named_query', False)):
+            namespace[name] = _named(function)
+
+
+def percentile(values, q):
+    """q-th percentile by the nearest-rank method, None without values"""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + '}'
+
+
+class MetricsStore:
+    """Thread-safe rolling window of timing samples with running totals per (kind, name)
+
+    kind: 'query', 'page' (a dashboard page render) or 'stage' (an ingestion stage)
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.samples = deque(maxlen=max_samples)
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, kind='query', page=None, rows=None, size_bytes=None, cache_hit=None,
+               error=False):
+        """Add one sample; rows, size_bytes and cache_hit are None where they do not apply"""
+        sample = {
+            'timestamp': time.time(),
+            'kind': kind,
+            'name': name,
+            'page': page,
+            'seconds': seconds,
+            'rows': rows,
+            'bytes': size_bytes,
+            'cache_hit': cache_hit,
+            'error': error,
+        }
+        with self._lock:
+            self.samples.append(sample)
+            totals = self.totals.setdefault((kind, name), {
+                'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'errors': 0,
+            })
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['rows'] += rows or 0
+            totals['bytes'] += size_bytes or 0
+            totals['hits'] += cache_hit is True
+            totals['misses'] += cache_hit is False
+            totals['errors'] += error
+        return sample
+
+    @contextmanager
+    def measure(self, name, kind='stage', page=None, rows=None, size_bytes=None):
+        """Time the block; it may fill in the yielded sample's rows and bytes"""
+        sample = {'rows': rows, 'bytes': size_bytes}
+        start = time.perf_counter()
+        error = False
+        try:
+            yield sample
+        except Exception:
+            # Not BaseException: Streamlit reruns and stops raise those and are not errors
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, kind, page, sample['rows'], sample['bytes'],
+                        error=error)
+
+    def timed(self, kind='stage'):
+        """Decorator recording every call of a function under its name"""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.measure(function.__name__, kind):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def extend(self, samples):
+        """Add samples read back from a JSON lines export"""
+        for sample in samples:
+            self.record(sample['name'], sample['seconds'], sample['kind'], sample.get('page'), sample.get('rows'),
+                        sample.get('bytes'), sample.get('cache_hit'), sample.get('error', False))
+
+    def clear(self):
+        with self._lock:
+            self.samples.clear()
+            self.totals.clear()
+
+    def snapshot(self):
+        """Samples in the window, oldest first"""
+        with self._lock:
+            return list(self.samples)
+
+    def summary(self, kind='query', page=None):
+        """p50/p95/p99 in milliseconds per name over the window, slowest p95 first"""
+        samples = [sample for sample in self.snapshot()
+                   if sample['kind'] == kind and (page is None or sample['page'] == page)]
+        columns = ['name', 'calls'] + [f"p{q}_ms" for q in PERCENTILES] + ['avg_rows', 'avg_kb', 'cache_hit_rate',
+                                                                           'errors']
+        rows = []
+        groups = {}
+        for sample in samples:
+            groups.setdefault(sample['name'], []).append(sample)
+        for name, group in groups.items():
+            milliseconds = [round(sample['seconds'] * 1000, 2) for sample in group]
+            row_counts = [sample['rows'] for sample in group if sample['rows'] is not None]
+            sizes = [sample['bytes'] for sample in group if sample['bytes'] is not None]
+            lookups = [sample['cache_hit'] for sample in group if sample['cache_hit'] is not None]
+            rows.append([
+                name,
+                len(group),
+                *[percentile(milliseconds, q) for q in PERCENTILES],
+                round(sum(row_counts) / len(row_counts), 1) if row_counts else None,
+                round(sum(sizes) / len(sizes) / 1024, 1) if sizes else None,
+                round(sum(lookups) / len(lookups), 3) if lookups else None,
+                sum(sample['error'] for sample in group),
+            ])
+        df = pd.DataFrame(rows, columns=columns)
+        return df.sort_values(f"p{PERCENTILES[1]}_ms", ascending=False, kind='stable').reset_index(drop=True)
+
+    def to_prometheus(self):
+        """Prometheus text exposition: a duration summary plus row, byte and cache counters per name"""
+        samples = self.snapshot()
+        with self._lock:
+            totals = {key: dict(value) for key, value in self.totals.items()}
+        windows = {}
+        for sample in samples:
+            windows.setdefault((sample['kind'], sample['name']), []).append(sample['seconds'])
+
+        duration = f"{METRIC_PREFIX}_duration_seconds"
+        lines = [
+            f"# HELP {duration} Wall time of queries, dashboard pages and ingestion stages",
+            f"# TYPE {duration} summary",
+        ]
+        for (kind, name), total in sorted(totals.items()):
+            for q in PERCENTILES:
+                value = percentile(windows.get((kind, name), []), q)
+                if value is not None:
+                    lines.append(f"{duration}{_labels(kind=kind, name=name, quantile=q / 100)} {value:.6f}")
+            lines.append(f"{duration}_sum{_labels(kind=kind, name=name)} {total['seconds']:.6f}")
+            lines.append(f"{duration}_count{_labels(kind=kind, name=name)} {total['count']}")
+        for metric, key, help_text in [
+            ('rows_total', 'rows', "Rows returned by queries or loaded by stages"),
+            ('result_bytes_total', 'bytes', "Memory size of query results"),
+            ('errors_total', 'errors', "Queries and stages that raised an error"),
+        ]:
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} counter")
+            for (kind, name), total in sorted(totals.items()):
+                lines.append(f"{METRIC_PREFIX}_{metric}{_labels(kind=kind, name=name)} {total[key]}")
+        lookups = f"{METRIC_PREFIX}_cache_lookups_total"
+        lines.append(f"# HELP {lookups} Query cache lookups by result")
+        lines.append(f"# TYPE {lookups} counter")
+        for (kind, name), total in sorted(totals.items()):
+            if total['hits'] or total['misses']:
+                lines.append(f"{lookups}{_labels(kind=kind, name=name, result='hit')} {total['hits']}")
+                lines.append(f"{lookups}{_labels(kind=kind, name=name, result='miss')} {total['misses']}")
+        return '\n'.join(lines) + '\n'
+
+    def to_jsonl(self):
+        """The samples in the window, one JSON object per line"""
+        return ''.join(json.dumps(sample) + '\n' for sample in self.snapshot())
+
+    def write_jsonl(self, path, append=True):
+        """Write the window to a JSON lines file"""
+        with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+            f.write(self.to_jsonl())
+
+
+def read_jsonl(path):
+    """Samples of a JSON lines export"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,218 @@
+"""
+Write-Behind Queue for the Add New Log Form
+Journals each submitted record to a local append-only JSON lines file
+(flushed and fsynced) and returns; a background worker writes the queued
+records to the database in groups, one transaction per group, retrying with
+backoff while the database is unavailable. Records the database refuses
+(a duplicate natural key, a value its column cannot hold) are rejected
+instead of retried. A group that keeps failing is written one record at a
+time, so the records ahead of the failing one are written; any failure
+other than a refusal is retried, never turned into a rejection. Records
+still in the journal when the server stops are written after the next start
+
+Journal lines are {"seq", "queued_at", "record"} entries, {"rejected", "error"}
+notes and {"flushed": seq} marks meaning every entry up to seq is done; the
+file is truncated whenever the queue runs empty
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+JOURNAL_FILE = 'pending_logs.jsonl'
+# Records per group transaction, and how long the first record waits for others to join it
+MAX_GROUP_ROWS = 200
+GROUP_WAIT_SECONDS = 0.2
+# Failed groups are retried after 1, 2, 4, ... seconds, at most this long apart
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+# Failed attempts after which a group is written one record at a time
+SPLIT_AFTER_FAILURES = 3
+
+
+def read_journal(path):
+    """Entries of a journal not marked flushed yet, oldest first"""
+    if not os.path.exists(path):
+        return []
+    entries = []
+    flushed = 0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # A line torn by a crash during its write was never acknowledged
+                continue
+            if 'flushed' in item:
+                flushed = max(flushed, item['flushed'])
+            elif 'seq' in item:
+                entries.append(item)
+    return [entry for entry in entries if entry['seq'] > flushed]
+
+
+def rewrite_journal(path, entries):
+    """Atomically replace a journal with just the given entries"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class WriteBehindQueue:
+    """Durable FIFO of records written to the database by a background thread
+
+    writer(records) writes a group in one transaction and returns {index: error}
+    for the records the database rejected, raising on every other failure,
+    which is retried.
+    on_written(records) runs after each group with the records that were written.
+    Both run on the writer thread, so they get what they need when the queue is
+    built rather than looking it up per session
+    """
+
+    def __init__(self, writer, on_written=None, path=JOURNAL_FILE, max_group=MAX_GROUP_ROWS,
+                 group_wait=GROUP_WAIT_SECONDS, retry_base=RETRY_BASE_SECONDS, retry_max=RETRY_MAX_SECONDS,
+                 split_after=SPLIT_AFTER_FAILURES):
+        self.writer = writer
+        self.on_written = on_written
+        self.path = path
+        self.max_group = max_group
+        self.group_wait = group_wait
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.split_after = split_after
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = deque(read_journal(path))
+        # Appends start on a clean line: no torn last line, no entries already written
+        rewrite_journal(path, self._pending)
+        self._next_seq = self._pending[-1]['seq'] + 1 if self._pending else 1
+        self._file = open(path, 'a', encoding='utf-8')
+        self._closed = False
+        self.written = 0
+        self.groups = 0
+        self.rejected = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_group_seconds = 0.0
+        self.recovered = len(self._pending)
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def _append(self, item):
+        self._file.write(json.dumps(item) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def put(self, record):
+        """Journal a JSON-serializable record for writing; returns its sequence number once it is durable"""
+        with self._lock:
+            entry = {'seq': self._next_seq, 'queued_at': time.time(), 'record': record}
+            self._append(entry)
+            self._next_seq += 1
+            self._pending.append(entry)
+            self._changed.notify_all()
+        return entry['seq']
+
+    def _next_group(self):
+        # Waits for a record, then up to group_wait for more to join it; None once closed
+        with self._lock:
+            self._changed.wait_for(lambda: self._pending or self._closed)
+            if self._closed:
+                return None
+            self._changed.wait_for(lambda: len(self._pending) >= self.max_group or self._closed,
+                                   timeout=self.group_wait)
+            return [self._pending[i] for i in range(min(self.max_group, len(self._pending)))]
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if group is None:
+                return
+            start_time = time.perf_counter()
+            try:
+                if self.consecutive_failures >= self.split_after and len(group) > 1:
+                    self._write_singly(group)
+                    continue
+                rejected = self.writer([entry['record'] for entry in group])
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    self.consecutive_failures += 1
+                    self.last_error = str(e)
+                    delay = min(self.retry_max, self.retry_base * 2 ** (self.consecutive_failures - 1))
+                    # Sleeps on the condition so close() does not wait out the backoff
+                    self._changed.wait_for(lambda: self._closed, timeout=delay)
+                continue
+            self._done(group, rejected, time.perf_counter() - start_time)
+
+    def _write_singly(self, group):
+        # In order, each record done on its own; a failure leaves it and the ones after it queued for the retry
+        for entry in group:
+            start_time = time.perf_counter()
+            rejected = self.writer([entry['record']])
+            self._done([entry], rejected, time.perf_counter() - start_time)
+
+    def _done(self, group, rejected, seconds):
+        written = [entry['record'] for i, entry in enumerate(group) if i not in rejected]
+        follow_up_error = None
+        if self.on_written is not None and written:
+            try:
+                self.on_written(written)
+            except Exception as e:
+                # The records are in the database already, only the follow-up failed
+                follow_up_error = f"After writing logs: {e}"
+        with self._lock:
+            for i, error in rejected.items():
+                self._append({'rejected': group[i]['seq'], 'error': error})
+                self.last_error = f"Rejected log: {error}"
+            self._append({'flushed': group[-1]['seq']})
+            for _ in group:
+                self._pending.popleft()
+            if not self._pending:
+                # Everything is in the database, the journal can start over
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+            self.written += len(written)
+            self.rejected += len(rejected)
+            self.groups += 1
+            self.consecutive_failures = 0
+            self.last_group_seconds = seconds
+            if follow_up_error:
+                self.last_error = follow_up_error
+            self._changed.notify_all()
+
+    def drain(self, timeout=None):
+        """Wait until every queued record is written or rejected; False on timeout"""
+        with self._lock:
+            return self._changed.wait_for(lambda: not self._pending, timeout=timeout)
+
+    def close(self, timeout=None):
+        """Stop the worker after its current group; unwritten records stay in the journal"""
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join(timeout)
+        self._file.close()
+
+    def stats(self):
+        """Queue depth, lag of the oldest queued record and write counters"""
+        with self._lock:
+            oldest = self._pending[0]['queued_at'] if self._pending else None
+            return {
+                'depth': len(self._pending),
+                'lag_seconds': max(0.0, time.time() - oldest) if oldest is not None else 0.0,
+                'written': self.written,
+                'groups': self.groups,
+                'rejected': self.rejected,
+                'failures': self.failures,
+                'retrying': self.consecutive_failures > 0,
+                'last_error': self.last_error,
+                'last_group_ms': self.last_group_seconds * 1000,
+                'recovered': self.recovered,
+            }
@@ -3,6 +3,8 @@ Analytics SQL Queries for Traffic Stops Dashboard
 Contains medium and complex level analytical queries
 """
 
+from sql_queries import get_rollup_table_name
+
 # ============================================================
 # MEDIUM LEVEL QUERIES
 # ============================================================
@@ -98,7 +100,7 @@ def get_stops_by_time_of_day_query(table_name):
     """Time of day with most traffic stops"""
     return f"""
         SELECT 
-            HOUR(stop_time) as hour,
+            stop_hour as hour,
             COUNT(*) as stops,
             SUM(is_arrested) as arrests,
             ROUND(SUM(is_arrested) * 100.0 / COUNT(*), 2) as arrest_rate
@@ -130,7 +132,7 @@ def get_night_arrest_rate_query(table_name):
     return f"""
         SELECT 
             CASE 
-                WHEN HOUR(stop_time) BETWEEN 6 AND 17 THEN 'Day (6AM-5PM)'
+                WHEN stop_hour BETWEEN 6 AND 17 THEN 'Day (6AM-5PM)'
                 ELSE 'Night (6PM-5AM)'
             END as time_period,
             COUNT(*) as total_stops,
@@ -208,6 +210,9 @@ def get_drug_stops_by_country_query(table_name):
         ORDER BY drug_stop_rate DESC
     """
 
+# Unique sort key of the report below, for keyset pagination
+ARREST_RATE_BY_COUNTRY_VIOLATION_SORT_KEY = [('country_name', False), ('arrest_rate', True), ('violation', False)]
+
 def get_arrest_rate_by_country_violation_query(table_name):
     """Arrest rate by country and violation"""
     return f"""
@@ -244,17 +249,20 @@ def get_yearly_breakdown_by_country_query(table_name):
     """Yearly breakdown of stops and arrests by country with window functions"""
     return f"""
         SELECT 
-            YEAR(stop_date) as year,
+            stop_year as year,
             country_name,
             COUNT(*) as stops,
             SUM(is_arrested) as arrests,
             ROUND(SUM(is_arrested) * 100.0 / COUNT(*), 2) as arrest_rate,
-            SUM(COUNT(*)) OVER (PARTITION BY country_name ORDER BY YEAR(stop_date)) as cumulative_stops
+            SUM(COUNT(*)) OVER (PARTITION BY country_name ORDER BY stop_year) as cumulative_stops
         FROM {table_name}
         GROUP BY year, country_name
         ORDER BY year DESC, stops DESC
     """
 
+# Unique sort key of the report below, for keyset pagination
+VIOLATION_TRENDS_BY_AGE_RACE_SORT_KEY = [('driver_race', False), ('stops', True), ('age_group', False), ('violation', False)]
+
 def get_violation_trends_by_age_race_query(table_name):
     """Driver violation trends based on age and race"""
     return f"""
@@ -279,9 +287,9 @@ def get_time_period_analysis_query(table_name):
     """Number of stops by year, month, hour of the day"""
     return f"""
         SELECT 
-            YEAR(stop_date) as year,
-            MONTH(stop_date) as month,
-            HOUR(stop_time) as hour,
+            stop_year as year,
+            stop_month as month,
+            stop_hour as hour,
             COUNT(*) as stops,
             SUM(is_arrested) as arrests,
             SUM(search_conducted) as searches
@@ -350,3 +358,83 @@ def get_top_5_violations_arrest_rate_query(table_name):
         LIMIT 5
     """
 
+# ============================================================
+# ROLLUP-BASED QUERIES
+# ============================================================
+# Same results as the queries above, read from the stop counters rollup
+
+def get_stops_by_time_of_day_rollup_query(table_name):
+    """Time of day with most traffic stops, from the rollup"""
+    return f"""
+        SELECT 
+            stop_hour as hour,
+            SUM(stops) as stops,
+            SUM(arrests) as arrests,
+            ROUND(SUM(arrests) * 100.0 / SUM(stops), 2) as arrest_rate
+        FROM {get_rollup_table_name(table_name)}
+        GROUP BY stop_hour
+        ORDER BY stop_hour
+    """
+
+def get_night_arrest_rate_rollup_query(table_name):
+    """Night vs day arrest rates, from the rollup"""
+    return f"""
+        SELECT 
+            CASE 
+                WHEN stop_hour BETWEEN 6 AND 17 THEN 'Day (6AM-5PM)'
+                ELSE 'Night (6PM-5AM)'
+            END as time_period,
+            SUM(stops) as total_stops,
+            SUM(arrests) as arrests,
+            ROUND(SUM(arrests) * 100.0 / SUM(stops), 2) as arrest_rate,
+            SUM(searches) as searches,
+            ROUND(SUM(searches) * 100.0 / SUM(stops), 2) as search_rate
+        FROM {get_rollup_table_name(table_name)}
+        GROUP BY time_period
+    """
+
+# ============================================================
+# SHARED AGGREGATES
+# ============================================================
+# One scan per grouping with the superset of the aggregates its reports need;
+# the reports themselves are derived in memory (Core_Scripts/aggregate_reports.py)
+
+def get_violation_aggregates_query(table_name):
+    """Per-violation counters behind every violation report"""
+    return f"""
+        SELECT 
+            violation,
+            COUNT(*) as total_stops,
+            SUM(is_arrested) as arrests,
+            SUM(search_conducted) as searches,
+            SUM(drugs_related_stop) as drug_stops,
+            SUM(CASE WHEN driver_age < 25 THEN 1 ELSE 0 END) as young_stops,
+            SUM(CASE WHEN driver_age < 25 THEN is_arrested ELSE 0 END) as young_arrests,
+            SUM(CASE WHEN stop_duration IS NOT NULL AND stop_duration != 'Unknown' THEN 1 ELSE 0 END) as duration_stops,
+            SUM(CASE WHEN stop_duration IS NOT NULL AND stop_duration != 'Unknown' THEN is_arrested ELSE 0 END) as duration_arrests,
+            SUM(CASE 
+                WHEN stop_duration != 'Unknown' AND stop_duration LIKE '%-%' THEN 
+                    CAST(SUBSTRING_INDEX(stop_duration, '-', 1) AS UNSIGNED)
+                ELSE 0
+            END) as duration_minutes
+        FROM {table_name}
+        GROUP BY violation
+    """
+
+def get_country_aggregates_query(table_name):
+    """Per-country counters behind every country report"""
+    return f"""
+        SELECT 
+            country_name,
+            COUNT(*) as total_stops,
+            SUM(is_arrested) as arrests,
+            SUM(search_conducted) as searches,
+            SUM(drugs_related_stop) as drug_stops,
+            SUM(driver_age) as age_sum,
+            COUNT(driver_age) as age_count,
+            SUM(CASE WHEN driver_gender = 'M' THEN 1 ELSE 0 END) as male_count,
+            SUM(CASE WHEN driver_gender = 'F' THEN 1 ELSE 0 END) as female_count,
+            COUNT(DISTINCT driver_race) as race_diversity
+        FROM {table_name}
+        GROUP BY country_name
+    """
@@ -3,52 +3,445 @@ SQL Queries for Traffic Stops Database
 All SQL queries are stored here for easy maintenance
 """
 
+from traffic_schema import *
+
 def get_drop_table_query(table_name):
     """Get query to drop table if exists"""
     return f"DROP TABLE IF EXISTS {table_name}"
 
-def get_create_table_query(table_name):
-    """Get query to create traffic_stops table"""
+def get_create_table_query(table_name, include_indexes=True, years=()):
+    """Get query to create traffic_stops table, partitioned by the given stop years
+
+    Bulk reloads create the table without secondary indexes and add them
+    after loading with get_add_indexes_query
+    """
+    indexes = f""",
+        {index_definitions_sql()}""" if include_indexes else ""
     return f"""
     CREATE TABLE {table_name} (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        stop_date DATE NOT NULL,
-        stop_time TIME NOT NULL,
-        country_name VARCHAR(100),
-        driver_gender CHAR(1),
-        driver_age_raw INT,
-        driver_age INT,
-        driver_race VARCHAR(50),
-        violation_raw VARCHAR(100),
-        violation VARCHAR(100),
-        search_conducted BOOLEAN,
-        search_type VARCHAR(100),
-        stop_outcome VARCHAR(100),
-        is_arrested BOOLEAN,
-        stop_duration VARCHAR(50),
-        drugs_related_stop BOOLEAN,
-        vehicle_number VARCHAR(20),
+        id INT AUTO_INCREMENT,
+        {column_definitions_sql()},
+        {generated_column_definitions_sql()},
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        INDEX idx_stop_date (stop_date),
-        INDEX idx_country (country_name),
-        INDEX idx_violation (violation),
-        INDEX idx_vehicle (vehicle_number)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        PRIMARY KEY (id, stop_date),
+        {unique_index_definition_sql()}{indexes}
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    {partition_definitions_sql(years)}
     """
 
-def get_insert_query(table_name):
-    """Get query to insert data into table"""
+def get_add_indexes_query(table_name, indexes=None):
+    """Get query to build the secondary indexes of a loaded table"""
+    indexes = TABLE_INDEXES if indexes is None else indexes
+    additions = ',\n        '.join(f"ADD INDEX {name} ({columns})" for name, columns in indexes)
+    return f"""
+    ALTER TABLE {table_name}
+        {additions}
+    """
+
+def get_drop_indexes_query(table_name, index_names):
+    """Get query to drop secondary indexes of a table"""
+    drops = ',\n        '.join(f"DROP INDEX {name}" for name in index_names)
+    return f"""
+    ALTER TABLE {table_name}
+        {drops}
+    """
+
+def get_max_allowed_packet_query():
+    """Get query to read the server's max_allowed_packet"""
+    return "SELECT @@max_allowed_packet"
+
+def get_set_query_timeout_query(timeout_ms):
+    """Get query to cut off SELECTs of this session after timeout_ms milliseconds"""
+    return f"SET SESSION MAX_EXECUTION_TIME = {int(timeout_ms)}"
+
+def get_table_exists_query(table_name):
+    """Get query to check whether a table exists in the current database"""
+    return f"""
+        SELECT COUNT(*)
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = '{table_name}'
+    """
+
+def get_index_names_query(table_name):
+    """Get query to list the index names of a table"""
+    return f"""
+        SELECT DISTINCT index_name
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = '{table_name}'
+    """
+
+def get_rename_tables_query(renames):
+    """Get query to apply several (table, new_name) renames in one atomic statement"""
+    return "RENAME TABLE " + ', '.join(f"{table} TO {new_name}" for table, new_name in renames)
+
+def get_swap_tables_query(table_name, staging_table, old_table):
+    """Get query to atomically put a staging table in place of the live table"""
+    return get_rename_tables_query([(table_name, old_table), (staging_table, table_name)])
+
+def get_rename_table_query(table_name, new_name):
+    """Get query to rename a table"""
+    return f"RENAME TABLE {table_name} TO {new_name}"
+
+def get_insert_query(table_name, columns=None):
+    """Get query to insert data into table (columns: COMPACT_INSERT_COLUMNS for a compact fact table)"""
+    columns = INSERT_COLUMNS if columns is None else columns
     return f"""
     INSERT INTO {table_name} (
-        stop_date, stop_time, country_name, driver_gender, driver_age_raw,
-        driver_age, driver_race, violation_raw, violation, search_conducted,
-        search_type, stop_outcome, is_arrested, stop_duration,
-        drugs_related_stop, vehicle_number
+        {', '.join(columns)}
+    ) VALUES (
+        {', '.join(['%s'] * len(columns))}
+    )
+    """
+
+def get_upsert_query(table_name, columns=None):
+    """Get query to insert rows, updating the existing row when the natural key already exists"""
+    columns = INSERT_COLUMNS if columns is None else columns
+    key = set(NATURAL_KEY) | set(COMPACT_NATURAL_KEY_INDEX[1].split(', '))
+    updates = ', '.join(f"{column} = VALUES({column})" for column in columns if column not in key)
+    return f"""{get_insert_query(table_name, columns)}
+    ON DUPLICATE KEY UPDATE {updates}
+    """
+
+def get_load_data_query(table_name, file_path, columns=None):
+    """Get query to bulk-load a CSV file (no header, NULL for missing values) into the table
+
+    REPLACE makes re-sent rows overwrite their natural-key match instead of failing
+    """
+    file_path = file_path.replace('\\', '/')
+    columns = INSERT_COLUMNS if columns is None else columns
+    return f"""
+    LOAD DATA LOCAL INFILE '{file_path}'
+    REPLACE INTO TABLE {table_name}
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+    LINES TERMINATED BY '\\n'
+    ({', '.join(columns)})
+    """
+
+# Embedded backend (DuckDB, SQLite)
+
+def get_create_embedded_table_queries(table_name, dialect, include_indexes=True, compact=False):
+    """Get queries to recreate traffic_stops (or the compact layout's fact table) in an embedded engine
+
+    Indexes are separate CREATE INDEX statements. DuckDB numbers rows from a
+    sequence without a PRIMARY KEY, leaving the natural key as the only unique
+    constraint so upserts need no conflict target
+    """
+    if dialect == 'duckdb':
+        sequence = f"{table_name}_id_seq"
+        queries = [
+            get_drop_table_query(table_name),
+            f"DROP SEQUENCE IF EXISTS {sequence}",
+            f"CREATE SEQUENCE {sequence}",
+        ]
+        id_column = f"id BIGINT DEFAULT nextval('{sequence}')"
+    else:
+        queries = [get_drop_table_query(table_name)]
+        id_column = "id INTEGER PRIMARY KEY"
+    columns = compact_column_definitions_sql(embedded=True) if compact else embedded_column_definitions_sql()
+    queries.append(f"""
+    CREATE TABLE {table_name} (
+        {id_column},
+        {columns},
+        {generated_column_definitions_sql()},
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    if include_indexes:
+        queries.extend(get_create_embedded_indexes_queries(table_name, compact=compact))
+    return queries
+
+def get_create_embedded_indexes_queries(table_name, indexes=None, compact=False):
+    """Get queries to build the natural-key and secondary indexes in an embedded engine"""
+    if indexes is None:
+        indexes = COMPACT_TABLE_INDEXES if compact else TABLE_INDEXES
+    key_name, key_columns = COMPACT_NATURAL_KEY_INDEX if compact else NATURAL_KEY_INDEX
+    queries = [f"CREATE UNIQUE INDEX {table_name}_{key_name} ON {table_name} ({key_columns})"]
+    queries.extend(get_add_embedded_indexes_queries(table_name, indexes))
+    return queries
+
+def get_add_embedded_indexes_queries(table_name, indexes):
+    """Get queries to build secondary indexes in an embedded engine, named after the table"""
+    return [f"CREATE INDEX {table_name}_{name} ON {table_name} ({columns})" for name, columns in indexes]
+
+def get_drop_embedded_indexes_queries(table_name, index_names):
+    """Get queries to drop secondary indexes in an embedded engine, named after the table"""
+    return [f"DROP INDEX {table_name}_{name}" for name in index_names]
+
+def get_embedded_index_names_query(table_name, dialect):
+    """Get query to list the index names of a table in an embedded engine, with the table name prefix"""
+    if dialect == 'duckdb':
+        return f"SELECT index_name FROM duckdb_indexes() WHERE table_name = '{table_name}'"
+    return f"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = '{table_name}'"
+
+def get_embedded_table_type_query(table_name, dialect):
+    """Get query for 'BASE TABLE' or 'VIEW' when table_name exists in an embedded engine"""
+    if dialect == 'duckdb':
+        return f"SELECT table_type FROM information_schema.tables WHERE table_name = '{table_name}'"
+    return f"""
+        SELECT CASE type WHEN 'view' THEN 'VIEW' ELSE 'BASE TABLE' END
+        FROM sqlite_master
+        WHERE name = '{table_name}' AND type IN ('table', 'view')
+    """
+
+# Compact layout: dimension tables, a fact table of integer keys and a view with the wide shape
+
+def get_facts_table_name(table_name):
+    """Fact table behind the traffic_stops view in the compact layout"""
+    return f"{table_name}_facts"
+
+def get_dimension_table_name(table_name, column_name):
+    """Dimension table holding the distinct values of a column"""
+    return f"{table_name}_dim_{column_name}"
+
+def get_create_dimension_table_query(table_name, column_name):
+    """Get query to create a dimension table; keys are assigned by the loader and never reused"""
+    return f"""
+    CREATE TABLE IF NOT EXISTS {get_dimension_table_name(table_name, column_name)} (
+        id {DIMENSION_KEY_TYPES[column_name]} NOT NULL PRIMARY KEY,
+        value {SCHEMA[column_name].sql_type} NOT NULL,
+        UNIQUE (value)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    """
+
+def get_dimension_rows_query(table_name, column_name):
+    """Get query for the (id, value) rows of a dimension table"""
+    return f"SELECT id, value FROM {get_dimension_table_name(table_name, column_name)}"
+
+def get_insert_dimension_query(table_name, column_name):
+    """Get query to add an (id, value) row to a dimension table"""
+    return f"INSERT INTO {get_dimension_table_name(table_name, column_name)} (id, value) VALUES (%s, %s)"
+
+def get_add_dimension_value_query(table_name, column_name):
+    """Get query to give a value the next key unless it has one (parameters: value, value)"""
+    dimension_table = get_dimension_table_name(table_name, column_name)
+    return f"""
+    INSERT INTO {dimension_table} (id, value)
+    SELECT COALESCE(MAX(id), 0) + 1, %s
+    FROM {dimension_table}
+    HAVING COUNT(CASE WHEN value = %s THEN 1 END) = 0
+    """
+
+def get_dimension_values_query(table_name, column_name):
+    """Get the values of a dimension, shaped like get_unique_values_query"""
+    return f"SELECT value as {column_name} FROM {get_dimension_table_name(table_name, column_name)} ORDER BY value"
+
+def get_create_compact_table_query(table_name, include_indexes=True, years=()):
+    """Get query to create the compact layout's fact table, partitioned like traffic_stops"""
+    name, columns = COMPACT_NATURAL_KEY_INDEX
+    indexes = f""",
+        {index_definitions_sql(COMPACT_TABLE_INDEXES)}""" if include_indexes else ""
+    return f"""
+    CREATE TABLE {table_name} (
+        id INT AUTO_INCREMENT,
+        {compact_column_definitions_sql()},
+        {generated_column_definitions_sql()},
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, stop_date),
+        UNIQUE INDEX {name} ({columns}){indexes}
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    {partition_definitions_sql(years)}
+    """
+
+def get_create_compact_view_query(view_name, facts_table, dimensions_of):
+    """Get query for a view with traffic_stops' columns over a fact table and the dimensions of dimensions_of"""
+    selected, joins = ['facts.id'], []
+    for name in INSERT_COLUMNS:
+        if name in DIMENSION_KEY_TYPES:
+            alias = f"dim_{name}"
+            selected.append(f"{alias}.value AS {name}")
+            joins.append(f"LEFT JOIN {get_dimension_table_name(dimensions_of, name)} {alias} "
+                         f"ON {alias}.id = facts.{compact_column_name(name)}")
+        else:
+            selected.append(f"facts.{name}")
+    selected.extend(f"facts.{column.name}" for column in GENERATED_COLUMNS)
+    selected.append('facts.created_at')
+    select_list = ',\n        '.join(selected)
+    join_list = '\n    '.join(joins)
+    return f"""
+    CREATE VIEW {view_name} AS
+    SELECT
+        {select_list}
+    FROM {facts_table} facts
+    {join_list}
+    """
+
+def get_drop_view_query(view_name):
+    """Get query to drop a view if it exists"""
+    return f"DROP VIEW IF EXISTS {view_name}"
+
+def get_table_type_query(table_name):
+    """Get query for 'BASE TABLE' or 'VIEW' when table_name exists in the current database"""
+    return f"""
+        SELECT table_type
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = '{table_name}'
+    """
+
+def get_compact_insert_query(table_name):
+    """Get query to insert a stop given with text values (parameters as get_insert_query) into the fact table"""
+    values = []
+    for name in INSERT_COLUMNS:
+        if name in DIMENSION_KEY_TYPES:
+            values.append(f"(SELECT id FROM {get_dimension_table_name(table_name, name)} WHERE value = %s)")
+        else:
+            values.append('%s')
+    return f"""
+    INSERT INTO {get_facts_table_name(table_name)} (
+        {', '.join(COMPACT_INSERT_COLUMNS)}
     ) VALUES (
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+        {', '.join(values)}
     )
     """
 
+# Index migrations: INDEX_MIGRATIONS versions applied to the live table
+
+def get_create_migrations_table_query(migrations_table):
+    """Get query to create the table recording applied migration versions"""
+    return f"""
+    CREATE TABLE IF NOT EXISTS {migrations_table} (
+        version INT NOT NULL PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """
+
+def get_applied_migrations_query(migrations_table):
+    """Get query for the applied migration versions"""
+    return f"SELECT version FROM {migrations_table} ORDER BY version"
+
+def get_record_migration_query(migrations_table):
+    """Get query to record an applied migration (parameters: version, description)"""
+    return f"INSERT INTO {migrations_table} (version, description) VALUES (%s, %s)"
+
+def get_explain_query(query, dialect='mysql'):
+    """Get the query plan of a SELECT; SQLite's EXPLAIN alone lists bytecode, not the plan"""
+    if dialect == 'sqlite':
+        return f"EXPLAIN QUERY PLAN {query}"
+    return f"EXPLAIN {query}"
+
+# Rollup tables: per-group counters maintained at ingest and on every insert
+
+ROLLUP_KEY = ['stop_date', 'stop_hour', 'country_name', 'violation']
+ROLLUP_COUNTERS = ['stops', 'arrests', 'searches', 'drug_stops']
+
+def get_rollup_table_name(table_name):
+    """Name of the stop counters rollup of a table"""
+    return f"{table_name}_rollup"
+
+def get_vehicle_rollup_table_name(table_name):
+    """Name of the per-vehicle rollup of a table"""
+    return f"{table_name}_vehicle_rollup"
+
+def get_create_rollup_table_query(table_name):
+    """Get query to create the stop counters rollup, one row per date, hour, country and violation"""
+    return f"""
+    CREATE TABLE {get_rollup_table_name(table_name)} (
+        stop_date DATE NOT NULL,
+        stop_hour TINYINT NOT NULL,
+        country_name VARCHAR(100) NOT NULL,
+        violation VARCHAR(100) NOT NULL,
+        stops INT NOT NULL,
+        arrests INT NOT NULL,
+        searches INT NOT NULL,
+        drug_stops INT NOT NULL,
+        PRIMARY KEY ({', '.join(ROLLUP_KEY)})
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    """
+
+def get_create_vehicle_rollup_table_query(table_name):
+    """Get query to create the per-vehicle rollup, one row per vehicle and country"""
+    return f"""
+    CREATE TABLE {get_vehicle_rollup_table_name(table_name)} (
+        vehicle_number VARCHAR(20) NOT NULL,
+        country_name VARCHAR(100) NOT NULL,
+        stops INT NOT NULL,
+        PRIMARY KEY (vehicle_number, country_name)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    """
+
+def get_populate_rollup_query(table_name):
+    """Get query to fill the stop counters rollup from the table"""
+    return f"""
+    INSERT INTO {get_rollup_table_name(table_name)} ({', '.join(ROLLUP_KEY + ROLLUP_COUNTERS)})
+    SELECT
+        stop_date,
+        stop_hour,
+        COALESCE(country_name, 'Unknown'),
+        COALESCE(violation, 'Unknown'),
+        COUNT(*),
+        SUM(CASE WHEN is_arrested = 1 THEN 1 ELSE 0 END),
+        SUM(CASE WHEN search_conducted = 1 THEN 1 ELSE 0 END),
+        SUM(CASE WHEN drugs_related_stop = 1 THEN 1 ELSE 0 END)
+    FROM {table_name}
+    GROUP BY stop_date, stop_hour, COALESCE(country_name, 'Unknown'), COALESCE(violation, 'Unknown')
+    """
+
+def get_populate_vehicle_rollup_query(table_name):
+    """Get query to fill the per-vehicle rollup from the table"""
+    return f"""
+    INSERT INTO {get_vehicle_rollup_table_name(table_name)} (vehicle_number, country_name, stops)
+    SELECT COALESCE(vehicle_number, 'Unknown'), COALESCE(country_name, 'Unknown'), COUNT(*)
+    FROM {table_name}
+    GROUP BY COALESCE(vehicle_number, 'Unknown'), COALESCE(country_name, 'Unknown')
+    """
+
+def get_rollup_upsert_query(table_name):
+    """Get query to add one new stop to the stop counters rollup"""
+    columns = ROLLUP_KEY + ROLLUP_COUNTERS
+    updates = ', '.join(f"{column} = {column} + VALUES({column})" for column in ROLLUP_COUNTERS)
+    return f"""
+    INSERT INTO {get_rollup_table_name(table_name)} ({', '.join(columns)})
+    VALUES ({', '.join(['%s'] * len(columns))})
+    ON DUPLICATE KEY UPDATE {updates}
+    """
+
+def get_vehicle_rollup_upsert_query(table_name):
+    """Get query to add one new stop to the per-vehicle rollup"""
+    return f"""
+    INSERT INTO {get_vehicle_rollup_table_name(table_name)} (vehicle_number, country_name, stops)
+    VALUES (%s, %s, 1)
+    ON DUPLICATE KEY UPDATE stops = stops + VALUES(stops)
+    """
+
+# Ingestion checkpoints
+
+def get_create_checkpoint_table_query(checkpoint_table):
+    """Get query to create the table recording committed rows per ingestion run and slice"""
+    return f"""
+    CREATE TABLE IF NOT EXISTS {checkpoint_table} (
+        run_id VARCHAR(64) NOT NULL,
+        slice_no INT NOT NULL,
+        target_table VARCHAR(64) NOT NULL,
+        loaders INT NOT NULL,
+        committed_rows BIGINT NOT NULL,
+        total_rows BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (run_id, slice_no)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """
+
+def get_save_checkpoint_query(checkpoint_table):
+    """Get query to record committed rows of a slice, run in the same transaction as its batch"""
+    return f"""
+    INSERT INTO {checkpoint_table} (run_id, slice_no, target_table, loaders, committed_rows, total_rows)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE committed_rows = VALUES(committed_rows), total_rows = VALUES(total_rows)
+    """
+
+def get_checkpoints_query(checkpoint_table, run_id):
+    """Get query to fetch the checkpoints of a run"""
+    return f"""
+    SELECT slice_no, target_table, loaders, committed_rows, total_rows
+    FROM {checkpoint_table}
+    WHERE run_id = '{run_id}'
+    ORDER BY slice_no
+    """
+
+def get_clear_checkpoints_query(checkpoint_table, run_id):
+    """Get query to forget the checkpoints of a run"""
+    return f"DELETE FROM {checkpoint_table} WHERE run_id = '{run_id}'"
+
 def get_count_query(table_name):
     """Get query to count total rows"""
     return f"SELECT COUNT(*) FROM {table_name}"
@@ -109,6 +502,60 @@ def get_officer_reports_query(table_name):
         ORDER BY total_stops DESC
     """
 
+# Headline queries answered from the rollups: cost grows with the number of groups, not rows
+
+def get_vehicle_logs_rollup_query(table_name):
+    """Get vehicle logs statistics from the rollups"""
+    return f"""
+        SELECT
+            (SELECT COUNT(DISTINCT vehicle_number) FROM {get_vehicle_rollup_table_name(table_name)}) as total_vehicles,
+            SUM(stops) as total_stops,
+            SUM(arrests) as arrests,
+            SUM(searches) as searches
+        FROM {get_rollup_table_name(table_name)}
+    """
+
+def get_violations_stats_rollup_query(table_name):
+    """Get violations statistics from the rollup"""
+    return f"""
+        SELECT
+            violation,
+            SUM(stops) as count,
+            SUM(arrests) as arrests,
+            ROUND(SUM(arrests) * 100.0 / SUM(stops), 2) as arrest_rate
+        FROM {get_rollup_table_name(table_name)}
+        GROUP BY violation
+        ORDER BY count DESC
+    """
+
+def get_officer_reports_rollup_query(table_name):
+    """Get officer reports statistics by country from the rollups"""
+    return f"""
+        SELECT
+            totals.country_name,
+            totals.total_stops,
+            vehicles.unique_vehicles,
+            totals.arrests,
+            totals.searches,
+            totals.drug_related
+        FROM (
+            SELECT
+                country_name,
+                SUM(stops) as total_stops,
+                SUM(arrests) as arrests,
+                SUM(searches) as searches,
+                SUM(drug_stops) as drug_related
+            FROM {get_rollup_table_name(table_name)}
+            GROUP BY country_name
+        ) as totals
+        JOIN (
+            SELECT country_name, COUNT(*) as unique_vehicles
+            FROM {get_vehicle_rollup_table_name(table_name)}
+            GROUP BY country_name
+        ) as vehicles ON vehicles.country_name = totals.country_name
+        ORDER BY totals.total_stops DESC
+    """
+
 def get_vehicle_lookup_query(table_name, vehicle_number):
     """Get all records for a specific vehicle"""
     return f"""
@@ -121,6 +568,69 @@ def get_vehicle_lookup_query(table_name, vehicle_number):
         ORDER BY stop_date DESC, stop_time DESC
     """
 
+# Keyset pagination: each page starts after the last row of the previous one, so
+# a page costs an index seek plus page_size rows however deep it is
+
+PAGE_SIZE = 50
+VEHICLE_HISTORY_SORT_KEY = [('stop_date', True), ('stop_time', True), ('id', True)]
+
+def get_order_by(sort_key):
+    """ORDER BY list for (column, descending) pairs"""
+    return ', '.join(f"{column} {'DESC' if descending else 'ASC'}" for column, descending in sort_key)
+
+def get_keyset_condition(sort_key):
+    """Get a condition selecting the rows after a cursor row in sort_key order
+
+    Written out as (a > %s) OR (a = %s AND b < %s) OR ... so columns can sort in
+    different directions; the parameters are the cursor values repeated per
+    term, see pagination.keyset_params
+    """
+    terms = []
+    for i, (column, descending) in enumerate(sort_key):
+        equal = [f"{previous} = %s" for previous, _ in sort_key[:i]]
+        terms.append('(' + ' AND '.join(equal + [f"{column} {'<' if descending else '>'} %s"]) + ')')
+    return '(' + ' OR '.join(terms) + ')'
+
+def get_vehicle_summary_query(table_name):
+    """Get stop counters of one vehicle (parameter: vehicle_number)"""
+    return f"""
+        SELECT
+            COUNT(*) as total_stops,
+            SUM(is_arrested) as arrests,
+            SUM(search_conducted) as searches,
+            SUM(drugs_related_stop) as drug_related
+        FROM {table_name}
+        WHERE vehicle_number = %s
+    """
+
+def get_vehicle_history_page_query(table_name, after=False, page_size=PAGE_SIZE):
+    """Get one page of a vehicle's stops, newest first (parameters: vehicle_number, then the keyset cursor)"""
+    keyset = f"AND {get_keyset_condition(VEHICLE_HISTORY_SORT_KEY)}" if after else ""
+    return f"""
+        SELECT
+            id, stop_date, stop_time, country_name, driver_gender, driver_age,
+            driver_race, violation, search_conducted, search_type,
+            stop_outcome, is_arrested, stop_duration, drugs_related_stop
+        FROM {table_name}
+        WHERE vehicle_number = %s {keyset}
+        ORDER BY {get_order_by(VEHICLE_HISTORY_SORT_KEY)}
+        LIMIT {int(page_size)}
+    """
+
+def get_paged_query(query, sort_key, after=False, page_size=PAGE_SIZE):
+    """Get one page of another query's rows in sort_key order, which must be unique per row"""
+    keyset = f"WHERE {get_keyset_condition(sort_key)}" if after else ""
+    return f"""
+        SELECT * FROM ({query}) as paged
+        {keyset}
+        ORDER BY {get_order_by(sort_key)}
+        LIMIT {int(page_size)}
+    """
+
+def get_paged_count_query(query):
+    """Get the number of rows another query returns, without returning them"""
+    return f"SELECT COUNT(*) as total_rows FROM ({query}) as counted"
+
 def get_all_vehicle_numbers_query(table_name):
     """Get all unique vehicle numbers"""
     return f"""
@@ -136,7 +646,7 @@ def get_recent_stops_query(table_name, limit=10):
             stop_date, stop_time, vehicle_number, country_name,
             violation, stop_outcome, is_arrested
         FROM {table_name}
-        ORDER BY stop_date DESC, stop_time DESC
+        ORDER BY stop_datetime DESC
         LIMIT {limit}
     """
 
@@ -170,12 +680,35 @@ def get_most_common_outcome_query(table_name, violation):
         LIMIT 1
     """
 
-def insert_new_log_query(table_name):
-    """Get query to insert a new traffic stop log"""
+def get_prediction_cube_query(table_name):
+    """Get the counters of get_prediction_stats_query per (violation, race, gender, age) for the prediction cube"""
+    return f"""
+        SELECT
+            violation,
+            driver_race,
+            driver_gender,
+            driver_age,
+            COUNT(*) as stops,
+            SUM(is_arrested) as arrests,
+            SUM(search_conducted) as searches,
+            SUM(drugs_related_stop) as drug_stops
+        FROM {table_name}
+        WHERE violation IS NOT NULL
+        AND driver_race IS NOT NULL
+        AND driver_gender IS NOT NULL
+        AND driver_age IS NOT NULL
+        GROUP BY violation, driver_race, driver_gender, driver_age
+    """
+
+def get_outcome_counts_query(table_name):
+    """Get stop counts per (violation, outcome), what get_most_common_outcome_query ranks"""
     return f"""
-        INSERT INTO {table_name}
-        (stop_date, stop_time, country_name, driver_gender, driver_age_raw, driver_age,
-         driver_race, violation_raw, violation, search_conducted, search_type,
-         stop_outcome, is_arrested, stop_duration, drugs_related_stop, vehicle_number)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        SELECT violation, stop_outcome, COUNT(*) as count
+        FROM {table_name}
+        WHERE violation IS NOT NULL AND stop_outcome IS NOT NULL
+        GROUP BY violation, stop_outcome
     """
+
+def insert_new_log_query(table_name, compact=False):
+    """Get query to insert a new traffic stop log"""
+    return get_compact_insert_query(table_name) if compact else get_insert_query(table_name)
@@ -0,0 +1,398 @@
+"""
+Traffic Stops Table Schema
+Single definition of the traffic_stops columns used by preprocessing
+(read dtypes, coercion and fill), the CREATE TABLE query and ingestion
+(column order of inserts)
+"""
+
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# kind: date, time, int, bool, category (low-cardinality text) or string
+# fill: value used for missing entries, 'median' for the column median, None to keep NULL
+Column = namedtuple('Column', ['name', 'sql_type', 'kind', 'fill'])
+
+TRAFFIC_STOPS_COLUMNS = [
+    Column('stop_date', 'DATE NOT NULL', 'date', None),
+    Column('stop_time', 'TIME NOT NULL', 'time', None),
+    Column('country_name', 'VARCHAR(100)', 'category', 'Unknown'),
+    Column('driver_gender', 'CHAR(1)', 'category', 'Unknown'),
+    Column('driver_age_raw', 'INT', 'int', 'median'),
+    Column('driver_age', 'INT', 'int', 'median'),
+    Column('driver_race', 'VARCHAR(50)', 'category', 'Unknown'),
+    Column('violation_raw', 'VARCHAR(100)', 'category', 'Unknown'),
+    Column('violation', 'VARCHAR(100)', 'category', 'Unknown'),
+    Column('search_conducted', 'BOOLEAN', 'bool', False),
+    Column('search_type', 'VARCHAR(100)', 'category', 'Unknown'),
+    Column('stop_outcome', 'VARCHAR(100)', 'category', 'Unknown'),
+    Column('is_arrested', 'BOOLEAN', 'bool', False),
+    Column('stop_duration', 'VARCHAR(50)', 'category', 'Unknown'),
+    Column('drugs_related_stop', 'BOOLEAN', 'bool', False),
+    Column('vehicle_number', 'VARCHAR(20)', 'string', 'Unknown'),
+]
+
+SCHEMA = {column.name: column for column in TRAFFIC_STOPS_COLUMNS}
+
+# Column order of every INSERT into traffic_stops
+INSERT_COLUMNS = [column.name for column in TRAFFIC_STOPS_COLUMNS]
+
+# Stored generated columns: hour, year and month filters and groupings read an
+# indexable column instead of computing HOUR(stop_time) and the like per row
+# expression: MySQL dialect, translate_query rewrites it for the embedded engines
+GeneratedColumn = namedtuple('GeneratedColumn', ['name', 'sql_type', 'expression'])
+
+GENERATED_COLUMNS = [
+    GeneratedColumn('stop_hour', 'TINYINT', 'HOUR(stop_time)'),
+    GeneratedColumn('stop_year', 'SMALLINT', 'YEAR(stop_date)'),
+    GeneratedColumn('stop_month', 'TINYINT', 'MONTH(stop_date)'),
+    GeneratedColumn('stop_datetime', 'DATETIME', 'TIMESTAMP(stop_date, stop_time)'),
+]
+
+# MySQL tables are RANGE-partitioned by stop year so date-bounded queries prune
+# partitions; every unique key must contain stop_date, hence PRIMARY KEY (id, stop_date)
+PARTITION_EXPRESSION = 'YEAR(stop_date)'
+
+# Secondary indexes before any migration; TABLE_INDEXES below has the current set
+INITIAL_TABLE_INDEXES = [
+    ('idx_stop_date', 'stop_date'),
+    ('idx_country', 'country_name'),
+    ('idx_violation', 'violation'),
+    # Serves vehicle lookups and their stop history pages, newest first
+    ('idx_vehicle_history', 'vehicle_number, stop_date, stop_time, id'),
+    # Hour, year and month groupings read the generated columns in index order
+    ('idx_stop_hour', 'stop_hour, is_arrested, search_conducted'),
+    ('idx_year_month_hour', 'stop_year, stop_month, stop_hour, is_arrested, search_conducted'),
+    ('idx_country_year', 'country_name, stop_year, is_arrested'),
+    ('idx_stop_datetime', 'stop_datetime'),
+]
+
+# Versioned index changes, applied to existing tables with Utilities/index_advisor.py --apply
+# and recorded in schema_migrations; tables built by step 2 get every one of them
+# (version, description, indexes added, names of indexes dropped once the added ones exist)
+INDEX_MIGRATIONS = [
+    (1, 'Composite and covering indexes for multi-column filters and groupings', [
+        # get_prediction_stats_query: equality on violation, race and gender, the age window, then its flags
+        ('idx_prediction', 'violation, driver_race, driver_gender, driver_age, is_arrested, search_conducted, '
+                           'drugs_related_stop'),
+        # get_most_common_outcome_query and the outcome counts of the prediction cube
+        ('idx_violation_outcome', 'violation, stop_outcome'),
+        # get_arrest_rate_by_country_violation_query reads groups in index order without a temporary table
+        ('idx_country_violation', 'country_name, violation, is_arrested'),
+        # get_race_gender_search_rate_query
+        ('idx_race_gender', 'driver_race, driver_gender, search_conducted'),
+    ], [
+        # Left prefixes of idx_country_year and idx_country_violation, and of idx_violation_outcome
+        'idx_country', 'idx_violation',
+    ]),
+]
+_DROPPED_INDEXES = {name for *_, dropped in INDEX_MIGRATIONS for name in dropped}
+_MIGRATED_INDEXES = [index for _, _, indexes, _ in INDEX_MIGRATIONS for index in indexes]
+TABLE_INDEXES = [index for index in INITIAL_TABLE_INDEXES + _MIGRATED_INDEXES if index[0] not in _DROPPED_INDEXES]
+
+# Natural key of a stop: re-sent rows upsert onto the same row instead of duplicating
+NATURAL_KEY = ['vehicle_number', 'stop_date', 'stop_time', 'violation']
+NATURAL_KEY_INDEX = ('uq_natural_key', ', '.join(NATURAL_KEY))
+
+# Compact layout: repeated text columns live in small dimension tables and the
+# fact table stores their integer keys (column name + '_id'); a view keeps the
+# wide shape for queries
+DIMENSION_KEY_TYPES = {
+    'country_name': 'SMALLINT UNSIGNED',
+    'driver_race': 'TINYINT UNSIGNED',
+    'violation_raw': 'SMALLINT UNSIGNED',
+    'violation': 'SMALLINT UNSIGNED',
+    'search_type': 'SMALLINT UNSIGNED',
+    'stop_outcome': 'SMALLINT UNSIGNED',
+    'stop_duration': 'TINYINT UNSIGNED',
+}
+_COMPACT_SQL_TYPES = {
+    'driver_age_raw': 'SMALLINT',
+    'driver_age': 'SMALLINT',
+}
+
+
+def compact_column_name(name):
+    """Fact table column of a schema column in the compact layout"""
+    return f"{name}_id" if name in DIMENSION_KEY_TYPES else name
+
+
+COMPACT_INSERT_COLUMNS = [compact_column_name(name) for name in INSERT_COLUMNS]
+COMPACT_NATURAL_KEY_INDEX = ('uq_natural_key', ', '.join(compact_column_name(name) for name in NATURAL_KEY))
+
+
+def compact_indexes(indexes):
+    """Indexes of the wide table on the matching fact table columns"""
+    return [(name, ', '.join(compact_column_name(column) for column in columns.split(', '))) for name, columns in indexes]
+
+
+COMPACT_TABLE_INDEXES = compact_indexes(TABLE_INDEXES)
+
+TRUE_VALUES = ['true', '1', '1.0', 'yes', 'y', 't']
+
+# Embedded engines (DuckDB, SQLite) cannot SUM/AVG a BOOLEAN like MySQL's TINYINT(1), so flags are small integers
+_EMBEDDED_SQL_TYPES = {
+    'bool': 'SMALLINT',
+}
+
+# pandas dtypes to request from read_csv so nothing is guessed
+_READ_DTYPES = {
+    'date': 'object',
+    'time': 'object',
+    'int': 'float64',
+    'bool': 'object',
+    'category': 'category',
+    'string': 'object',
+}
+
+
+def columns_of_kind(*kinds):
+    """Names of the schema columns of the given kinds"""
+    return [column.name for column in TRAFFIC_STOPS_COLUMNS if column.kind in kinds]
+
+
+def read_dtypes():
+    """dtype mapping for pd.read_csv of raw or cleaned traffic stops files"""
+    return {column.name: _READ_DTYPES[column.kind] for column in TRAFFIC_STOPS_COLUMNS}
+
+
+def max_chars(name):
+    """Longest text a VARCHAR column holds, None for other columns"""
+    match = re.fullmatch(r"VARCHAR\((\d+)\)", SCHEMA[name].sql_type)
+    return int(match.group(1)) if match else None
+
+
+def column_definitions_sql():
+    """Column definitions for CREATE TABLE, in schema order"""
+    return ',\n        '.join(f"{column.name} {column.sql_type}" for column in TRAFFIC_STOPS_COLUMNS)
+
+
+def embedded_column_definitions_sql():
+    """Column definitions for CREATE TABLE in an embedded engine, in schema order"""
+    return ',\n        '.join(f"{column.name} {_EMBEDDED_SQL_TYPES.get(column.kind, column.sql_type)}"
+                                for column in TRAFFIC_STOPS_COLUMNS)
+
+
+def compact_column_definitions_sql(embedded=False):
+    """Column definitions for the compact layout's fact table, in schema order"""
+    definitions = []
+    for column in TRAFFIC_STOPS_COLUMNS:
+        if column.name in DIMENSION_KEY_TYPES:
+            sql_type = DIMENSION_KEY_TYPES[column.name]
+        elif embedded and column.kind in _EMBEDDED_SQL_TYPES:
+            sql_type = _EMBEDDED_SQL_TYPES[column.kind]
+        else:
+            sql_type = _COMPACT_SQL_TYPES.get(column.name, column.sql_type)
+        definitions.append(f"{compact_column_name(column.name)} {sql_type}")
+    return ',\n        '.join(definitions)
+
+
+def generated_column_definitions_sql():
+    """Stored generated column definitions for CREATE TABLE"""
+    return ',\n        '.join(f"{column.name} {column.sql_type} AS ({column.expression}) STORED"
+                                for column in GENERATED_COLUMNS)
+
+
+def partition_definitions_sql(years=()):
+    """PARTITION BY clause with a partition per stop year and one for later years"""
+    partitions = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in sorted(set(years))]
+    partitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+    return f"PARTITION BY RANGE ({PARTITION_EXPRESSION}) (\n        " + ',\n        '.join(partitions) + "\n    )"
+
+
+def stop_years(df):
+    """Distinct stop years in df, the partitions a new table starts with"""
+    dates = coerce_column(df['stop_date'], SCHEMA['stop_date'])
+    return sorted(int(year) for year in pd.Series(dates).dt.year.dropna().unique())
+
+
+def index_definitions_sql(indexes=None):
+    """Index definitions for CREATE TABLE"""
+    indexes = TABLE_INDEXES if indexes is None else indexes
+    return ',\n        '.join(f"INDEX {name} ({columns})" for name, columns in indexes)
+
+
+def unique_index_definition_sql():
+    """Unique natural-key index for CREATE TABLE, present from the start so upserts work while loading"""
+    name, columns = NATURAL_KEY_INDEX
+    return f"UNIQUE INDEX {name} ({columns})"
+
+
+def count_natural_keys(df):
+    """Rows the table will hold after upserting df, i.e. distinct natural keys
+
+    Text is compared like the table's utf8mb4_bin collation: case-sensitive,
+    trailing spaces ignored (PAD SPACE on both MySQL and TiDB)
+    """
+    keys = {}
+    for name in NATURAL_KEY:
+        series = coerce_column(df[name], SCHEMA[name], None)
+        if SCHEMA[name].kind == 'date':
+            series = series.dt.strftime('%Y-%m-%d')
+        keys[name] = series.astype(str).str.rstrip(' ').to_numpy()
+    return len(pd.DataFrame(keys).drop_duplicates())
+
+
+def dimension_values(df, name):
+    """Distinct non-missing values of a dimension column, as they will be stored"""
+    series = coerce_column(df[name], SCHEMA[name], None).astype('category')
+    return series.cat.remove_unused_categories().cat.categories.tolist()
+
+
+def encode_dimensions(df, mappings):
+    """Frame in the compact layout's column order, dimension values replaced by their keys
+
+    mappings: {column: {value: key}} covering every value in df
+    """
+    frame = {}
+    for name in INSERT_COLUMNS:
+        if name not in DIMENSION_KEY_TYPES:
+            frame[name] = df[name]
+            continue
+        series = coerce_column(df[name], SCHEMA[name], None).astype('category')
+        # Map the few categories, then expand through the codes; code -1 (missing) stays NULL
+        keys = pd.array(pd.Series(series.cat.categories, dtype=object).map(mappings[name]), dtype='Int64')
+        frame[compact_column_name(name)] = pd.Series(keys.take(series.cat.codes.to_numpy(), allow_fill=True),
+                                                     index=df.index)
+    return pd.DataFrame(frame, index=df.index)
+
+
+def _fill_missing(series, value):
+    if value is None:
+        return series
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if value not in series.cat.categories:
+            series = series.cat.add_categories([value])
+        return series.fillna(value)
+    return series.astype(object).where(series.notna(), value)
+
+
+def _convert_distinct(series, convert):
+    """Apply a vectorized conversion to the distinct values only, then expand back"""
+    codes, uniques = pd.factorize(series)
+    converted = convert(pd.Series(uniques, dtype=object))
+    return pd.Series(converted.array.take(codes, allow_fill=True), index=series.index)
+
+
+def _parse_times(series):
+    text = series.astype(str)
+    # Accept both HH:MM and HH:MM:SS
+    text = text.where(text.str.count(':') != 1, text + ':00')
+    times = pd.to_timedelta(text, errors='coerce')
+    components = times.dt.components
+    formatted = (components['hours'].astype('Int64').astype(str).str.zfill(2) + ':'
+                 + components['minutes'].astype('Int64').astype(str).str.zfill(2) + ':'
+                 + components['seconds'].astype('Int64').astype(str).str.zfill(2))
+    return formatted.astype(object).where(times.notna(), None)
+
+
+def coerce_column(series, column, fill_value=None):
+    """Vectorized conversion of a whole column to its schema kind, filling missing values
+
+    fill_value overrides the declared fill (used to pass a computed median)
+    """
+    fill = column.fill if fill_value is None else fill_value
+    kind = column.kind
+    if kind == 'int':
+        # Truncate like int() did during ingestion
+        values = np.trunc(pd.to_numeric(series, errors='coerce'))
+        if fill is not None and fill != 'median':
+            values = values.fillna(fill)
+        if values.isna().any():
+            return values.astype('Int64')
+        return values.astype('int64')
+    if kind == 'bool':
+        if pd.api.types.is_bool_dtype(series):
+            return series.fillna(fill if fill is not None else False).astype(bool)
+        text = series.astype(str).str.strip().str.lower()
+        return text.isin(TRUE_VALUES)
+    # Dates and times repeat heavily, so they are parsed once per distinct value
+    if kind == 'date':
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        return _convert_distinct(series, lambda values: pd.to_datetime(values, errors='coerce'))
+    if kind == 'time':
+        return _convert_distinct(series, _parse_times)
+    if kind == 'category':
+        values = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+        return _fill_missing(values, fill)
+    return _fill_missing(series, fill)
+
+
+def coerce_frame(df, fill_values=None):
+    """Coerce every schema column present in df, leaving other columns alone"""
+    fill_values = fill_values or {}
+    df = df.copy()
+    for name in df.columns:
+        if name in SCHEMA:
+            df[name] = coerce_column(df[name], SCHEMA[name], fill_values.get(name))
+    return df
+
+
+def _to_db_array(series):
+    """Numpy form of a coerced column whose slices convert straight to Python values"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Code -1 (missing) indexes the trailing None
+        categories = np.append(series.cat.categories.to_numpy(dtype=object), None)
+        return categories, series.cat.codes.to_numpy()
+    if series.isna().any():
+        values = series.astype(object)
+        return values.where(values.notna(), None).to_numpy(dtype=object), None
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype=series.dtype.numpy_dtype if hasattr(series.dtype, 'numpy_dtype') else None), None
+    return series.to_numpy(dtype=object), None
+
+
+def prepare_db_columns(df, columns=None):
+    """Coerce each insert column once into a compact, DB-ready array
+
+    Text, dates and times are kept dictionary-encoded so slicing a batch
+    out of them reuses the same string objects
+    """
+    columns = INSERT_COLUMNS if columns is None else columns
+    prepared = []
+    for name in columns:
+        series = coerce_column(df[name], SCHEMA[name], None) if name in SCHEMA else df[name]
+        kind = SCHEMA[name].kind if name in SCHEMA else None
+        if kind == 'date':
+            series = series.dt.strftime('%Y-%m-%d').astype('category')
+        elif kind in ('time', 'string'):
+            series = series.astype('category')
+        prepared.append(_to_db_array(series))
+    return prepared
+
+
+def db_batch_rows(prepared, start, stop):
+    """Parameter tuples for rows [start, stop) of prepared columns, missing values as None"""
+    values = []
+    for array, codes in prepared:
+        if codes is None:
+            values.append(array[start:stop].tolist())
+        else:
+            values.append(array[codes[start:stop]].tolist())
+    return list(zip(*values))
+
+
+def iter_db_batches(df, batch_size, columns=None):
+    """Yield (start, rows) batches of parameter tuples, building one batch at a time"""
+    prepared = prepare_db_columns(df, columns)
+    total = len(df)
+    for start in range(0, total, batch_size):
+        yield start, db_batch_rows(prepared, start, min(start + batch_size, total))
+
+
+def load_file_frame(df, columns=None):
+    """Insert columns formatted for a LOAD DATA file: ISO dates, 1/0 flags, text as-is"""
+    columns = INSERT_COLUMNS if columns is None else columns
+    frame = {}
+    for name in columns:
+        series = coerce_column(df[name], SCHEMA[name], None) if name in SCHEMA else df[name]
+        kind = SCHEMA[name].kind if name in SCHEMA else None
+        if kind == 'date':
+            series = series.dt.strftime('%Y-%m-%d')
+        elif kind == 'bool':
+            series = series.astype('int8')
+        frame[name] = series.reset_index(drop=True)
+    return pd.DataFrame(frame)
@@ -0,0 +1,114 @@
+"""
+Insert Tuple Builder Benchmark
+Compares the old iterrows-based tuple building of insert_data with the
+columnar batch builder, reporting rows/s and peak memory for each
+
+Usage: python3 benchmark_insert_tuples.py [cleaned_file] [--rows N] [--batch-size N]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from traffic_schema import INSERT_COLUMNS, iter_db_batches, read_dtypes
+
+
+def legacy_build_tuples(df):
+    """Tuple building as insert_data did it before the batch builder"""
+    return [
+        (row['stop_date'], row['stop_time'], row['country_name'], row['driver_gender'],
+         int(row['driver_age_raw']), int(row['driver_age']), row['driver_race'],
+         row['violation_raw'], row['violation'], bool(row['search_conducted']),
+         row['search_type'], row['stop_outcome'], bool(row['is_arrested']),
+         row['stop_duration'], bool(row['drugs_related_stop']), row['vehicle_number'])
+        for _, row in df.iterrows()
+    ]
+
+
+def run_legacy(df, batch_size):
+    data_tuples = legacy_build_tuples(df)
+    rows = 0
+    for i in range(0, len(data_tuples), batch_size):
+        rows += len(data_tuples[i:i + batch_size])
+    return rows
+
+
+def run_batched(df, batch_size):
+    rows = 0
+    for _, batch in iter_db_batches(df, batch_size):
+        rows += len(batch)
+    return rows
+
+
+def sample_frame(rows, seed=42):
+    """Small synthetic frame with the cleaned column set"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, rows), unit='D')
+    return pd.DataFrame({
+        'stop_date': dates.strftime('%Y-%m-%d'),
+        'stop_time': pd.Series(rng.integers(0, 24, rows)).astype(str).str.zfill(2) + ':'
+                     + pd.Series(rng.integers(0, 60, rows)).astype(str).str.zfill(2),
+        'country_name': rng.choice(['Canada', 'India', 'USA'], rows),
+        'driver_gender': rng.choice(['M', 'F'], rows),
+        'driver_age_raw': rng.integers(1940, 2005, rows),
+        'driver_age': rng.integers(16, 80, rows),
+        'driver_race': rng.choice(['White', 'Black', 'Asian', 'Hispanic', 'Other'], rows),
+        'violation_raw': rng.choice(['Speeding', 'Equipment', 'Moving violation', 'Other'], rows),
+        'violation': rng.choice(['Speeding', 'Equipment', 'Moving violation', 'Other'], rows),
+        'search_conducted': rng.random(rows) < 0.05,
+        'search_type': rng.choice(['Unknown', 'Frisk', 'Vehicle Search'], rows),
+        'stop_outcome': rng.choice(['Citation', 'Warning', 'Arrest Driver', 'Ticket'], rows),
+        'is_arrested': rng.random(rows) < 0.03,
+        'stop_duration': rng.choice(['0-15 Min', '16-30 Min', '30+ Min'], rows),
+        'drugs_related_stop': rng.random(rows) < 0.01,
+        'vehicle_number': pd.Series(rng.integers(0, 10 ** 6, rows)).map(lambda n: f"UP{n:06d}"),
+    })[INSERT_COLUMNS]
+
+
+def measure(name, func, df, batch_size):
+    # Timed and memory-traced in separate runs, tracing slows allocation-heavy code
+    start = time.perf_counter()
+    rows = func(df, batch_size)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(df, batch_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {name:<10} {rows / elapsed:>12,.0f} rows/s   {elapsed:>8.2f} s   peak {peak / 1024 / 1024:>8.1f} MB")
+    return rows / elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark insert tuple building")
+    parser.add_argument('cleaned_file', nargs='?', default=None)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.cleaned_file:
+        if not os.path.exists(args.cleaned_file):
+            print(f"✗ File not found: {args.cleaned_file}")
+            sys.exit(1)
+        if args.cleaned_file.endswith('.parquet'):
+            df = pd.read_parquet(args.cleaned_file)
+        else:
+            df = pd.read_csv(args.cleaned_file, dtype=read_dtypes())
+        df = df.head(args.rows)
+    else:
+        df = sample_frame(args.rows)
+
+    print("=" * 60)
+    print(f"INSERT TUPLE BUILDING: {len(df):,} rows, batch size {args.batch_size}")
+    print("=" * 60)
+    legacy_rate, legacy_peak = measure('iterrows', run_legacy, df, args.batch_size)
+    batched_rate, batched_peak = measure('batched', run_batched, df, args.batch_size)
+    print(f"\nSpeedup: {batched_rate / legacy_rate:.1f}x, peak memory: {legacy_peak / max(batched_peak, 1):.1f}x lower")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+End-to-End Ingestion Benchmark
+Runs preprocessing (step 1), cleaned file parsing, insert tuple building and
+inserts into a local SQLite stand-in database (step 2) on synthetic data,
+and appends rows/s and peak RSS per stage to a CSV results file so runs can
+be compared across commits
+
+Each stage runs in a fresh process, so its peak RSS is its own; inputs a
+stage needs (the parsed cleaned file) are loaded before its timer starts
+
+Usage: python3 benchmark_pipeline.py [--size 100k|1m|10m | --rows N | --input raw.csv]
+                                     [--preprocess-mode memory|streaming] [--format parquet|csv]
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from column_profile import peak_rss_mb
+from generate_traffic_stops import DEFAULT_SEED, SIZES, generate_file
+
+DATA_DIR = 'benchmark_data'
+RESULTS_FILE = 'benchmark_results.csv'
+RESULT_FIELDS = ['timestamp', 'commit', 'dataset_rows', 'stage', 'rows', 'seconds', 'rows_per_s', 'peak_rss_mb']
+STAGES = ['preprocess', 'parse', 'tuples', 'insert']
+
+
+def _step(name):
+    # Step scripts start with a digit, so they cannot be imported with a plain import statement
+    return importlib.import_module(name)
+
+
+def stage_preprocess(raw_file, cleaned_file, mode, output_format):
+    step1 = _step('1st_step_data_preprocessing')
+    with open(raw_file, 'rb') as f:
+        rows = sum(1 for _ in f) - 1
+    start = time.perf_counter()
+    if mode == 'streaming':
+        step1.clean_streaming(raw_file, cleaned_file, output_format)
+    else:
+        step1.clean_in_memory(raw_file, cleaned_file, output_format)
+    return rows, time.perf_counter() - start
+
+
+def stage_parse(cleaned_file):
+    step2 = _step('2nd_step_db_schema_connection_setup')
+    start = time.perf_counter()
+    df = step2.load_cleaned_data(cleaned_file)
+    return len(df), time.perf_counter() - start
+
+
+def stage_tuples(cleaned_file, batch_size):
+    from traffic_schema import db_batch_rows, prepare_db_columns
+    df = _step('2nd_step_db_schema_connection_setup').load_cleaned_data(cleaned_file)
+    start = time.perf_counter()
+    prepared = prepare_db_columns(df)
+    rows = 0
+    for i in range(0, len(df), batch_size):
+        rows += len(db_batch_rows(prepared, i, min(i + batch_size, len(df))))
+    return rows, time.perf_counter() - start
+
+
+def stage_insert(cleaned_file, db_path, batch_size):
+    from db_backend import EmbeddedConnection
+    from sql_queries import get_create_embedded_table_queries
+    step2 = _step('2nd_step_db_schema_connection_setup')
+    df = step2.load_cleaned_data(cleaned_file)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = EmbeddedConnection('sqlite', db_path)
+    cursor = connection.cursor()
+    for query in get_create_embedded_table_queries(step2.TABLE_NAME, 'sqlite'):
+        cursor.execute(query)
+    connection.commit()
+    cursor.close()
+    start = time.perf_counter()
+    step2.insert_data(connection, df, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return len(df), elapsed
+
+
+STAGE_FUNCTIONS = {
+    'preprocess': stage_preprocess,
+    'parse': stage_parse,
+    'tuples': stage_tuples,
+    'insert': stage_insert,
+}
+
+
+def _run_stage(name, args):
+    # Pipeline output would drown the report, keep only the measurements
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows, seconds = STAGE_FUNCTIONS[name](*args)
+    return rows, seconds, peak_rss_mb()
+
+
+def run_stage(name, args):
+    """Run one stage in a fresh process: (rows, seconds, peak RSS in MB)"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run_stage, name, args).result()
+
+
+def current_commit():
+    """Short hash of the checked-out commit, or 'unknown' outside a git checkout"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def append_results(results_file, rows):
+    """Append result rows, writing the header for a new file"""
+    new_file = not os.path.exists(results_file)
+    with open(results_file, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing and ingestion stages on synthetic data")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--size', choices=list(SIZES), default='100k')
+    source.add_argument('--rows', type=int, default=None)
+    source.add_argument('--input', default=None, help="Existing raw CSV instead of generated data")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--preprocess-mode', choices=['memory', 'streaming'], default='memory')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--results', default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    if args.input:
+        raw_file = args.input
+    else:
+        # Generated files are reused across runs, the seed makes them identical anyway
+        rows = args.rows or SIZES[args.size]
+        raw_file = os.path.join(args.data_dir, f"traffic_stops_synthetic_{rows}_{args.seed}.csv")
+        if not os.path.exists(raw_file):
+            print(f"Generating {rows:,} rows into {raw_file}...")
+            generate_file(raw_file, rows, args.seed)
+    cleaned_file = os.path.join(args.data_dir, f"traffic_stops_cleaned.{args.format}")
+    db_path = os.path.join(args.data_dir, 'traffic_stops_benchmark.sqlite')
+
+    if args.stages[0] != 'preprocess' and not os.path.exists(cleaned_file):
+        print(f"✗ {cleaned_file} not found, include the preprocess stage")
+        sys.exit(1)
+
+    stage_args = {
+        'preprocess': (raw_file, cleaned_file, args.preprocess_mode, args.format),
+        'parse': (cleaned_file,),
+        'tuples': (cleaned_file, args.batch_size),
+        'insert': (cleaned_file, db_path, args.batch_size),
+    }
+
+    print("=" * 60)
+    print(f"PIPELINE BENCHMARK: {raw_file}")
+    print("=" * 60)
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    commit = current_commit()
+    results = []
+    for name in STAGES:
+        if name not in args.stages:
+            continue
+        rows, seconds, peak = run_stage(name, stage_args[name])
+        rate = rows / max(seconds, 1e-9)
+        print(f"  {name:<11}{rate:>12,.0f} rows/s   {seconds:>8.2f} s   peak RSS {peak:>8.1f} MB")
+        results.append({
+            'timestamp': timestamp, 'commit': commit, 'dataset_rows': results[0]['rows'] if results else rows,
+            'stage': name, 'rows': rows, 'seconds': round(seconds, 3),
+            'rows_per_s': round(rate), 'peak_rss_mb': round(peak, 1),
+        })
+
+    append_results(args.results, results)
+    print(f"\n✓ Results appended to {args.results} (commit {commit})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Synthetic Traffic Stops Generator
+Writes a seeded raw traffic stops CSV with the production column set,
+realistic category cardinalities and skew, repeat vehicles and missing
+value rates, so steps 1 and 2 can be benchmarked without the real export
+
+Usage: python3 generate_traffic_stops.py [output_file] [--rows N | --size 100k|1m|10m] [--seed N]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+SIZES = {
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+DEFAULT_SEED = 42
+CHUNK_ROWS = 500_000
+
+COUNTRIES = (['USA', 'Canada', 'India'], [0.55, 0.25, 0.20])
+GENDERS = (['M', 'F'], [0.68, 0.32])
+RACES = (['White', 'Black', 'Hispanic', 'Asian', 'Other'], [0.69, 0.15, 0.11, 0.03, 0.02])
+# violation_raw -> violation, with the share of stops of each raw violation
+VIOLATIONS = [
+    ('Speeding', 'Speeding', 0.56),
+    ('Other Traffic Violation', 'Moving violation', 0.19),
+    ('Equipment/Inspection Violation', 'Equipment', 0.12),
+    ('Registration Violation', 'Registration/plates', 0.04),
+    ('Seatbelt Violation', 'Seat belt', 0.03),
+    ('Special Detail/Directed Patrol', 'Other', 0.03),
+    ('Call for Service', 'Other', 0.02),
+    ('Violation of City/Town Ordinance', 'Other', 0.005),
+    ('Motorist Assist/Courtesy', 'Other', 0.003),
+    ('APB', 'Other', 0.002),
+]
+SEARCH_TYPES = (['Incident to Arrest', 'Probable Cause', 'Inventory', 'Reasonable Suspicion',
+                 'Protective Frisk', 'Incident to Arrest,Inventory', 'Probable Cause,Reasonable Suspicion'],
+                [0.35, 0.25, 0.08, 0.08, 0.06, 0.1, 0.08])
+OUTCOMES = (['Citation', 'Warning', 'Arrest Driver', 'No Action', 'N/D', 'Arrest Passenger'],
+            [0.89, 0.06, 0.03, 0.01, 0.005, 0.005])
+DURATIONS = (['0-15 Min', '16-30 Min', '30+ Min'], [0.80, 0.16, 0.04])
+# Stops per hour of day, busiest in the morning and late evening
+HOUR_WEIGHTS = np.array([5, 4, 3, 2, 1, 1, 2, 4, 7, 8, 9, 8, 7, 7, 6, 6, 6, 5, 5, 5, 5, 5, 6, 6], dtype=float)
+PLATE_STATES = ['UP', 'MH', 'DL', 'KA', 'TN', 'GJ', 'RJ', 'WB', 'HR', 'PB']
+
+SEARCH_RATE = 0.035
+ARREST_RATE = 0.035
+DRUGS_RATE = 0.009
+# Rows whose driver details and outcome were never recorded
+MISSING_DETAILS_RATE = 0.057
+MISSING_AGE_RATE = 0.002
+# Distinct vehicles per stop; repeat offenders follow a heavy-tailed distribution
+VEHICLE_RATIO = 0.6
+START_DATE = pd.Timestamp('2005-01-01')
+DAYS = 11 * 365
+
+RAW_COLUMNS = [
+    'stop_date', 'stop_time', 'country_name', 'county_name', 'driver_gender', 'driver_age_raw',
+    'driver_age', 'driver_race', 'violation_raw', 'violation', 'search_conducted', 'search_type',
+    'stop_outcome', 'is_arrested', 'stop_duration', 'drugs_related_stop', 'vehicle_number',
+]
+
+
+def _choice(rng, options, rows):
+    values, weights = options
+    weights = np.asarray(weights, dtype=float)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), rows, p=weights / weights.sum())]
+
+
+def plate_numbers(indexes, seed):
+    """Deterministic plates like UP76DY3473 for vehicle indexes"""
+    # Multiplicative hashing spreads consecutive indexes over the plate space
+    mixed = (indexes.astype(np.uint64) * np.uint64(2654435761) + np.uint64(seed)) % np.uint64(2 ** 32)
+    serial = (indexes.astype(np.uint64) * np.uint64(40503) + np.uint64(seed)) % np.uint64(9000) + np.uint64(1000)
+    return np.array([
+        f"{PLATE_STATES[m % 10]}{10 + (m // 10) % 90}{chr(65 + (m // 900) % 26)}{chr(65 + (m // 23400) % 26)}{n}"
+        for m, n in zip(mixed.tolist(), serial.tolist())
+    ], dtype=object)
+
+
+def vehicle_numbers(rng, rows, total_rows, seed):
+    """Plates drawn with a skewed distribution so some vehicles are stopped many times"""
+    vehicles = max(1, int(total_rows * VEHICLE_RATIO))
+    # Low indexes are frequent: u**1.5 concentrates draws near zero
+    indexes = np.minimum((rng.random(rows) ** 1.5 * vehicles).astype(np.int64), vehicles - 1)
+    unique, codes = np.unique(indexes, return_inverse=True)
+    return plate_numbers(unique, seed)[codes]
+
+
+def generate_chunk(rows, total_rows, seed, chunk_index):
+    """One chunk of raw rows; each chunk has its own seeded stream so output is reproducible"""
+    rng = np.random.default_rng([seed, 0, chunk_index])
+
+    dates = START_DATE + pd.to_timedelta(rng.integers(0, DAYS, rows), unit='D')
+    hours = rng.choice(24, rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    minutes = rng.integers(0, 60, rows)
+    # Right-skewed ages from 16, most drivers in their twenties and thirties
+    ages = np.minimum(16 + np.floor(rng.gamma(2.0, 10.0, rows)), 99)
+    birth_years = dates.year.to_numpy() - ages
+
+    violation = rng.choice(len(VIOLATIONS), rows, p=np.array([v[2] for v in VIOLATIONS]) / sum(v[2] for v in VIOLATIONS))
+    searched = rng.random(rows) < SEARCH_RATE
+    arrested = rng.random(rows) < np.where(searched, ARREST_RATE * 8, ARREST_RATE * 0.7)
+    outcome = _choice(rng, OUTCOMES, rows)
+    outcome[arrested] = 'Arrest Driver'
+
+    df = pd.DataFrame({
+        'stop_date': dates.strftime('%Y-%m-%d'),
+        'stop_time': [f"{h:02d}:{m:02d}" for h, m in zip(hours, minutes)],
+        'country_name': _choice(rng, COUNTRIES, rows),
+        'county_name': np.nan,
+        'driver_gender': _choice(rng, GENDERS, rows),
+        'driver_age_raw': birth_years,
+        'driver_age': ages,
+        'driver_race': _choice(rng, RACES, rows),
+        'violation_raw': np.array([v[0] for v in VIOLATIONS], dtype=object)[violation],
+        'violation': np.array([v[1] for v in VIOLATIONS], dtype=object)[violation],
+        'search_conducted': searched,
+        'search_type': np.where(searched, _choice(rng, SEARCH_TYPES, rows), None),
+        'stop_outcome': outcome,
+        'is_arrested': arrested.astype(object),
+        'stop_duration': _choice(rng, DURATIONS, rows),
+        'drugs_related_stop': rng.random(rows) < np.where(searched, DRUGS_RATE * 15, DRUGS_RATE * 0.5),
+        'vehicle_number': vehicle_numbers(rng, rows, total_rows, seed),
+    })
+
+    missing = rng.random(rows) < MISSING_DETAILS_RATE
+    for column in ['driver_gender', 'driver_age_raw', 'driver_age', 'driver_race', 'violation_raw',
+                   'violation', 'stop_outcome', 'is_arrested', 'stop_duration']:
+        df[column] = df[column].astype(object).where(~missing, None)
+    df.loc[rng.random(rows) < MISSING_AGE_RATE, 'driver_age'] = None
+    return df[RAW_COLUMNS]
+
+
+def generate_file(output_file, rows, seed=DEFAULT_SEED, chunk_rows=CHUNK_ROWS):
+    """Write rows raw traffic stops to a CSV, one chunk at a time"""
+    for chunk_index, start in enumerate(range(0, rows, chunk_rows)):
+        chunk = generate_chunk(min(chunk_rows, rows - start), rows, seed, chunk_index)
+        chunk.to_csv(output_file, index=False, header=(chunk_index == 0), mode='w' if chunk_index == 0 else 'a')
+        print(f"  Wrote {start + len(chunk):,}/{rows:,} rows")
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic raw traffic stops CSV")
+    parser.add_argument('output_file', nargs='?', default=None)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--rows', type=int, default=None)
+    group.add_argument('--size', choices=list(SIZES), default='100k')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+
+    rows = args.rows or SIZES[args.size]
+    output_file = args.output_file or f"traffic_stops_synthetic_{args.rows or args.size}.csv"
+
+    print("=" * 60)
+    print(f"GENERATING {rows:,} SYNTHETIC TRAFFIC STOPS (seed {args.seed})")
+    print("=" * 60)
+    start = time.perf_counter()
+    generate_file(output_file, rows, args.seed)
+    print(f"\n✓ Saved to: {output_file} ({time.perf_counter() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
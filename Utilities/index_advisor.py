@@ -0,0 +1,359 @@
+"""
+Index Advisor for the Dashboard Queries
+Runs EXPLAIN on every SELECT that sql_queries.py and analytics_queries.py
+build against traffic_stops and its rollups, flags full table scans and
+sorts (filesort, temporary tables and B-trees, Sort/TopN operators) and, for
+flagged queries, proposes a composite index: its equality filters, GROUP BY
+columns and range filter, followed by the other columns it reads when they
+fit, making it covering. Proposals sharing their leading columns are merged,
+and the ones no existing or migrated index serves are printed as an
+INDEX_MIGRATIONS entry for traffic_schema.py, together with the indexes
+that are a left prefix of another one and can be dropped
+
+With --apply, pending INDEX_MIGRATIONS versions are applied to the table and
+recorded in schema_migrations, and every query is timed before and after
+
+Usage: python3 index_advisor.py [--backend mysql|duckdb|sqlite] [--schema wide|compact]
+                                [--apply] [--repeat N] [--only QUERY_FUNCTION ...]
+"""
+
+import argparse
+import importlib
+import inspect
+import re
+import statistics
+import sys
+import time
+
+import analytics_queries
+import sql_queries
+from db_backend import (BACKENDS, DATABASE_ERRORS, SCHEMA_LAYOUTS, connect_backend, get_backend_name,
+                        get_schema_layout, is_embedded, read_query)
+from index_migrations import apply_migrations, index_names, pending_migrations
+from query_cache import normalize_query, tables_read
+from traffic_schema import GENERATED_COLUMNS, INDEX_MIGRATIONS, INITIAL_TABLE_INDEXES, NATURAL_KEY_INDEX, SCHEMA
+
+TABLE_NAME = 'traffic_stops'
+QUERIED_TABLES = {TABLE_NAME, sql_queries.get_rollup_table_name(TABLE_NAME),
+                  sql_queries.get_vehicle_rollup_table_name(TABLE_NAME)}
+# Columns an index can hold, the stored generated ones included
+INDEXABLE_COLUMNS = set(SCHEMA) | {column.name for column in GENERATED_COLUMNS}
+# InnoDB allows 16 columns per index; wider proposals drop the covering columns
+MAX_INDEX_COLUMNS = 8
+# Queries with %s placeholders are explained with these sample arguments
+QUERY_PARAMETERS = {
+    'get_vehicle_summary_query': ['vehicle_number'],
+    'get_vehicle_history_page_query': ['vehicle_number'],
+}
+
+_CLAUSE_END = r"(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bHAVING\b|\bLIMIT\b|\)|$)"
+
+
+def _step(name):
+    # Step scripts start with a digit, so they cannot be imported with a plain import statement
+    return importlib.import_module(name)
+
+
+def sample_arguments(connection):
+    """Query function arguments taken from a stored stop, so filters match real rows"""
+    row = read_query(connection, sql_queries.get_sample_data_query(TABLE_NAME, 1)).iloc[0]
+    return {
+        'table_name': TABLE_NAME,
+        'column_name': 'violation',
+        'vehicle_number': row['vehicle_number'],
+        'violation': row['violation'],
+        'driver_race': row['driver_race'],
+        'driver_gender': row['driver_gender'],
+        'driver_age': int(row['driver_age']),
+    }
+
+
+def dashboard_queries(arguments):
+    """(function name, query, params) for every SELECT on traffic_stops or its rollups the query modules build"""
+    queries = []
+    for module in (sql_queries, analytics_queries):
+        for name, function in inspect.getmembers(module, inspect.isfunction):
+            if function.__module__ != module.__name__ or not name.endswith('_query'):
+                continue
+            parameters = inspect.signature(function).parameters.values()
+            if any(parameter.name not in arguments and parameter.default is parameter.empty
+                   for parameter in parameters):
+                continue
+            query = function(**{parameter.name: arguments[parameter.name]
+                                for parameter in parameters if parameter.name in arguments})
+            if not re.match(r"\s*(SELECT|WITH)\b", query, re.IGNORECASE):
+                continue
+            if not tables_read(query) or not tables_read(query) <= QUERIED_TABLES:
+                continue
+            params = None
+            if '%s' in query:
+                if name not in QUERY_PARAMETERS:
+                    continue
+                params = tuple(arguments[argument] for argument in QUERY_PARAMETERS[name])
+            queries.append((name, query, params))
+    return queries
+
+
+def explain(connection, query, params=None):
+    """Query plan as a DataFrame"""
+    dialect = connection.dialect if is_embedded(connection) else 'mysql'
+    return read_query(connection, sql_queries.get_explain_query(query, dialect), params)
+
+
+def plan_issues(plan):
+    """Full scans and sorts in a MySQL, TiDB, SQLite or DuckDB plan"""
+    columns = {column.lower(): column for column in plan.columns}
+    issues = []
+    if 'type' in columns and 'extra' in columns:
+        # MySQL: access type ALL reads every row
+        extra = plan[columns['extra']].fillna('').astype(str)
+        if (plan[columns['type']] == 'ALL').any():
+            issues.append('full scan')
+        if extra.str.contains('filesort').any():
+            issues.append('filesort')
+        if extra.str.contains('temporary').any():
+            issues.append('temporary table')
+    elif 'detail' in columns:
+        # SQLite EXPLAIN QUERY PLAN: SCAN without an index reads every row
+        detail = plan[columns['detail']].astype(str)
+        if detail.str.contains(rf"^SCAN {TABLE_NAME}\w*(?!.*USING (?:COVERING )?INDEX)", regex=True).any():
+            issues.append('full scan')
+        if detail.str.contains('TEMP B-TREE').any():
+            issues.append('filesort')
+    else:
+        # TiDB operator ids, DuckDB plan text
+        text = ' '.join(plan.astype(str).to_numpy().ravel())
+        if re.search(r"TableFullScan|SEQ_SCAN", text):
+            issues.append('full scan')
+        if re.search(r"\bSort_|\bTopN|ORDER_BY|TOP_N", text):
+            issues.append('sort')
+    return issues
+
+
+def _schema_columns(text):
+    return [column for column in re.findall(r"\b\w+\b", text) if column in INDEXABLE_COLUMNS]
+
+
+def _unique(columns):
+    return list(dict.fromkeys(columns))
+
+
+def propose_index(query):
+    """(key columns, covering columns) of an index for a query on traffic_stops, or None
+
+    The key holds equality filters, then GROUP BY columns (or plain ORDER BY
+    columns), then one range filter; the covering columns are the other ones
+    the query reads, when the index stays within MAX_INDEX_COLUMNS. None when
+    nothing filters, groups or sorts
+    """
+    if TABLE_NAME not in tables_read(query):
+        return None
+    text = normalize_query(query)
+    where = re.search(rf"\bWHERE\b(.*?){_CLAUSE_END}", text, re.IGNORECASE)
+    where = where.group(1) if where else ''
+    equality = [column for column in re.findall(r"\b(\w+)\s*=", where) if column in INDEXABLE_COLUMNS]
+    ranges = [column for column in re.findall(r"\b(\w+)\s+(?:BETWEEN|IN\s*\(|[<>]=?)", where, re.IGNORECASE)
+              if column in INDEXABLE_COLUMNS]
+    grouping = re.search(rf"\bGROUP\s+BY\b(.*?){_CLAUSE_END}", text, re.IGNORECASE)
+    ordering = re.search(rf"\bORDER\s+BY\b(.*?){_CLAUSE_END}", text, re.IGNORECASE)
+    if grouping:
+        # Only plain columns, HOUR(stop_time) and similar expressions cannot use the index order;
+        # the generated stop_hour, stop_year and stop_month columns can
+        grouped = [part.strip() for part in grouping.group(1).split(',')]
+    elif ordering and ranges == []:
+        grouped = [part.strip().split()[0] for part in ordering.group(1).split(',')]
+    else:
+        grouped = []
+    grouped = [column for column in grouped if column in INDEXABLE_COLUMNS]
+
+    key = _unique(equality + grouped + ranges[:1])
+    if not key:
+        return None
+    covering = [column for column in _unique(_schema_columns(text)) if column not in key]
+    if len(key) + len(covering) > MAX_INDEX_COLUMNS:
+        covering = []
+    return key, covering
+
+
+def index_serves(index_columns, key, covering):
+    """Whether an index leads with the key columns and holds the covering ones"""
+    columns = [column.strip() for column in index_columns.split(',')]
+    return columns[:len(key)] == key and set(covering) <= set(columns)
+
+
+def redundant_indexes(indexes):
+    """(name, wider index name) for each index whose columns lead another index
+
+    The natural key stays, its uniqueness is not served by a wider index
+    """
+    columns = {name: [column.strip() for column in index_columns.split(',')] for name, index_columns in indexes}
+    redundant = []
+    for name, index_columns in columns.items():
+        if name == NATURAL_KEY_INDEX[0]:
+            continue
+        wider = next((other for other, other_columns in columns.items()
+                      if other != name and other_columns[:len(index_columns)] == index_columns
+                      and (len(other_columns) > len(index_columns) or other < name)), None)
+        if wider:
+            redundant.append((name, wider))
+    return redundant
+
+
+def index_name(columns):
+    """Name for a proposed index"""
+    return f"idx_{'_'.join(columns[:3])}"[:64]
+
+
+def time_query(connection, query, params, repeat):
+    """Median milliseconds of a query over repeat runs"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        read_query(connection, query, params)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def measure(connection, queries, repeat):
+    """{function name: (plan issues, median ms)}, or (None, error) when a query fails"""
+    results = {}
+    for name, query, params in queries:
+        try:
+            results[name] = (plan_issues(explain(connection, query, params)),
+                             time_query(connection, query, params, repeat))
+        except DATABASE_ERRORS as e:
+            results[name] = (None, str(e).splitlines()[0])
+    return results
+
+
+def print_measurements(results):
+    for name, (issues, value) in results.items():
+        if issues is None:
+            print(f"  ✗ {name:<48} failed: {value}")
+        else:
+            print(f"  {'✗' if issues else '✓'} {name:<48} {value:>9.1f} ms   {', '.join(issues) or 'indexed'}")
+
+
+def print_proposals(queries, results, known_indexes):
+    """Propose indexes for the flagged queries no known index serves and drops of redundant ones, as a migration"""
+    # {key columns: (covering columns, query function names)}
+    proposals = {}
+    for name, query, _ in queries:
+        issues, _ = results[name]
+        proposal = propose_index(query) if issues else None
+        if proposal is None:
+            continue
+        key, covering = proposal
+        if any(index_serves(existing, key, covering) for _, existing in known_indexes):
+            continue
+        merged_covering, names = proposals.setdefault(tuple(key), ([], []))
+        merged_covering += [column for column in covering if column not in merged_covering]
+        names.append(name)
+    # An index leading with a longer key serves the shorter one too
+    for key in sorted(proposals, key=len):
+        wider = next((other for other in proposals if len(other) > len(key) and other[:len(key)] == key), None)
+        if wider:
+            covering, names = proposals.pop(key)
+            proposals[wider][0].extend(column for column in covering
+                                       if column not in wider and column not in proposals[wider][0])
+            proposals[wider][1].extend(names)
+
+    proposed = []
+    for key, (covering, names) in proposals.items():
+        # Covering columns beyond the limit are dropped, those queries then read the table for them
+        columns = list(key) + covering[:max(0, MAX_INDEX_COLUMNS - len(key))]
+        proposed.append((index_name(columns), ', '.join(columns), names))
+
+    # Every query a left prefix serves, the wider index serves as well
+    redundant = redundant_indexes(known_indexes + [(name, columns) for name, columns, _ in proposed])
+    if redundant:
+        print(f"\nRedundant indexes:")
+        for name, wider in redundant:
+            print(f"  ✗ {name:<24} left prefix of {wider}")
+
+    if not proposals:
+        print("\n✓ Every filtering or grouping query is served by an existing or migrated index")
+        if not redundant:
+            return
+    next_version = max((version for version, *_ in INDEX_MIGRATIONS), default=0) + 1
+    print(f"\nProposed migration for INDEX_MIGRATIONS in traffic_schema.py:")
+    print(f"    ({next_version}, 'Indexes proposed by index_advisor.py', [")
+    for name, columns, names in proposed:
+        print(f"        # {', '.join(names)}")
+        print(f"        ('{name}', '{columns}'),")
+    print(f"    ], [{', '.join(repr(name) for name, _ in redundant)}]),")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the dashboard queries and apply index migrations")
+    parser.add_argument('--backend', choices=BACKENDS, default=get_backend_name())
+    parser.add_argument('--schema', choices=SCHEMA_LAYOUTS, default=get_schema_layout(),
+                        help="Layout step 2 built; compact indexes go on the fact table")
+    parser.add_argument('--apply', action='store_true', help="Apply pending INDEX_MIGRATIONS and time again")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per query timing, the median is reported")
+    parser.add_argument('--only', nargs='+', default=None, help="Query function names to check")
+    args = parser.parse_args()
+
+    try:
+        connection = connect_backend(args.backend, _step('2nd_step_db_schema_connection_setup').DB_CONFIG)
+    except (ImportError, *DATABASE_ERRORS) as e:
+        print(f"✗ Error connecting to {args.backend}: {e}")
+        sys.exit(1)
+    compact = args.schema == 'compact'
+    table_name = sql_queries.get_facts_table_name(TABLE_NAME) if compact else TABLE_NAME
+
+    print("=" * 60)
+    print(f"INDEX ADVISOR: {connection.get_server_info()}")
+    print("=" * 60)
+
+    queries = dashboard_queries(sample_arguments(connection))
+    if args.only:
+        queries = [query for query in queries if query[0] in args.only]
+
+    existing = index_names(connection, table_name)
+    pending = pending_migrations(connection)
+    # Proposals are checked against wide column names, which the compact indexes map from
+    # Indexes the table has or gets from pending migrations, less the ones those drop
+    dropped = {name for *_, names in pending for name in names}
+    defined = INITIAL_TABLE_INDEXES + [index for _, _, indexes, _ in INDEX_MIGRATIONS for index in indexes]
+    known_indexes = [index for index in defined + [NATURAL_KEY_INDEX]
+                     if index[0] in existing and index[0] not in dropped]
+    known_indexes += [index for _, _, indexes, _ in pending for index in indexes]
+
+    print(f"\nQuery plans and timings ({len(queries)} queries, median of {args.repeat}):")
+    before = measure(connection, queries, args.repeat)
+    print_measurements(before)
+    print_proposals(queries, before, known_indexes)
+
+    if pending:
+        print(f"\nPending migrations on {table_name}:")
+        for version, description, indexes, names in pending:
+            drops = f"; drops {', '.join(names)}" if names else ''
+            print(f"  {version}: {description} ({', '.join(name for name, _ in indexes)}{drops})")
+    else:
+        print(f"\n✓ {table_name} has every migration in INDEX_MIGRATIONS")
+
+    if args.apply and pending:
+        print(f"\nApplying migrations")
+        try:
+            apply_migrations(connection, table_name, compact)
+        except DATABASE_ERRORS as e:
+            print(f"✗ Error applying migrations, rerun to finish them: {e}")
+            connection.close()
+            sys.exit(1)
+        after = measure(connection, queries, args.repeat)
+        print(f"\nBefore/after timings:")
+        for name, (issues, value) in after.items():
+            old_issues, old_value = before[name]
+            if issues is None or old_issues is None:
+                print(f"  ✗ {name:<48} failed: {value if issues is None else old_value}")
+                continue
+            change = f"{', '.join(old_issues) or 'indexed'} -> {', '.join(issues) or 'indexed'}"
+            print(f"  {name:<48} {old_value:>9.1f} ms -> {value:>9.1f} ms "
+                  f"({old_value / max(value, 1e-9):.1f}x)   {change}")
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Shared Test Fixtures
+Puts the script directories on sys.path the way the scripts import each
+other, and builds small traffic_stops tables in the embedded engines
+"""
+
+import datetime
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('SQL_Queries', 'Core_Scripts', 'Utilities'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+from db_backend import EmbeddedConnection
+from sql_queries import get_create_embedded_table_queries, get_insert_query
+from traffic_schema import INSERT_COLUMNS
+
+TABLE_NAME = 'traffic_stops'
+EMBEDDED_DIALECTS = ['duckdb', 'sqlite']
+
+VIOLATIONS = ['Speeding', 'DUI', 'Seatbelt']
+RACES = ['Asian', 'White']
+GENDERS = ['M', 'F']
+OUTCOMES = ['Citation', 'Warning', 'Arrest']
+
+
+def sample_stops(count=600, seed=7):
+    """Stops as dicts by INSERT_COLUMNS over few groups and ages, so age windows overlap many rows"""
+    rng = random.Random(seed)
+    start = datetime.date(2020, 1, 1)
+    stops = []
+    for i in range(count):
+        violation = rng.choice(VIOLATIONS)
+        # A few rows without an age, which neither the cube nor the age window counts
+        age = None if i % 97 == 0 else rng.randint(18, 40)
+        stops.append(dict(zip(INSERT_COLUMNS, (
+            (start + datetime.timedelta(days=i // 24)).isoformat(),
+            f"{i % 24:02d}:00:00",
+            rng.choice(['Canada', 'India', 'USA']),
+            rng.choice(GENDERS),
+            age,
+            age,
+            rng.choice(RACES),
+            violation,
+            violation,
+            rng.random() < 0.3,
+            'Vehicle Search',
+            rng.choice(OUTCOMES),
+            rng.random() < 0.2,
+            '0-15 Min',
+            rng.random() < 0.1,
+            f"V{i % 50:03d}",
+        ))))
+    return stops
+
+
+def insert_stops(connection, stops):
+    cursor = connection.cursor()
+    cursor.executemany(get_insert_query(TABLE_NAME), [tuple(stop[name] for name in INSERT_COLUMNS) for stop in stops])
+    connection.commit()
+    cursor.close()
+
+
+@pytest.fixture(params=EMBEDDED_DIALECTS)
+def connection(request, tmp_path):
+    """Connection to an empty traffic_stops table in each embedded engine"""
+    connection = EmbeddedConnection(request.param, str(tmp_path / f"traffic_stops.{request.param}"))
+    cursor = connection.cursor()
+    for query in get_create_embedded_table_queries(TABLE_NAME, request.param):
+        cursor.execute(query)
+    connection.commit()
+    cursor.close()
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def stops_connection(connection):
+    """Connection to a traffic_stops table holding sample_stops()"""
+    insert_stops(connection, sample_stops())
+    return connection
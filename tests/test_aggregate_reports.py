@@ -0,0 +1,81 @@
+"""Reports derived from the shared aggregates against the SQL queries they replace"""
+
+import pandas as pd
+import pytest
+
+import aggregate_reports
+import analytics_queries
+from conftest import EMBEDDED_DIALECTS, TABLE_NAME, insert_stops, sample_stops
+from db_backend import EmbeddedConnection, read_query
+from sql_queries import get_create_embedded_table_queries
+
+VIOLATION_REPORTS = [
+    ('get_violations_search_arrest_query', 'violations_search_arrest'),
+    ('get_low_risk_violations_query', 'low_risk_violations'),
+    ('get_young_driver_violations_query', 'young_driver_violations'),
+    ('get_avg_duration_by_violation_query', 'avg_duration_by_violation'),
+    ('get_high_search_arrest_violations_query', 'high_search_arrest_violations'),
+    ('get_top_5_violations_arrest_rate_query', 'top_5_violations_arrest_rate'),
+]
+COUNTRY_REPORTS = [
+    ('get_drug_stops_by_country_query', 'drug_stops_by_country'),
+    ('get_search_rate_by_country_query', 'search_rate_by_country'),
+    ('get_demographics_by_country_query', 'demographics_by_country'),
+]
+
+
+def varied_stops():
+    """Sample stops with a spread of durations and young drivers, and a rare violation under every threshold"""
+    stops = sample_stops(900, seed=5)
+    for i, stop in enumerate(stops):
+        stop['stop_duration'] = ['0-15 Min', '16-30 Min', '30+ Min'][i % 3]
+        if i % 40 == 0:
+            stop['violation'] = stop['violation_raw'] = 'Equipment'
+    return stops
+
+
+@pytest.fixture(scope='module', params=EMBEDDED_DIALECTS)
+def reports_connection(request, tmp_path_factory):
+    """One table of varied_stops() per engine, shared by the read-only report tests"""
+    path = tmp_path_factory.mktemp('reports') / f"traffic_stops.{request.param}"
+    connection = EmbeddedConnection(request.param, str(path))
+    cursor = connection.cursor()
+    for query in get_create_embedded_table_queries(TABLE_NAME, request.param):
+        cursor.execute(query)
+    connection.commit()
+    cursor.close()
+    insert_stops(connection, varied_stops())
+    yield connection
+    connection.close()
+
+
+def assert_same_report(expected, derived):
+    assert list(derived.columns) == list(expected.columns)
+    assert len(derived) == len(expected)
+    for column in expected.columns:
+        if pd.api.types.is_numeric_dtype(derived[column]):
+            assert pd.to_numeric(derived[column]).astype(float).tolist() == \
+                pytest.approx(pd.to_numeric(expected[column]).astype(float).tolist(), abs=1e-9, nan_ok=True), column
+        else:
+            assert derived[column].tolist() == expected[column].tolist(), column
+
+
+@pytest.mark.parametrize('query_name, report_name', VIOLATION_REPORTS)
+def test_violation_report_matches_its_query(reports_connection, query_name, report_name):
+    aggregates = read_query(reports_connection, analytics_queries.get_violation_aggregates_query(TABLE_NAME))
+    expected = read_query(reports_connection, getattr(analytics_queries, query_name)(TABLE_NAME))
+    assert_same_report(expected, getattr(aggregate_reports, report_name)(aggregates))
+
+
+@pytest.mark.parametrize('query_name, report_name', COUNTRY_REPORTS)
+def test_country_report_matches_its_query(reports_connection, query_name, report_name):
+    aggregates = read_query(reports_connection, analytics_queries.get_country_aggregates_query(TABLE_NAME))
+    expected = read_query(reports_connection, getattr(analytics_queries, query_name)(TABLE_NAME))
+    assert_same_report(expected, getattr(aggregate_reports, report_name)(aggregates))
+
+
+def test_percentage_rounds_half_away_from_zero():
+    # 1/8 is 12.5% and 2469/20000 is 12.345% exactly, which floating point would round down
+    assert aggregate_reports.percentage(pd.Series([1]), pd.Series([8]), digits=0).tolist() == [13.0]
+    assert aggregate_reports.percentage(pd.Series([2469]), pd.Series([20000])).tolist() == [12.35]
+    assert pd.isna(aggregate_reports.percentage(pd.Series([0]), pd.Series([0])).iloc[0])
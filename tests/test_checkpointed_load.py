@@ -0,0 +1,63 @@
+"""Checkpointed loads: resuming after committed rows, and natural-key upserts of re-sent rows"""
+
+import importlib
+
+import pandas as pd
+
+from conftest import TABLE_NAME, insert_stops, sample_stops
+from db_backend import read_query
+from traffic_schema import INSERT_COLUMNS
+
+step2 = importlib.import_module('2nd_step_db_schema_connection_setup')
+
+RUN_ID = 'test-run'
+BATCHING = {'batch_size': 20}
+
+
+def load(connection, df, checkpoints=None, loaders=1):
+    step2.create_checkpoint_table(connection)
+    step2.load_all(connection, df, 'insert', TABLE_NAME, loaders, RUN_ID,
+                   step2.load_checkpoints(connection, RUN_ID) if checkpoints is None else checkpoints, BATCHING)
+
+
+def table_rows(connection):
+    return read_query(connection, f"SELECT vehicle_number, stop_date, stop_time, violation, stop_outcome "
+                                  f"FROM {TABLE_NAME}")
+
+
+def test_checkpoints_record_the_committed_rows(connection):
+    df = pd.DataFrame(sample_stops(90), columns=INSERT_COLUMNS)
+    load(connection, df)
+    assert step2.load_checkpoints(connection, RUN_ID) == {0: (TABLE_NAME, 1, 90)}
+    step2.clear_checkpoints(connection, RUN_ID)
+    assert step2.load_checkpoints(connection, RUN_ID) == {}
+
+
+def test_resume_skips_committed_rows(connection):
+    stops = sample_stops(90)
+    # An earlier attempt committed the first 60 rows; marked so a re-send would show
+    insert_stops(connection, [dict(stop, stop_outcome='Committed') for stop in stops[:60]])
+    load(connection, pd.DataFrame(stops, columns=INSERT_COLUMNS), {0: (TABLE_NAME, 1, 60)})
+
+    rows = table_rows(connection)
+    assert len(rows) == 90
+    assert (rows['stop_outcome'] == 'Committed').sum() == 60
+
+
+def test_a_complete_slice_is_skipped(connection):
+    df = pd.DataFrame(sample_stops(40), columns=INSERT_COLUMNS)
+    load(connection, df, {0: (TABLE_NAME, 1, 40)})
+    assert table_rows(connection).empty
+
+
+def test_re_sent_rows_update_instead_of_duplicating(connection):
+    stops = sample_stops(80)
+    load(connection, pd.DataFrame(stops, columns=INSERT_COLUMNS), {})
+    # A later export repeats 30 stops with a new outcome, plus 10 new ones
+    resent = [dict(stop, stop_outcome='Amended') for stop in stops[50:]] + sample_stops(90)[80:]
+    load(connection, pd.DataFrame(resent, columns=INSERT_COLUMNS), {})
+
+    rows = table_rows(connection)
+    assert len(rows) == 90
+    assert (rows['stop_outcome'] == 'Amended').sum() == 30
+    assert not rows.duplicated(subset=['vehicle_number', 'stop_date', 'stop_time', 'violation']).any()
@@ -0,0 +1,84 @@
+"""Column profiles past max_distinct: bucketed counts, their medians and the exact refine pass"""
+
+import importlib
+import random
+
+import pandas as pd
+
+from column_profile import (merge_profiles, median_from_counts, new_profile, refine_medians,
+                            resolve_cleaning_plan, update_profile)
+from conftest import sample_stops
+from parallel_preprocessing import clean_files_parallel
+from traffic_schema import INSERT_COLUMNS
+
+step1 = importlib.import_module('1st_step_data_preprocessing')
+
+MAX_DISTINCT = 10
+
+
+def write_export(path, count=500, seed=3):
+    """Stops whose ages and an extra measurement column hold far more than MAX_DISTINCT values"""
+    rng = random.Random(seed)
+    df = pd.DataFrame(sample_stops(count, seed), columns=INSERT_COLUMNS)
+    ages = [None if i % 13 == 0 else rng.randint(16, 90) for i in range(count)]
+    df['driver_age'] = df['driver_age_raw'] = ages
+    df['speed_kmh'] = [None if i % 7 == 0 else round(rng.uniform(20, 180), 2) for i in range(count)]
+    df.to_csv(path, index=False)
+    return df
+
+
+def profile_chunks(path, chunk_size=64):
+    profile = new_profile()
+    for chunk in step1.read_csv_chunks(str(path), chunk_size):
+        update_profile(profile, chunk, MAX_DISTINCT)
+    return profile
+
+
+def test_streaming_output_matches_memory_output(tmp_path):
+    export = tmp_path / 'stops.csv'
+    write_export(export)
+    step1.clean_in_memory(str(export), str(tmp_path / 'memory.csv'))
+    step1.clean_streaming(str(export), str(tmp_path / 'streaming.csv'), chunk_size=64, max_distinct=MAX_DISTINCT)
+
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / 'streaming.csv'), pd.read_csv(tmp_path / 'memory.csv'))
+
+
+def test_refined_medians_match_pandas(tmp_path):
+    export = tmp_path / 'stops.csv'
+    df = write_export(export)
+    profile = profile_chunks(export)
+    assert all(profile['columns'][col]['width'] is not None for col in ('driver_age', 'speed_kmh'))
+
+    plan = resolve_cleaning_plan(profile)
+    for col in ('driver_age', 'speed_kmh'):
+        # The estimate is within half a bucket of the median, refining makes it exact
+        assert abs(plan['fill_values'][col] - df[col].median()) <= profile['columns'][col]['width'] / 2
+    refined = refine_medians(profile, plan, step1.read_csv_chunks(str(export), 64))
+    assert refined['fill_values']['driver_age'] == df['driver_age'].median()
+    assert refined['fill_values']['speed_kmh'] == df['speed_kmh'].median()
+
+
+def test_parallel_medians_match_pandas(tmp_path):
+    # Files bucketed at different widths merge at the coarser one
+    frames = [write_export(tmp_path / f"stops_{i}.csv", count, seed) for i, (count, seed) in
+              enumerate([(400, 3), (60, 4), (250, 5)])]
+    _, plan, _ = clean_files_parallel([str(tmp_path / f"stops_{i}.csv") for i in range(3)], str(tmp_path / 'out'),
+                                      'csv', workers=2, max_distinct=MAX_DISTINCT)
+    everything = pd.concat(frames)
+    assert plan['fill_values']['driver_age'] == everything['driver_age'].median()
+    assert plan['fill_values']['speed_kmh'] == everything['speed_kmh'].median()
+
+
+def test_merged_profiles_count_every_value(tmp_path):
+    write_export(tmp_path / 'a.csv', 300, 3)
+    write_export(tmp_path / 'b.csv', 40, 4)
+    merged = merge_profiles(profile_chunks(tmp_path / 'a.csv'), profile_chunks(tmp_path / 'b.csv', 500),
+                            MAX_DISTINCT)
+    column = merged['columns']['speed_kmh']
+    assert len(column['counts']) <= MAX_DISTINCT
+    assert sum(column['counts'].values()) == column['non_null']
+
+
+def test_median_from_exact_counts():
+    assert median_from_counts({1: 2, 5: 1, 9: 1}) == pd.Series([1, 1, 5, 9]).median()
+    assert median_from_counts({3.5: 3}) == 3.5
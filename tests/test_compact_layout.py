@@ -0,0 +1,79 @@
+"""Compact layout: dimension tables, a fact table of their keys and the traffic_stops view"""
+
+import importlib
+
+import pandas as pd
+
+from conftest import TABLE_NAME, sample_stops
+from db_backend import read_query
+from sql_queries import get_dimension_rows_query, get_facts_table_name
+from traffic_schema import COMPACT_INSERT_COLUMNS, DIMENSION_KEY_TYPES, INSERT_COLUMNS, NATURAL_KEY
+
+step2 = importlib.import_module('2nd_step_db_schema_connection_setup')
+
+COMPARED_COLUMNS = ['vehicle_number', 'stop_date', 'stop_time', 'country_name', 'violation', 'search_type',
+                    'stop_outcome', 'driver_race', 'stop_duration']
+
+
+def cleaned_frame(stops):
+    return pd.DataFrame(stops, columns=INSERT_COLUMNS)
+
+
+def with_repeats(stops):
+    # Re-sent stops repeat a natural key, the load keeps one row per key
+    return stops + [dict(stop, stop_outcome='Warning') for stop in stops[:25]]
+
+
+def view_rows(connection):
+    rows = read_query(connection, f"SELECT {', '.join(COMPARED_COLUMNS)} FROM {TABLE_NAME}")
+    return rows.astype(str).sort_values(COMPARED_COLUMNS).reset_index(drop=True)
+
+
+def test_prepare_load_counts_keys_before_encoding(connection):
+    df = cleaned_frame(with_repeats(sample_stops()))
+    cursor = connection.cursor()
+    frame, columns, expected_rows = step2.prepare_load(cursor, df, compact=True)
+    cursor.close()
+
+    assert expected_rows == len(df.drop_duplicates(subset=NATURAL_KEY)) == len(sample_stops())
+    assert columns == COMPACT_INSERT_COLUMNS
+    assert list(frame.columns) == COMPACT_INSERT_COLUMNS
+    # Every dimension value got a key, and the keys decode back to the values
+    for name in DIMENSION_KEY_TYPES:
+        keys = dict(read_query(connection, get_dimension_rows_query(TABLE_NAME, name)).itertuples(index=False))
+        decoded = frame[f"{name}_id"].map(keys)
+        assert decoded.tolist() == df[name].astype(object).where(df[name].notna(), None).tolist(), name
+
+
+def test_prepare_load_wide_keeps_the_frame(connection):
+    df = cleaned_frame(sample_stops(50))
+    frame, columns, expected_rows = step2.prepare_load(connection.cursor(), df)
+    assert frame is df and columns is None and expected_rows == 50
+
+
+def test_compact_ingest_matches_wide_ingest(connection):
+    df = cleaned_frame(with_repeats(sample_stops()))
+    step2.load_embedded(connection, df, compact=False)
+    wide = view_rows(connection)
+
+    step2.load_embedded(connection, df, compact=True)
+    compact = view_rows(connection)
+
+    assert len(compact) == len(sample_stops())
+    pd.testing.assert_frame_equal(compact, wide)
+    facts = read_query(connection, f"SELECT COUNT(*) AS n FROM {get_facts_table_name(TABLE_NAME)}")
+    assert int(facts['n'].iloc[0]) == len(sample_stops())
+
+
+def test_compact_reload_keeps_dimension_keys(connection):
+    step2.load_embedded(connection, cleaned_frame(sample_stops(200)), compact=True)
+    before = read_query(connection, get_dimension_rows_query(TABLE_NAME, 'violation'))
+
+    # A value differing only by trailing spaces maps to the existing key
+    stops = sample_stops(200, seed=9)
+    stops[0] = dict(stops[0], violation=stops[0]['violation'] + ' ', violation_raw=stops[0]['violation'] + ' ')
+    step2.load_embedded(connection, cleaned_frame(stops), compact=True)
+    after = read_query(connection, get_dimension_rows_query(TABLE_NAME, 'violation'))
+
+    assert set(map(tuple, before.to_numpy())) <= set(map(tuple, after.to_numpy()))
+    assert len(after) == len(before)
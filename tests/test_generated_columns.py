@@ -0,0 +1,56 @@
+"""Generated hour, year, month and datetime columns in the embedded engines, and the year partitions"""
+
+import pandas as pd
+
+from conftest import TABLE_NAME, insert_stops, sample_stops
+from db_backend import read_query
+from sql_queries import get_create_compact_table_query, get_create_embedded_table_queries, get_create_table_query
+from traffic_schema import INSERT_COLUMNS, partition_definitions_sql, stop_years
+
+
+def test_generated_columns_follow_date_and_time(connection):
+    stops = sample_stops(60)
+    # Midnight, the last second of a day and a year boundary
+    stops[0].update(stop_date='2019-12-31', stop_time='23:59:59')
+    stops[1].update(stop_date='2020-01-01', stop_time='00:00:00')
+    insert_stops(connection, stops)
+
+    rows = read_query(connection, f"SELECT stop_date, stop_time, stop_hour, stop_year, stop_month, stop_datetime "
+                                  f"FROM {TABLE_NAME} ORDER BY id")
+    expected = pd.to_datetime([f"{stop['stop_date']} {stop['stop_time']}" for stop in stops])
+    assert rows['stop_hour'].astype(int).tolist() == expected.hour.tolist()
+    assert rows['stop_year'].astype(int).tolist() == expected.year.tolist()
+    assert rows['stop_month'].astype(int).tolist() == expected.month.tolist()
+    assert pd.to_datetime(rows['stop_datetime']).tolist() == expected.tolist()
+
+
+def test_generated_columns_follow_updates(stops_connection):
+    cursor = stops_connection.cursor()
+    cursor.execute(f"UPDATE {TABLE_NAME} SET stop_date = '2031-07-04', stop_time = '18:15:00' WHERE id = 1")
+    stops_connection.commit()
+    cursor.close()
+    row = read_query(stops_connection, f"SELECT stop_hour, stop_year, stop_month FROM {TABLE_NAME} WHERE id = 1")
+    assert row.astype(int).iloc[0].tolist() == [18, 2031, 7]
+
+
+def test_partitions_cover_each_stop_year_and_later():
+    df = pd.DataFrame(sample_stops(24 * 400), columns=INSERT_COLUMNS)
+    years = stop_years(df)
+    assert years == [2020, 2021]
+    clause = partition_definitions_sql(years)
+    assert clause.startswith("PARTITION BY RANGE (YEAR(stop_date))")
+    assert "PARTITION p2020 VALUES LESS THAN (2021)" in clause
+    assert "PARTITION p2021 VALUES LESS THAN (2022)" in clause
+    assert clause.rstrip().endswith("PARTITION p_future VALUES LESS THAN MAXVALUE\n    )")
+    # Without data a table still has the catch-all partition
+    assert "p_future" in partition_definitions_sql()
+
+
+def test_partitioning_is_mysql_only():
+    for query in (get_create_table_query(TABLE_NAME, years=[2020]),
+                  get_create_compact_table_query(TABLE_NAME, years=[2020])):
+        assert "PARTITION p2020" in query
+        # The partition column is in every unique key
+        assert "PRIMARY KEY (id, stop_date)" in query
+    for dialect in ('duckdb', 'sqlite'):
+        assert not any('PARTITION' in query for query in get_create_embedded_table_queries(TABLE_NAME, dialect))
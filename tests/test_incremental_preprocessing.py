@@ -0,0 +1,71 @@
+"""Incremental preprocessing: rebuilding the output directory and cleaning appended rows"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import sample_stops
+from incremental_preprocessing import STATE_FILE_NAME, clean_incremental
+from traffic_schema import INSERT_COLUMNS
+
+
+def write_export(path, stops, append=False):
+    pd.DataFrame(stops, columns=INSERT_COLUMNS).to_csv(path, index=False, mode='a' if append else 'w',
+                                                       header=not append)
+
+
+def test_refuses_to_delete_a_directory_it_did_not_write(tmp_path):
+    export = tmp_path / 'stops.csv'
+    write_export(export, sample_stops(100))
+    # --output pointing at the directory of inputs
+    with pytest.raises(ValueError):
+        clean_incremental([str(export)], str(tmp_path))
+    assert export.exists()
+
+
+def test_rebuilds_its_own_output(tmp_path):
+    export = tmp_path / 'stops.csv'
+    output_dir = tmp_path / 'out'
+    write_export(export, sample_stops(100))
+    clean_incremental([str(export)], str(output_dir))
+
+    # Without the state file the output is rebuilt, the old partitions go
+    os.remove(output_dir / STATE_FILE_NAME)
+    (output_dir / 'year=1999').mkdir()
+    clean_incremental([str(export)], str(output_dir))
+    assert sorted(os.listdir(output_dir)) == [STATE_FILE_NAME, 'year=2020']
+
+
+def read_output(output_dir):
+    return pd.read_parquet(output_dir).sort_values(['stop_date', 'stop_time']).reset_index(drop=True)
+
+
+def test_a_rerun_cleans_only_appended_rows(tmp_path):
+    export = tmp_path / 'stops.csv'
+    output_dir = tmp_path / 'out'
+    stops = sample_stops(300)
+    write_export(export, stops[:200])
+    clean_incremental([str(export)], str(output_dir))
+
+    write_export(export, stops[200:], append=True)
+    state = clean_incremental([str(export)], str(output_dir))
+    assert state['files'][str(export)]['size'] == os.path.getsize(export)
+    assert len(read_output(output_dir)) == 300
+    assert clean_incremental([str(export)], str(output_dir))['files'] == state['files']
+    assert len(read_output(output_dir)) == 300
+
+
+def test_an_edited_file_rebuilds_the_output(tmp_path):
+    export = tmp_path / 'stops.csv'
+    output_dir = tmp_path / 'out'
+    stops = sample_stops(200)
+    write_export(export, stops)
+    clean_incremental([str(export)], str(output_dir))
+
+    # Same size, different bytes
+    stops[0] = dict(stops[0], vehicle_number='X000')
+    write_export(export, stops)
+    clean_incremental([str(export)], str(output_dir))
+    output = read_output(output_dir)
+    assert len(output) == 200 and 'X000' in set(output['vehicle_number'])
@@ -0,0 +1,70 @@
+"""INDEX_MIGRATIONS applied to a table built before them, and reapplied without effect"""
+
+import pytest
+
+from conftest import EMBEDDED_DIALECTS, TABLE_NAME
+from db_backend import EmbeddedConnection
+from index_migrations import apply_migrations, index_names, mark_migrations_applied, pending_migrations
+from sql_queries import get_create_embedded_indexes_queries, get_create_embedded_table_queries
+from traffic_schema import (COMPACT_TABLE_INDEXES, INDEX_MIGRATIONS, INITIAL_TABLE_INDEXES, NATURAL_KEY_INDEX,
+                            TABLE_INDEXES, compact_indexes)
+
+
+@pytest.fixture(params=EMBEDDED_DIALECTS)
+def empty_connection(request, tmp_path):
+    connection = EmbeddedConnection(request.param, str(tmp_path / f"migrations.{request.param}"))
+    yield connection
+    connection.close()
+
+
+def create_table(connection, indexes, compact=False):
+    """traffic_stops (or a compact fact table) with the given secondary indexes"""
+    cursor = connection.cursor()
+    for query in get_create_embedded_table_queries(TABLE_NAME, connection.dialect, include_indexes=False,
+                                                   compact=compact):
+        cursor.execute(query)
+    for query in get_create_embedded_indexes_queries(TABLE_NAME, indexes, compact=compact):
+        cursor.execute(query)
+    connection.commit()
+    cursor.close()
+
+
+def expected_names(indexes):
+    return {name for name, _ in indexes} | {NATURAL_KEY_INDEX[0]}
+
+
+def test_migrations_bring_an_old_table_to_table_indexes(empty_connection):
+    create_table(empty_connection, INITIAL_TABLE_INDEXES)
+    applied = apply_migrations(empty_connection, TABLE_NAME)
+
+    assert [version for version, *_ in applied] == [version for version, *_ in INDEX_MIGRATIONS]
+    assert index_names(empty_connection, TABLE_NAME) == expected_names(TABLE_INDEXES)
+    assert pending_migrations(empty_connection) == []
+
+
+def test_reapplying_changes_nothing(empty_connection):
+    create_table(empty_connection, INITIAL_TABLE_INDEXES)
+    apply_migrations(empty_connection, TABLE_NAME)
+    assert apply_migrations(empty_connection, TABLE_NAME) == []
+    assert index_names(empty_connection, TABLE_NAME) == expected_names(TABLE_INDEXES)
+
+
+def test_a_half_applied_migration_finishes(empty_connection):
+    # A crash after building the first new index, before the version was recorded
+    _, _, added, _ = INDEX_MIGRATIONS[0]
+    create_table(empty_connection, INITIAL_TABLE_INDEXES + added[:1])
+    apply_migrations(empty_connection, TABLE_NAME)
+    assert index_names(empty_connection, TABLE_NAME) == expected_names(TABLE_INDEXES)
+
+
+def test_compact_fact_table_gets_the_key_columns(empty_connection):
+    create_table(empty_connection, compact_indexes(INITIAL_TABLE_INDEXES), compact=True)
+    apply_migrations(empty_connection, TABLE_NAME, compact=True)
+    assert index_names(empty_connection, TABLE_NAME) == expected_names(COMPACT_TABLE_INDEXES)
+
+
+def test_a_new_table_is_marked_up_to_date(empty_connection):
+    create_table(empty_connection, TABLE_INDEXES)
+    mark_migrations_applied(empty_connection)
+    assert pending_migrations(empty_connection) == []
+    assert apply_migrations(empty_connection, TABLE_NAME) == []
@@ -0,0 +1,77 @@
+"""Keyset pagination over sort keys whose leading columns repeat"""
+
+import pandas as pd
+
+from conftest import TABLE_NAME, VIOLATIONS, insert_stops, sample_stops
+from db_backend import read_query
+from pagination import iter_pages, keyset_params, page_count, page_cursor
+from sql_queries import VEHICLE_HISTORY_SORT_KEY, get_paged_query, get_vehicle_history_page_query
+
+PAGE_SIZE = 4
+
+
+def read_pages(connection, build_query, sort_key, params=()):
+    """Every page in turn, each starting after the last row of the previous one"""
+    pages = []
+    cursor = None
+    while True:
+        query = build_query(after=cursor is not None)
+        page_params = params + (keyset_params(cursor) if cursor is not None else ())
+        page = read_query(connection, query, page_params or None)
+        if page.empty:
+            return pages
+        pages.append(page)
+        cursor = page_cursor(page, sort_key)
+
+
+def test_vehicle_history_pages_cover_ties_once(connection):
+    # 18 stops of one vehicle on 3 dates and 2 times, so dates and (date, time) pairs repeat
+    stops = []
+    for day in ['2021-03-01', '2021-03-02', '2021-03-03']:
+        for time in ['08:00:00', '17:30:00']:
+            for violation in VIOLATIONS:
+                stop = dict(sample_stops(1)[0], stop_date=day, stop_time=time, violation=violation,
+                            vehicle_number='TIE1')
+                stops.append(stop)
+    insert_stops(connection, stops + sample_stops(50))
+
+    pages = read_pages(connection, lambda after: get_vehicle_history_page_query(TABLE_NAME, after, PAGE_SIZE),
+                       VEHICLE_HISTORY_SORT_KEY, ('TIE1',))
+    everything = read_query(connection, get_vehicle_history_page_query(TABLE_NAME, page_size=1000), ('TIE1',))
+
+    assert len(pages) == page_count(len(stops), PAGE_SIZE)
+    assert all(len(page) == PAGE_SIZE for page in pages[:-1])
+    assert pd.concat(pages)['id'].tolist() == everything['id'].tolist()
+    assert len(everything) == len(stops)
+
+
+def test_paged_query_mixed_directions(stops_connection):
+    # Countries repeat on most rows and ages within a country; id makes the key unique
+    sort_key = [('country_name', False), ('driver_age', True), ('id', False)]
+    query = f"SELECT id, country_name, driver_age FROM {TABLE_NAME} WHERE driver_age IS NOT NULL"
+
+    pages = read_pages(stops_connection, lambda after: get_paged_query(query, sort_key, after, PAGE_SIZE * 10),
+                       sort_key)
+    expected = read_query(stops_connection, query).sort_values(
+        ['country_name', 'driver_age', 'id'], ascending=[True, False, True])
+
+    assert pd.concat(pages)['id'].tolist() == expected['id'].tolist()
+
+
+def test_iter_pages_reads_every_row_once(connection):
+    insert_stops(connection, sample_stops(300))
+    pages = list(iter_pages(lambda query, params: read_query(connection, query, params),
+                            lambda after: get_vehicle_history_page_query(TABLE_NAME, after, PAGE_SIZE),
+                            VEHICLE_HISTORY_SORT_KEY, ('V007',)))
+    everything = read_query(connection, get_vehicle_history_page_query(TABLE_NAME, page_size=1000), ('V007',))
+
+    assert len(pages) == page_count(len(everything), PAGE_SIZE)
+    assert pd.concat(pages)['id'].tolist() == everything['id'].tolist()
+
+
+def test_keyset_params_repeat_the_cursor_prefixes():
+    assert keyset_params(('2021-03-01', '08:00:00', 7)) == (
+        '2021-03-01',
+        '2021-03-01', '08:00:00',
+        '2021-03-01', '08:00:00', 7,
+    )
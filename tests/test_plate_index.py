@@ -0,0 +1,48 @@
+"""The vectorized trigram postings against trigrams(), and the fuzzy search built on them"""
+
+import random
+
+from plate_index import PlateIndex, bounded_edit_distance, normalize_plate, trigram_postings, trigrams
+
+
+def postings_from_trigrams(keys):
+    postings = {}
+    for plate_id, key in enumerate(keys):
+        for gram in sorted(trigrams(key)):
+            postings.setdefault(gram, []).append(plate_id)
+    return postings
+
+
+def as_lists(postings):
+    return {gram: list(plate_ids) for gram, plate_ids in postings.items()}
+
+
+def test_trigram_postings_match_trigrams():
+    # Different lengths, repeated trigrams and single characters
+    keys = ['UP76DY3473', 'A', 'AB', 'AAAA', 'ABABAB', 'KA01', 'UP76DY3474', 'Z9']
+    assert as_lists(trigram_postings(keys)) == postings_from_trigrams(keys)
+
+
+def test_trigram_postings_match_trigrams_random_plates():
+    rng = random.Random(3)
+    alphabet = 'ABC0123'
+    keys = [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))) for _ in range(500)]
+    assert as_lists(trigram_postings(keys)) == postings_from_trigrams(keys)
+
+
+def test_trigram_postings_empty():
+    assert trigram_postings([]) == {}
+
+
+def test_fuzzy_finds_every_plate_within_the_distance():
+    rng = random.Random(5)
+    plates = [f"{rng.choice(['UP', 'KA', 'DL'])}{rng.randint(10, 99)}{rng.choice('ABXY')}{rng.randint(1000, 9999)}"
+              for _ in range(300)]
+    index = PlateIndex(plates)
+    index.add('MH12AB0001')
+    plates.append('MH12AB0001')
+    for text in ['UP1', 'KA55X123', 'MH12AB0010', plates[7][:-1], plates[42].replace(plates[42][3], '7', 1)]:
+        expected = {plate for plate in plates
+                    if bounded_edit_distance(normalize_plate(text), normalize_plate(plate), 2) is not None}
+        found = {plate for plate, _ in index.fuzzy(text, limit=len(plates))}
+        assert found == expected, text
@@ -0,0 +1,91 @@
+"""The prediction cube against the SQL it replaces, and MySQL's AVG rounding"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+
+from conftest import GENDERS, RACES, TABLE_NAME, VIOLATIONS, insert_stops, sample_stops
+from db_backend import read_query
+from prediction_cube import AVG_DECIMALS, PredictionCube, avg_percentage
+from sql_queries import (get_most_common_outcome_query, get_outcome_counts_query, get_prediction_cube_query,
+                         get_prediction_stats_query)
+
+
+def build_cube(connection):
+    return PredictionCube(read_query(connection, get_prediction_cube_query(TABLE_NAME)),
+                          read_query(connection, get_outcome_counts_query(TABLE_NAME)), connection.dialect)
+
+
+def sql_prediction(connection, violation, age, race, gender):
+    row = read_query(connection, get_prediction_stats_query(TABLE_NAME, violation, age, race, gender)).iloc[0]
+    return {
+        'similar_cases': int(row['similar_cases']),
+        'arrest_probability': None if row['similar_cases'] == 0 else float(row['arrest_probability']),
+        'search_probability': None if row['similar_cases'] == 0 else float(row['search_probability']),
+        'drug_probability': None if row['similar_cases'] == 0 else float(row['drug_probability']),
+    }
+
+
+def assert_cube_matches_sql(connection, cube):
+    # Ages past both ends of the data cover windows clipped to the ages seen
+    for violation in VIOLATIONS + ['Unknown violation']:
+        for race in RACES:
+            for gender in GENDERS:
+                for age in range(10, 50, 3):
+                    assert cube.predict(violation, age, race, gender) == \
+                        sql_prediction(connection, violation, age, race, gender), (violation, age, race, gender)
+
+
+def test_predict_matches_prediction_stats_query(stops_connection):
+    assert_cube_matches_sql(stops_connection, build_cube(stops_connection))
+
+
+def test_added_stops_match_the_table(stops_connection):
+    cube = build_cube(stops_connection)
+    # Ages outside the ones the cube was built with widen its age axis
+    added = sample_stops(count=40, seed=11)[1:]
+    for i, stop in enumerate(added):
+        stop['stop_date'] = '2030-01-01'
+        stop['driver_age'] = stop['driver_age_raw'] = [15, 45, 30, 16][i % 4]
+    insert_stops(stops_connection, added)
+    for stop in added:
+        cube.add(stop['violation'], stop['driver_age'], stop['driver_race'], stop['driver_gender'],
+                 stop['is_arrested'], stop['search_conducted'], stop['drugs_related_stop'], stop['stop_outcome'])
+    assert_cube_matches_sql(stops_connection, cube)
+
+
+def test_most_common_outcome_matches_query(stops_connection):
+    cube = build_cube(stops_connection)
+    for violation in VIOLATIONS:
+        # Ties may come back in any order, the count decides
+        expected = read_query(stops_connection, get_most_common_outcome_query(TABLE_NAME, violation)).iloc[0]
+        assert cube.most_common_outcome(violation)[1] == expected['count']
+    assert cube.most_common_outcome('Unknown violation') is None
+
+
+def mysql_avg_percentage(part, whole, digits=1):
+    # AVG is a DECIMAL rounded half away from zero to div_precision_increment decimals, then ROUND rounds again
+    average = (Decimal(part) / Decimal(whole)).quantize(Decimal(1).scaleb(-AVG_DECIMALS), ROUND_HALF_UP)
+    return float((average * 100).quantize(Decimal(1).scaleb(-digits), ROUND_HALF_UP))
+
+
+@pytest.mark.parametrize('part, whole, expected', [
+    # 6.25 rounds up, not to even
+    (1, 16, 6.3),
+    (1, 80, 1.3),
+    (3, 8, 37.5),
+    # AVG is 0.1235 first, so 12.35 rounds to 12.4 where the exact 12.345 would give 12.3
+    (2469, 20000, 12.4),
+    (1, 3, 33.3),
+    (2, 3, 66.7),
+    (0, 5, 0.0),
+    (5, 5, 100.0),
+])
+def test_avg_percentage_mysql_half_way(part, whole, expected):
+    assert avg_percentage(part, whole, 'mysql') == expected
+
+
+def test_avg_percentage_mysql_matches_decimal_rounding():
+    for whole in range(1, 250):
+        for part in range(whole + 1):
+            assert avg_percentage(part, whole, 'mysql') == mysql_avg_percentage(part, whole), (part, whole)
@@ -0,0 +1,63 @@
+"""The single traffic_stops schema: column coercion, and the DDL and inserts built from it"""
+
+import numpy as np
+import pandas as pd
+
+from conftest import TABLE_NAME, sample_stops
+from db_backend import read_query
+from sql_queries import get_create_table_query, get_insert_query
+from traffic_schema import (GENERATED_COLUMNS, INSERT_COLUMNS, SCHEMA, TRAFFIC_STOPS_COLUMNS, coerce_column,
+                            db_batch_rows, prepare_db_columns)
+
+
+def test_coerce_int_truncates_and_fills_the_median():
+    values = pd.Series([21.9, None, 'n/a', 40.0])
+    assert coerce_column(values, SCHEMA['driver_age'], 30).tolist() == [21, 30, 30, 40]
+    # Without a fill value the missing ages stay NULL
+    assert coerce_column(values, SCHEMA['driver_age']).tolist() == [21, pd.NA, pd.NA, 40]
+
+
+def test_coerce_bool_reads_text_flags():
+    values = pd.Series(['True', 'yes', ' 1 ', 'false', None, '0.0'])
+    assert coerce_column(values, SCHEMA['is_arrested']).tolist() == [True, True, True, False, False, False]
+
+
+def test_coerce_time_and_date():
+    times = coerce_column(pd.Series(['8:05', '17:30:15', 'noon', None]), SCHEMA['stop_time'])
+    assert times.tolist()[:2] == ['08:05:00', '17:30:15'] and times.iloc[2:].isna().all()
+    dates = coerce_column(pd.Series(['2020-01-31', 'not a date', '2020-01-31']), SCHEMA['stop_date'])
+    assert dates.tolist()[0] == pd.Timestamp('2020-01-31') and pd.isna(dates.iloc[1])
+
+
+def test_coerce_category_fills_unknown():
+    values = coerce_column(pd.Series(['India', None, 'USA'], dtype='category'), SCHEMA['country_name'])
+    assert values.tolist() == ['India', 'Unknown', 'USA']
+
+
+def test_mysql_ddl_declares_every_column_in_insert_order():
+    ddl = get_create_table_query(TABLE_NAME)
+    positions = [ddl.index(f"{column.name} {column.sql_type}") for column in TRAFFIC_STOPS_COLUMNS]
+    assert positions == sorted(positions)
+    assert [column.name for column in TRAFFIC_STOPS_COLUMNS] == INSERT_COLUMNS
+
+
+def test_embedded_table_takes_the_schema_columns_and_inserts(connection):
+    table = read_query(connection, f"SELECT * FROM {TABLE_NAME} LIMIT 0")
+    assert list(table.columns) == (['id'] + INSERT_COLUMNS + [column.name for column in GENERATED_COLUMNS]
+                                   + ['created_at'])
+
+    # Raw text as it comes from a CSV, coerced column by column for the insert
+    raw = pd.DataFrame(sample_stops(30), columns=INSERT_COLUMNS).astype(str)
+    cursor = connection.cursor()
+    cursor.executemany(get_insert_query(TABLE_NAME), db_batch_rows(prepare_db_columns(raw), 0, len(raw)))
+    connection.commit()
+    cursor.close()
+
+    stored = read_query(connection, f"SELECT {', '.join(INSERT_COLUMNS)} FROM {TABLE_NAME} ORDER BY id")
+    expected = pd.DataFrame(sample_stops(30), columns=INSERT_COLUMNS)
+    assert stored['vehicle_number'].tolist() == expected['vehicle_number'].tolist()
+    assert stored['stop_date'].astype(str).tolist() == expected['stop_date'].tolist()
+    assert stored['stop_time'].astype(str).tolist() == expected['stop_time'].tolist()
+    assert stored['is_arrested'].astype(bool).tolist() == expected['is_arrested'].tolist()
+    ages = expected['driver_age'].astype('float64')
+    assert np.array_equal(stored['driver_age'].astype('float64').to_numpy(), ages.to_numpy(), equal_nan=True)
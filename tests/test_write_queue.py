@@ -0,0 +1,153 @@
+"""Write-behind queue: journal recovery after a crash, rejections and failing records"""
+
+import json
+
+from write_queue import WriteBehindQueue, read_journal
+
+
+class RecordingWriter:
+    """Writer keeping the records it wrote
+
+    failing: records every write containing them fails on; transient: {record: writes that fail first};
+    refused: records the database rejects
+    """
+
+    def __init__(self, failing=(), refused=(), transient=None):
+        self.failing = set(failing)
+        self.refused = set(refused)
+        self.transient = dict(transient or {})
+        self.written = []
+
+    def __call__(self, records):
+        if any(record['n'] in self.failing for record in records):
+            raise RuntimeError("connection lost")
+        for record in records:
+            if self.transient.get(record['n'], 0) > 0:
+                self.transient[record['n']] -= 1
+                raise RuntimeError("Lock wait timeout exceeded")
+        rejected = {i: 'Duplicate entry' for i, record in enumerate(records) if record['n'] in self.refused}
+        self.written.extend(record for i, record in enumerate(records) if i not in rejected)
+        return rejected
+
+
+def make_queue(path, writer, **options):
+    return WriteBehindQueue(writer, path=str(path), group_wait=0.01, retry_base=0.01, retry_max=0.05, **options)
+
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(lines))
+
+
+def test_recovery_skips_flushed_entries_and_a_torn_last_line(tmp_path):
+    path = tmp_path / 'pending_logs.jsonl'
+    write_lines(path, [
+        json.dumps({'seq': 1, 'queued_at': 0.0, 'record': {'n': 1}}) + '\n',
+        json.dumps({'seq': 2, 'queued_at': 0.0, 'record': {'n': 2}}) + '\n',
+        json.dumps({'flushed': 1}) + '\n',
+        json.dumps({'seq': 3, 'queued_at': 0.0, 'record': {'n': 3}}) + '\n',
+        # Crash in the middle of journaling the fourth record, which was never acknowledged
+        '{"seq": 4, "queued_at": 0.0, "rec',
+    ])
+    assert [entry['seq'] for entry in read_journal(path)] == [2, 3]
+
+    writer = RecordingWriter()
+    queue = make_queue(path, writer)
+    assert queue.stats()['recovered'] == 2
+    # The torn line is gone, so this entry starts on a line of its own
+    assert queue.put({'n': 5}) == 4
+    assert queue.drain(timeout=5)
+    queue.close(timeout=5)
+
+    assert writer.written == [{'n': 2}, {'n': 3}, {'n': 5}]
+    assert read_journal(path) == []
+
+
+def test_unwritten_records_survive_a_restart(tmp_path):
+    path = tmp_path / 'pending_logs.jsonl'
+    queue = make_queue(path, RecordingWriter(failing={1, 2}))
+    queue.put({'n': 1})
+    queue.put({'n': 2})
+    queue.close(timeout=5)
+    # Torn by a crash while the next record was being appended
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 3, "que')
+
+    writer = RecordingWriter()
+    queue = make_queue(path, writer)
+    assert queue.drain(timeout=5)
+    queue.close(timeout=5)
+    assert writer.written == [{'n': 1}, {'n': 2}]
+
+
+def test_refused_records_are_rejected_not_retried(tmp_path):
+    writer = RecordingWriter(refused={2})
+    queue = make_queue(tmp_path / 'pending_logs.jsonl', writer)
+    for n in range(1, 4):
+        queue.put({'n': n})
+    assert queue.drain(timeout=5)
+    stats = queue.stats()
+    queue.close(timeout=5)
+
+    assert writer.written == [{'n': 1}, {'n': 3}]
+    assert stats['rejected'] == 1 and stats['failures'] == 0
+
+
+def test_a_transient_failure_is_written_on_retry(tmp_path):
+    # Fails as part of its groups and once more on its own, then goes through
+    writer = RecordingWriter(transient={2: 3})
+    queue = make_queue(tmp_path / 'pending_logs.jsonl', writer, split_after=2)
+    for n in range(1, 5):
+        queue.put({'n': n})
+    assert queue.drain(timeout=5)
+    stats = queue.stats()
+    queue.close(timeout=5)
+
+    assert sorted(record['n'] for record in writer.written) == [1, 2, 3, 4]
+    assert stats['rejected'] == 0 and stats['failures'] >= 2
+
+
+def test_records_ahead_of_a_failing_one_are_written(tmp_path):
+    path = tmp_path / 'pending_logs.jsonl'
+    writer = RecordingWriter(failing={3})
+    queue = make_queue(path, writer, split_after=1)
+    for n in range(1, 5):
+        queue.put({'n': n})
+    assert not queue.drain(timeout=0.5)
+    stats = queue.stats()
+    queue.close(timeout=5)
+
+    # Nothing is rejected for failing to write: the failing record and the ones after it stay journaled
+    assert writer.written == [{'n': 1}, {'n': 2}]
+    assert stats['rejected'] == 0 and stats['retrying']
+    assert [entry['record'] for entry in read_journal(path)] == [{'n': 3}, {'n': 4}]
+
+
+def test_a_refused_record_is_rejected_when_written_singly(tmp_path):
+    # The group keeps failing, on its own the record is refused like a duplicate
+    writer = RecordingWriter(refused={2}, transient={1: 1, 2: 1})
+    queue = make_queue(tmp_path / 'pending_logs.jsonl', writer, split_after=1)
+    queue.put({'n': 1})
+    queue.put({'n': 2})
+    queue.put({'n': 3})
+    assert queue.drain(timeout=5)
+    stats = queue.stats()
+    queue.close(timeout=5)
+
+    assert sorted(record['n'] for record in writer.written) == [1, 3]
+    assert stats['rejected'] == 1
+
+
+def test_an_unavailable_database_rejects_nothing(tmp_path):
+    path = tmp_path / 'pending_logs.jsonl'
+    writer = RecordingWriter(failing={1, 2})
+    queue = make_queue(path, writer, split_after=1)
+    queue.put({'n': 1})
+    queue.put({'n': 2})
+    assert not queue.drain(timeout=0.5)
+    stats = queue.stats()
+    queue.close(timeout=5)
+
+    assert writer.written == []
+    assert stats['rejected'] == 0 and stats['retrying']
+    assert [entry['record'] for entry in read_journal(path)] == [{'n': 1}, {'n': 2}]